@@ -25,7 +25,7 @@ from wger.core.models import Language, UserProfile
 from wger.gym.helpers import is_any_gym_admin
 from wger.gym.models import Gym, GymUserConfig
 
-from wger.utils.cache import delete_template_fragment_cache
+from wger.utils.cache import reset_template_namespace
 from wger.utils.cache import cache_mapper
 
 
@@ -80,8 +80,7 @@ class LanguageConfig(models.Model):
         cache.delete(cache_mapper.get_language_config_key(self.language, self.item))
 
         # Cached template fragments
-        delete_template_fragment_cache('muscle-overview', self.language_id)
-        delete_template_fragment_cache('exercise-overview', self.language_id)
+        reset_template_namespace('muscle-overview', 'exercise-overview')
 
     def delete(self, *args, **kwargs):
         '''
@@ -92,8 +91,7 @@ class LanguageConfig(models.Model):
         cache.delete(cache_mapper.get_language_config_key(self.language, self.item))
 
         # Cached template fragments
-        delete_template_fragment_cache('muscle-overview', self.language_id)
-        delete_template_fragment_cache('exercise-overview', self.language_id)
+        reset_template_namespace('muscle-overview', 'exercise-overview')
 
         super(LanguageConfig, self).delete(*args, **kwargs)
 
@@ -21,11 +21,15 @@ import uuid
 
 from django.contrib.auth.models import User
 from django.contrib.auth import authenticate
+from django.db import transaction
+from django.db.models import F
+from django.utils import translation
+from django.utils.timezone import localtime, now
 from django.utils.translation import ugettext as _
 
 from wger.weight.models import WeightEntry
 from wger.exercises.models import Exercise
-from wger.core.models import DaysOfWeek
+from wger.core.models import DaysOfWeek, UserCache, UserProfile
 from wger.manager.models import (
     Workout,
     Day,
@@ -33,20 +37,29 @@ from wger.manager.models import (
     Setting,
     WorkoutLog,
     Schedule,
-    ScheduleStep
+    ScheduleStep,
+    copy_workout_days
 )
 from wger.nutrition.models import (
     NutritionPlan,
     Meal,
     MealItem,
     Ingredient,
-    IngredientWeightUnit
+    IngredientWeightUnit,
+    copy_plan_meals
 )
 
+from wger.utils.helpers import bulk_copy
 from wger.utils.language import load_language
 
 logger = logging.getLogger(__name__)
 
+CLAIM_CANDIDATES = 5
+'''
+Number of pooled users a process tries to claim before giving up, they are
+tried in random order to avoid conflicts with other processes
+'''
+
 
 def create_temporary_user():
     '''
@@ -67,6 +80,145 @@ def create_temporary_user():
     return user
 
 
+def claim_temporary_user():
+    '''
+    Takes a temporary user with demo data for the current language from the pool
+
+    Other processes might claim the same users at the same time, so a user is
+    taken out of the pool with a conditional update, if another process was
+    quicker the next one is tried.
+
+    :return: the user, ready to be logged in, or None if the pool is empty
+    '''
+    language = load_language()
+    profile_ids = list(UserProfile.objects.filter(is_pooled=True,
+                                                  user__nutritionplan__language=language)
+                                          .values_list('pk', flat=True)[:CLAIM_CANDIDATES])
+    random.shuffle(profile_ids)
+
+    for pk in profile_ids:
+        if UserProfile.objects.filter(pk=pk, is_pooled=True).update(is_pooled=False):
+            user = User.objects.get(userprofile=pk)
+
+            # The demo entries are relative to the day the user was added
+            # to the pool, move them to today
+            days = (datetime.date.today() - localtime(user.date_joined).date()).days
+            if days:
+                move_demo_entries(user, datetime.timedelta(days=days))
+
+            # Temporary users are deleted some time after they joined
+            user.date_joined = now()
+            User.objects.filter(pk=user.pk).update(date_joined=user.date_joined)
+
+            user.backend = 'django.contrib.auth.backends.ModelBackend'
+            return user
+
+    logger.info('No temporary user left in the pool for language %s', language.short_name)
+    return None
+
+
+@transaction.atomic
+def move_demo_entries(user, delta):
+    '''
+    Moves the dates of the demo entries of a user by the given time
+
+    :param user: the user
+    :param delta: a timedelta
+    '''
+    Workout.objects.filter(user=user).update(creation_date=F('creation_date') + delta)
+    WorkoutLog.objects.filter(user=user).update(date=F('date') + delta)
+    Schedule.objects.filter(user=user).update(start_date=F('start_date') + delta)
+    NutritionPlan.objects.filter(user=user).update(creation_date=F('creation_date') + delta)
+    UserCache.objects.filter(user=user).update(last_activity=F('last_activity') + delta)
+
+    # The dates of the weight entries are unique, moving them with a single
+    # update could collide with the next entry before it is moved itself
+    entries = list(WeightEntry.objects.filter(user=user))
+    for entry in entries:
+        entry.pk = None
+        entry.date += delta
+    WeightEntry.objects.filter(user=user).delete()
+    WeightEntry.objects.bulk_create(entries)
+
+
+@transaction.atomic
+def create_pooled_users(count, language_code):
+    '''
+    Adds temporary users with demo data to the pool
+
+    The demo entries are only created for the first user, they are then
+    copied to the others with a few bulk inserts per model.
+
+    :param count: the number of users to add
+    :param language_code: the language of the demo entries
+    :return: the new users
+    '''
+    with translation.override(language_code):
+        template = create_temporary_user()
+        create_demo_entries(template)
+
+    users = [User(username=uuid.uuid4().hex[:-2], email='') for i in range(count - 1)]
+    for user in users:
+        user.set_unusable_password()
+    User.objects.bulk_create(users)
+    users = list(User.objects.filter(username__in=[user.username for user in users]))
+
+    template_profile = template.userprofile
+    template_cache = template.usercache
+    UserProfile.objects.bulk_create([UserProfile(user=user,
+                                                 is_temporary=True,
+                                                 age=template_profile.age,
+                                                 height=template_profile.height)
+                                     for user in users])
+    UserCache.objects.bulk_create([UserCache(user=user,
+                                             last_activity=template_cache.last_activity)
+                                   for user in users])
+
+    user_pks = {template.pk: [user.pk for user in users]}
+    if users:
+        workout_pks = bulk_copy(Workout.objects.filter(user=template), 'user', user_pks)
+        copy_workout_days(workout_pks)
+        bulk_copy(WorkoutLog.objects.filter(user=template),
+                  'user',
+                  user_pks,
+                  related_pks={'workout': workout_pks})
+        schedule_pks = bulk_copy(Schedule.objects.filter(user=template), 'user', user_pks)
+        bulk_copy(ScheduleStep.objects.filter(schedule__user=template),
+                  'schedule',
+                  schedule_pks,
+                  related_pks={'workout': workout_pks})
+        bulk_copy(WeightEntry.objects.filter(user=template), 'user', user_pks)
+        copy_plan_meals(bulk_copy(NutritionPlan.objects.filter(user=template),
+                                  'user',
+                                  user_pks))
+
+    users.insert(0, template)
+    UserProfile.objects.filter(user__in=users).update(is_pooled=True)
+    return users
+
+
+def fill_temporary_user_pool(size, language_code, batch_size=50):
+    '''
+    Adds temporary users to the pool until it has the given size
+
+    Every batch is created in its own transaction, so that the first users
+    can already be claimed while the rest is still being created.
+
+    :param size: the number of users the pool should have for the language
+    :param language_code: the language of the demo entries
+    :param batch_size: the number of users created at once
+    :return: the number of users that were added
+    '''
+    language = load_language(language_code)
+    missing = size - UserProfile.objects.filter(is_pooled=True,
+                                                user__nutritionplan__language=language).count()
+    added = 0
+    while added < missing:
+        added += len(create_pooled_users(min(batch_size, missing - added),
+                                         language.short_name))
+    return added
+
+
 def create_demo_entries(user):
     '''
     Creates some demo data for temporary users
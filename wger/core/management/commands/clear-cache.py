@@ -20,13 +20,13 @@ from django.contrib.auth.models import User
 from django.core.management.base import BaseCommand, CommandError
 from django.core.cache import cache
 
-from wger.core.models import Language
-from wger.manager.models import Workout, WorkoutLog
+from wger.manager.models import Day, Workout, WorkoutLog
 from wger.exercises.models import Exercise
 from wger.utils.cache import (
+    reset_day_canonical_form,
     reset_workout_canonical_form,
     reset_workout_log,
-    delete_template_fragment_cache
+    reset_template_namespace
 )
 
 
@@ -77,34 +77,22 @@ class Command(BaseCommand):
                 if int(options['verbosity']) >= 2:
                     self.stdout.write("* Processing user {0}".format(user.username))
 
-                for entry in WorkoutLog.objects.filter(user=user).dates('date', 'year'):
-
+                for entry in WorkoutLog.objects.filter(user=user).dates('date', 'month'):
                     if int(options['verbosity']) >= 3:
-                        self.stdout.write("  Year {0}".format(entry.year))
-                    for month in WorkoutLog.objects.filter(user=user,
-                                                           date__year=entry.year).dates('date',
-                                                                                        'month'):
-                        if int(options['verbosity']) >= 3:
-                            self.stdout.write("    Month {0}".format(entry.month))
-                        reset_workout_log(user.id, entry.year, entry.month)
-                        for day in WorkoutLog.objects.filter(user=user,
-                                                             date__year=entry.year,
-                                                             date__month=month.month).dates('date',
-                                                                                            'day'):
-                            if int(options['verbosity']) >= 3:
-                                self.stdout.write("      Day {0}".format(day.day))
-                            reset_workout_log(user.id, entry.year, entry.month, day)
-
-            for language in Language.objects.all():
-                delete_template_fragment_cache('muscle-overview', language.id)
-                delete_template_fragment_cache('exercise-overview', language.id)
-                delete_template_fragment_cache('exercise-overview-mobile', language.id)
-                delete_template_fragment_cache('equipment-overview', language.id)
+                        self.stdout.write("  Month {0}-{1}".format(entry.year, entry.month))
+                    reset_workout_log(user.id, entry.year, entry.month)
+
+            reset_template_namespace('muscle-overview',
+                                     'exercise-overview',
+                                     'exercise-overview-mobile',
+                                     'equipment-overview')
 
         # Workout canonical form
         if options['clear_workout']:
             for w in Workout.objects.all():
                 reset_workout_canonical_form(w.pk)
+            for d in Day.objects.all():
+                reset_day_canonical_form(d.pk)
 
         # Nuclear option, clear all
         if options['clear_all']:
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 *-*
+
+# This file is part of wger Workout Manager.
+#
+# wger Workout Manager is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# wger Workout Manager is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+
+from optparse import make_option
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from wger.core.demo import fill_temporary_user_pool
+
+
+class Command(BaseCommand):
+    '''
+    Helper admin command to fill the pool of temporary users, to be called
+    e.g. by cron
+    '''
+
+    option_list = BaseCommand.option_list + (
+        make_option('--size',
+                    action='store',
+                    type='int',
+                    dest='size',
+                    default=None,
+                    help='Number of temporary users in the pool for each language, by '
+                         'default the GUEST_USER_POOL_SIZE setting'),
+        make_option('--languages',
+                    action='store',
+                    dest='languages',
+                    default=settings.LANGUAGE_CODE,
+                    help='Comma separated list of the languages of the demo entries, '
+                         'e.g. "en,de"'),
+    )
+
+    help = 'Creates temporary users with demo data in bulk, so that new guests ' \
+           'can get one right away'
+
+    def handle(self, **options):
+
+        size = options['size']
+        if size is None:
+            size = settings.WGER_SETTINGS['GUEST_USER_POOL_SIZE']
+
+        counter = 0
+        for language_code in options['languages'].split(','):
+            counter += fill_temporary_user_pool(size, language_code.strip())
+
+        self.stdout.write("Added {0} temporary users to the pool".format(counter))
@@ -14,10 +14,11 @@
 #
 # You should have received a copy of the GNU Affero General Public License
 
-from django.contrib.auth.models import User
+from optparse import make_option
+
 from django.core.management.base import BaseCommand
 
-from wger.gym.helpers import get_user_last_activity
+from wger.gym.helpers import update_all_users_last_activity
 
 
 class Command(BaseCommand):
@@ -25,6 +26,21 @@ class Command(BaseCommand):
     Updates the user cache table
     '''
 
+    option_list = BaseCommand.option_list + (
+        make_option('--chunk-size',
+                    action='store',
+                    type='int',
+                    dest='chunk_size',
+                    default=1000,
+                    help='Number of users processed at a time (default: 1000)'),
+        make_option('--processes',
+                    action='store',
+                    type='int',
+                    dest='processes',
+                    default=1,
+                    help='Number of worker processes (default: 1)'),
+    )
+
     help = 'Update the user cache-table. This is only needed when the python' \
            'code used to calculate any of the cached entries is changed and ' \
            'the ones in the database need to be updated to reflect the new logic.'
@@ -34,7 +50,7 @@ class Command(BaseCommand):
         Process the options
         '''
 
-        print('** Updating last activity')
-        for user in User.objects.all():
-            user.usercache.last_activity = get_user_last_activity(user)
-            user.usercache.save()
+        self.stdout.write('** Updating last activity')
+        updated = update_all_users_last_activity(max(options['chunk_size'], 1),
+                                                 max(options['processes'], 1))
+        self.stdout.write('** Updated {0} entries'.format(updated))
@@ -123,6 +123,14 @@ class UserProfile(models.Model):
     Flag to mark a temporary user (demo account)
     '''
 
+    is_pooled = models.BooleanField(default=False,
+                                    editable=False,
+                                    db_index=True)
+    '''
+    Flag to mark a temporary user that is waiting in the pool to be used,
+    see wger.core.demo
+    '''
+
     #
     # User preferences
     #
@@ -19,6 +19,7 @@ from django.contrib.auth.models import User
 from django.db.models.signals import post_save
 
 from wger.core.models import UserProfile, UserCache
+from wger.utils.cache import reset_user_profile_version
 from wger.utils.helpers import disable_for_loaddata
 
 
@@ -40,5 +41,14 @@ def create_user_cache(sender, instance, created, **kwargs):
         UserCache.objects.create(user=instance)
 
 
+@disable_for_loaddata
+def update_user_profile_version(sender, instance, **kwargs):
+    '''
+    Things rendered with the user's settings need to be rendered again
+    '''
+    reset_user_profile_version(instance.user_id)
+
+
 post_save.connect(create_user_profile, sender=User)
 post_save.connect(create_user_cache, sender=User)
+post_save.connect(update_user_profile_version, sender=UserProfile)
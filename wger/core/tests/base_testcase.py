@@ -23,6 +23,7 @@ from django.core.urlresolvers import reverse
 from django.core.urlresolvers import NoReverseMatch
 from django.core.cache import cache
 from django.conf import settings
+from django.db import connection
 from django.test import TestCase
 from wger.utils.constants import TWOPLACES
 
@@ -44,6 +45,33 @@ def get_reverse(url, kwargs={}):
     return six.text_type(url)
 
 
+def get_commit_hooks(hook_class):
+    '''
+    Helper function that returns the hooks of the given class that wait for
+    the transaction of the current test to be committed
+
+    Hooks registered while loading the fixtures of the test case are left out,
+    they belong to an outer savepoint.
+    '''
+    savepoint_ids = set(connection.savepoint_ids)
+    return [hook for hook_savepoint_ids, hook in connection.run_on_commit
+            if isinstance(hook, hook_class) and set(hook_savepoint_ids) >= savepoint_ids]
+
+
+def run_commit_hooks(hook_class):
+    '''
+    Helper function that runs the hooks of the given class that wait for the
+    transaction of the current test to be committed, the test cases are run
+    in a transaction that is never committed
+    '''
+    hooks = get_commit_hooks(hook_class)
+    connection.run_on_commit = [(savepoint_ids, hook)
+                                for savepoint_ids, hook in connection.run_on_commit
+                                if hook not in hooks]
+    for hook in hooks:
+        hook()
+
+
 def get_user_list(users):
     '''
     Helper function that returns a list with users to test
@@ -136,12 +164,17 @@ class BaseTestCase(object):
         self.media_root = tempfile.mkdtemp()
         settings.MEDIA_ROOT = self.media_root
 
+        # The test cases are run in a transaction that is never committed
+        self.invalidate_cache_on_commit = settings.WGER_SETTINGS['INVALIDATE_CACHE_ON_COMMIT']
+        settings.WGER_SETTINGS['INVALIDATE_CACHE_ON_COMMIT'] = False
+
     def tearDown(self):
         '''
         Reset settings
         '''
         del os.environ['RECAPTCHA_TESTING']
         cache.clear()
+        settings.WGER_SETTINGS['INVALIDATE_CACHE_ON_COMMIT'] = self.invalidate_cache_on_commit
 
         # Clear MEDIA_ROOT folder
         shutil.rmtree(self.media_root)
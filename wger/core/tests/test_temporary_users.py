@@ -18,8 +18,16 @@ import random
 from django.contrib.auth.models import User
 from django.core.management import call_command
 from django.core.urlresolvers import reverse
+from django.utils import translation
+from django.utils.timezone import now
+from django.utils.six import StringIO
 
-from wger.core.demo import create_demo_entries, create_temporary_user
+from wger.core.demo import (
+    claim_temporary_user,
+    create_demo_entries,
+    create_temporary_user
+)
+from wger.core.models import UserProfile
 from wger.core.tests.base_testcase import WorkoutManagerTestCase
 from wger.manager.models import (Day,
                                  Schedule,
@@ -186,3 +194,85 @@ class DemoUserTestCase(WorkoutManagerTestCase):
         self.assertEqual(self.count_temp_users(), 18)
         call_command('delete-temp-users')
         self.assertEqual(self.count_temp_users(), 2)
+
+    def assert_demo_data(self, user):
+        '''
+        Helper function that checks that a user has all the demo data
+        '''
+        self.assertEqual(Workout.objects.filter(user=user).count(), 4)
+        self.assertEqual(Day.objects.filter(training__user=user).count(), 2)
+        self.assertEqual(WorkoutLog.objects.filter(user=user).count(), 56)
+        self.assertEqual(Schedule.objects.filter(user=user).count(), 3)
+        self.assertEqual(ScheduleStep.objects.filter(schedule__user=user).count(), 6)
+        self.assertEqual(NutritionPlan.objects.filter(user=user).count(), 1)
+        self.assertEqual(Meal.objects.filter(plan__user=user).count(), 3)
+        self.assertEqual(WeightEntry.objects.filter(user=user).count(), 19)
+
+        # The copied entries belong to the user's own workouts and schedules
+        self.assertFalse(WorkoutLog.objects.filter(user=user)
+                                           .exclude(workout__user=user)
+                                           .exists())
+        self.assertFalse(ScheduleStep.objects.filter(schedule__user=user)
+                                             .exclude(workout__user=user)
+                                             .exists())
+
+    def test_command_fill_pool(self):
+        '''
+        Tests that the management command fills the pool of temporary users
+        '''
+        call_command('fill-temp-users', size=3, stdout=StringIO())
+        profiles = UserProfile.objects.filter(is_pooled=True)
+        self.assertEqual(profiles.count(), 3)
+        self.assertEqual(self.count_temp_users(), 4)
+        for profile in profiles:
+            self.assertTrue(profile.is_temporary)
+            self.assert_demo_data(profile.user)
+
+        # The pool is already full
+        call_command('fill-temp-users', size=3, stdout=StringIO())
+        self.assertEqual(self.count_temp_users(), 4)
+
+    def test_claim_pooled_user(self):
+        '''
+        Tests that guests get a user from the pool if one is available
+        '''
+        call_command('fill-temp-users', size=2, stdout=StringIO())
+        self.assertEqual(self.count_temp_users(), 3)
+
+        self.client.get(reverse('core:dashboard'))
+        self.assertEqual(self.count_temp_users(), 3)
+        self.assertEqual(UserProfile.objects.filter(is_pooled=True).count(), 1)
+        self.assertTrue(self.client.session['has_demo_data'])
+
+        user = User.objects.get(pk=self.client.session['_auth_user_id'])
+        self.assertFalse(user.userprofile.is_pooled)
+        self.assert_demo_data(user)
+
+        # The pool is empty after the last user was claimed
+        with translation.override('en'):
+            self.assertTrue(claim_temporary_user())
+            self.assertIsNone(claim_temporary_user())
+
+    def test_claim_moves_demo_entries(self):
+        '''
+        Tests that the demo entries of users that waited in the pool are moved
+        to the day they are claimed
+        '''
+        call_command('fill-temp-users', size=1, stdout=StringIO())
+        user = User.objects.get(userprofile__is_pooled=True)
+        weight_dates = [entry.date for entry in WeightEntry.objects.filter(user=user)]
+        log_dates = sorted(log.date for log in WorkoutLog.objects.filter(user=user))
+        start_dates = sorted(s.start_date for s in Schedule.objects.filter(user=user))
+
+        # The user was added to the pool three days ago
+        User.objects.filter(pk=user.pk).update(date_joined=now() - datetime.timedelta(days=3))
+        with translation.override('en'):
+            self.assertEqual(claim_temporary_user(), user)
+
+        delta = datetime.timedelta(days=3)
+        self.assertEqual([entry.date for entry in WeightEntry.objects.filter(user=user)],
+                         [date + delta for date in weight_dates])
+        self.assertEqual(sorted(log.date for log in WorkoutLog.objects.filter(user=user)),
+                         [date + delta for date in log_dates])
+        self.assertEqual(sorted(s.start_date for s in Schedule.objects.filter(user=user)),
+                         [date + delta for date in start_dates])
@@ -32,7 +32,11 @@ from django.template.loader import render_to_string
 
 
 from wger.core.forms import FeedbackRegisteredForm, FeedbackAnonymousForm
-from wger.core.demo import create_demo_entries, create_temporary_user
+from wger.core.demo import (
+    claim_temporary_user,
+    create_demo_entries,
+    create_temporary_user
+)
 from wger.core.models import DaysOfWeek
 from wger.manager.models import Schedule
 from wger.nutrition.models import NutritionPlan
@@ -66,13 +70,16 @@ def demo_entries(request):
     if (((not request.user.is_authenticated() or request.user.userprofile.is_temporary)
          and not request.session['has_demo_data'])):
         # If we reach this from a page that has no user created by the
-        # middleware, do that now
+        # middleware, do that now. Users from the pool already have demo data
         if not request.user.is_authenticated():
-            user = create_temporary_user()
+            user = claim_temporary_user()
+            if user is None:
+                user = create_temporary_user()
+                create_demo_entries(user)
             django_login(request, user)
+        else:
+            create_demo_entries(request.user)
 
-        # OK, continue
-        create_demo_entries(request.user)
         request.session['has_demo_data'] = True
         messages.success(request, _('We have created sample workout, workout schedules, weight '
                                     'logs, (body) weight and nutrition plan entries so you can '
@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+
+# This file is part of wger Workout Manager.
+#
+# wger Workout Manager is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# wger Workout Manager is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+
+import datetime
+import itertools
+import logging
+import uuid
+
+from django.conf import settings
+from django.core import mail
+from django.db.models import F, Q
+from django.utils import timezone
+
+from wger.email.models import CronEntry
+
+logger = logging.getLogger(__name__)
+
+# Time after which claimed emails can be claimed again, either because their
+# worker died or because sending them failed and they should be retried
+CLAIM_TIMEOUT = datetime.timedelta(hours=1)
+
+# Number of failed attempts after which an email is not sent anymore
+MAX_ATTEMPTS = 5
+
+
+def get_claimable_entries(max_attempts=MAX_ATTEMPTS):
+    '''
+    Returns the emails that can be claimed by a worker
+    '''
+    return CronEntry.objects.filter(Q(claimed_at__isnull=True) |
+                                    Q(claimed_at__lt=timezone.now() - CLAIM_TIMEOUT),
+                                    attempts__lt=max_attempts)
+
+
+def claim_entries(worker_id, batch_size, max_attempts=MAX_ATTEMPTS):
+    '''
+    Claims a batch of emails for a worker
+
+    The emails are claimed with a single update that only matches the ones
+    that are still claimable, so several workers can run at the same time
+    without sending an email twice.
+
+    :param worker_id: the ID of the worker, see send_queued_emails
+    :return: list of the claimed emails, ordered by their log
+    '''
+    while True:
+        entry_ids = list(get_claimable_entries(max_attempts)
+                         .order_by('pk')
+                         .values_list('pk', flat=True)[:batch_size])
+        if not entry_ids:
+            return []
+
+        claimed = get_claimable_entries(max_attempts)\
+            .filter(pk__in=entry_ids)\
+            .update(claim=worker_id, claimed_at=timezone.now())
+
+        # Another worker was faster, try with the next emails
+        if claimed:
+            return list(CronEntry.objects.filter(pk__in=entry_ids, claim=worker_id)
+                                         .select_related('log')
+                                         .order_by('log', 'pk'))
+
+
+def send_entries(entries, connection):
+    '''
+    Sends a batch of claimed emails over the given connection
+
+    :return: a tuple with the list of the IDs of the sent emails and a
+             dictionary with the IDs of the failed ones and their errors
+    '''
+    sent = []
+    failed = {}
+    for log, log_entries in itertools.groupby(entries, key=lambda entry: entry.log):
+        for entry in log_entries:
+            message = mail.EmailMessage(log.subject,
+                                        log.body,
+                                        settings.DEFAULT_FROM_EMAIL,
+                                        [entry.email],
+                                        connection=connection)
+            try:
+                # Does nothing if the connection is already open
+                connection.open()
+                if message.send():
+                    sent.append(entry.pk)
+                else:
+                    failed[entry.pk] = 'The email was not accepted'
+            except Exception as e:
+                failed[entry.pk] = '{0}'.format(e) or e.__class__.__name__
+
+                # Start with a new connection, the old one might be broken
+                connection.close()
+    return sent, failed
+
+
+def send_queued_emails(batch_size=100, max_attempts=MAX_ATTEMPTS):
+    '''
+    Sends the queued mass emails till there are none left
+
+    The emails are claimed and sent in batches over one connection. Sent
+    emails are deleted, the failed ones are kept with their error and retried
+    once their claim expires, see CLAIM_TIMEOUT.
+
+    :return: a tuple with the number of sent and of failed emails
+    '''
+    worker_id = uuid.uuid4().hex
+    connection = mail.get_connection()
+    sent_count = 0
+    failed_count = 0
+    try:
+        while True:
+            entries = claim_entries(worker_id, batch_size, max_attempts)
+            if not entries:
+                break
+
+            sent, failed = send_entries(entries, connection)
+            CronEntry.objects.filter(pk__in=sent).delete()
+            for pk, error in failed.items():
+                logger.warning('Could not send email %s: %s', pk, error)
+                CronEntry.objects.filter(pk=pk).update(attempts=F('attempts') + 1, error=error)
+
+            sent_count += len(sent)
+            failed_count += len(failed)
+    finally:
+        connection.close()
+    return sent_count, failed_count
@@ -14,11 +14,13 @@
 #
 # You should have received a copy of the GNU Affero General Public License
 
-from django.core import mail
-from django.conf import settings
+import multiprocessing
+from optparse import make_option
 
 from django.core.management.base import BaseCommand
-from wger.email.models import CronEntry
+
+from wger.email.helpers import MAX_ATTEMPTS, send_queued_emails
+from wger.utils.helpers import close_connections
 
 
 class Command(BaseCommand):
@@ -26,15 +28,55 @@ class Command(BaseCommand):
     Sends the prepared mass emails
     '''
 
+    option_list = BaseCommand.option_list + (
+        make_option('--batch-size',
+                    action='store',
+                    type='int',
+                    dest='batch_size',
+                    default=100,
+                    help='Number of emails each worker claims and sends at a time '
+                         '(default: 100)'),
+        make_option('--processes',
+                    action='store',
+                    type='int',
+                    dest='processes',
+                    default=1,
+                    help='Number of worker processes sending emails in parallel '
+                         '(default: 1)'),
+        make_option('--max-attempts',
+                    action='store',
+                    type='int',
+                    dest='max_attempts',
+                    default=MAX_ATTEMPTS,
+                    help='Number of failed attempts after which an email is not sent '
+                         'anymore (default: {0})'.format(MAX_ATTEMPTS)),
+    )
+
+    help = ('Sends the prepared mass emails\n'
+            '\n'
+            'Several instances of this command can run at the same time, each email\n'
+            'is only sent once. Emails that could not be sent are kept and retried\n'
+            'on a later run.')
+
     def handle(self, **options):
         '''
-        Send some mails and remove them from the list
+        Send the mails and remove them from the list
         '''
-        if CronEntry.objects.count():
-            for email in CronEntry.objects.all()[:100]:
-                mail.send_mail(email.log.subject,
-                               email.log.body,
-                               settings.DEFAULT_FROM_EMAIL,
-                               [email.email],
-                               fail_silently=True)
-                email.delete()
+        batch_size = max(options['batch_size'], 1)
+        processes = max(options['processes'], 1)
+
+        if processes == 1:
+            results = [send_queued_emails(batch_size, options['max_attempts'])]
+        else:
+            close_connections()
+            pool = multiprocessing.Pool(processes, initializer=close_connections)
+            workers = [pool.apply_async(send_queued_emails, (batch_size, options['max_attempts']))
+                       for i in range(processes)]
+            pool.close()
+            results = [worker.get() for worker in workers]
+            pool.join()
+
+        sent = sum(result[0] for result in results)
+        failed = sum(result[1] for result in results)
+        if int(options['verbosity']) >= 2 or failed:
+            self.stdout.write('Sent {0} emails, {1} failed'.format(sent, failed))
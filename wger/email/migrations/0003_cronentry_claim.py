@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('email', '0002_auto_20180530_0456'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cronentry',
+            name='attempts',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='cronentry',
+            name='claim',
+            field=models.CharField(db_index=True, editable=False, max_length=32, null=True),
+        ),
+        migrations.AddField(
+            model_name='cronentry',
+            name='claimed_at',
+            field=models.DateTimeField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='cronentry',
+            name='error',
+            field=models.TextField(blank=True, editable=False),
+        ),
+    ]
@@ -80,6 +80,32 @@ class CronEntry(models.Model):
     The email address
     '''
 
+    claim = models.CharField(max_length=32,
+                             null=True,
+                             editable=False,
+                             db_index=True)
+    '''
+    ID of the worker that is sending the email, see wger.email.helpers
+    '''
+
+    claimed_at = models.DateTimeField(null=True,
+                                      editable=False)
+    '''
+    When the email was last claimed by a worker
+    '''
+
+    attempts = models.IntegerField(default=0,
+                                   editable=False)
+    '''
+    Number of failed attempts to send the email
+    '''
+
+    error = models.TextField(blank=True,
+                             editable=False)
+    '''
+    The error of the last failed attempt
+    '''
+
     def __unicode__(self):
         '''
         Return a more human-readable representation
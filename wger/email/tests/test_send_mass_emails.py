@@ -0,0 +1,113 @@
+# This file is part of wger Workout Manager.
+#
+# wger Workout Manager is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# wger Workout Manager is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+
+import datetime
+import smtplib
+
+from django.core import mail
+from django.core.mail.backends.locmem import EmailBackend
+from django.core.management import call_command
+from django.utils import timezone
+from django.utils.six import StringIO
+
+from wger.core.tests.base_testcase import WorkoutManagerTestCase
+from wger.email.helpers import claim_entries
+from wger.email.models import CronEntry, Log
+
+
+class FailingEmailBackend(EmailBackend):
+    '''
+    Email backend that refuses some addresses
+    '''
+
+    def send_messages(self, messages):
+        for message in messages:
+            if 'fail@example.com' in message.to:
+                raise smtplib.SMTPRecipientsRefused({'fail@example.com': (550, 'Unknown user')})
+        return super(FailingEmailBackend, self).send_messages(messages)
+
+
+class SendMassEmailsTestCase(WorkoutManagerTestCase):
+    '''
+    Tests the send-mass-emails command
+    '''
+
+    def setUp(self):
+        super(SendMassEmailsTestCase, self).setUp()
+        for subject in ('First', 'Second'):
+            log = Log.objects.create(user_id=1, gym_id=1, subject=subject, body='Body')
+            CronEntry.objects.bulk_create([CronEntry(log=log,
+                                                     email='{0}-{1}@example.com'.format(subject,
+                                                                                        i))
+                                           for i in range(3)])
+
+    def send(self, **options):
+        '''
+        Helper function that runs the command with the failing backend
+        '''
+        with self.settings(EMAIL_BACKEND='wger.email.tests.test_send_mass_emails.'
+                                         'FailingEmailBackend'):
+            call_command('send-mass-emails', stdout=StringIO(), **options)
+
+    def test_send(self):
+        '''
+        Test sending all emails in batches
+        '''
+        self.send(batch_size=4)
+        self.assertEqual(len(mail.outbox), 6)
+        self.assertEqual(sorted(message.subject for message in mail.outbox),
+                         ['First'] * 3 + ['Second'] * 3)
+        self.assertFalse(CronEntry.objects.exists())
+
+    def test_failed(self):
+        '''
+        Test that emails that could not be sent are kept and retried later
+        '''
+        CronEntry.objects.create(log=Log.objects.first(), email='fail@example.com')
+        self.send(batch_size=2)
+        self.assertEqual(len(mail.outbox), 6)
+
+        entry = CronEntry.objects.get()
+        self.assertEqual(entry.email, 'fail@example.com')
+        self.assertEqual(entry.attempts, 1)
+        self.assertIn('Unknown user', entry.error)
+
+        # The email is only retried once its claim expired
+        self.send()
+        self.assertEqual(CronEntry.objects.get().attempts, 1)
+
+        CronEntry.objects.update(claimed_at=timezone.now() - datetime.timedelta(hours=2))
+        self.send()
+        self.assertEqual(CronEntry.objects.get().attempts, 2)
+
+        # ...but not anymore after too many attempts
+        CronEntry.objects.update(claimed_at=timezone.now() - datetime.timedelta(hours=2))
+        self.send(max_attempts=2)
+        self.assertEqual(CronEntry.objects.get().attempts, 2)
+
+    def test_claim(self):
+        '''
+        Test that the workers claim different emails
+        '''
+        first = claim_entries('worker1', 4)
+        second = claim_entries('worker2', 4)
+        self.assertEqual(len(first), 4)
+        self.assertEqual(len(second), 2)
+        self.assertFalse(set(first) & set(second))
+        self.assertEqual(claim_entries('worker3', 4), [])
+
+        # Emails of workers that died are claimed again
+        CronEntry.objects.filter(claim='worker1')\
+            .update(claimed_at=timezone.now() - datetime.timedelta(hours=2))
+        self.assertEqual(set(claim_entries('worker3', 4)), set(first))
@@ -17,11 +17,10 @@
 from tastypie import fields
 from tastypie.resources import ModelResource
 from tastypie.constants import ALL, ALL_WITH_RELATIONS
-from easy_thumbnails.alias import aliases
-from easy_thumbnails.files import get_thumbnailer
 
 from wger.core.api.resources import LanguageResource, LicenseResource
 
+from wger.exercises.helpers import get_thumbnail_urls
 from wger.exercises.models import (
     Exercise,
     ExerciseCategory,
@@ -97,13 +96,7 @@ class ExerciseImageResource(ModelResource):
         '''
         Also send the URLs for the thumbnailed pictures
         '''
-        thumbnails = {}
-        for alias in aliases.all():
-            t = get_thumbnailer(bundle.obj.image)
-            thumbnails[alias] = {'url': t.get_thumbnail(aliases.get(alias)).url,
-                                 'settings': aliases.get(alias)}
-
-        bundle.data['thumbnails'] = thumbnails
+        bundle.data['thumbnails'] = get_thumbnail_urls(bundle.obj)
         return bundle
 
 
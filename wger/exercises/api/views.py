@@ -20,9 +20,6 @@ from rest_framework.permissions import IsAuthenticatedOrReadOnly
 from rest_framework.response import Response
 from rest_framework.decorators import detail_route, api_view
 
-from easy_thumbnails.alias import aliases
-from easy_thumbnails.files import get_thumbnailer
-
 from django.utils.translation import ugettext as _
 
 from wger.config.models import LanguageConfig
@@ -34,6 +31,10 @@ from wger.exercises.api.serializers import (
     EquipmentSerializer,
     ExerciseCommentSerializer
 )
+from wger.exercises.helpers import (
+    get_thumbnail_urls,
+    search_exercises
+)
 from wger.exercises.models import (
     Exercise,
     Equipment,
@@ -80,30 +81,15 @@ def search(request):
     if q:
         languages = load_item_languages(LanguageConfig.SHOW_ITEM_EXERCISES,
                                         language_code=request.GET.get('language', None))
-        exercises = (Exercise.objects.filter(name__icontains=q)
-                     .filter(language__in=languages)
-                     .filter(status=Exercise.STATUS_ACCEPTED)
-                     .order_by('category__name', 'name')
-                     .distinct())
-
-        for exercise in exercises:
-            if exercise.main_image:
-                image_obj = exercise.main_image
-                image = image_obj.image.url
-                t = get_thumbnailer(image_obj.image)
-                thumbnail = t.get_thumbnail(aliases.get('micro_cropped')).url
-            else:
-                image = None
-                thumbnail = None
-
+        for entry in search_exercises(q, languages):
             exercise_json = {
-                'value': exercise.name,
+                'value': entry['name'],
                 'data': {
-                    'id': exercise.id,
-                    'name': exercise.name,
-                    'category': _(exercise.category.name),
-                    'image': image,
-                    'image_thumbnail': thumbnail
+                    'id': entry['id'],
+                    'name': entry['name'],
+                    'category': _(entry['category']),
+                    'image': entry['image'],
+                    'image_thumbnail': entry['image_thumbnail']
                 }
             }
             results.append(exercise_json)
@@ -150,19 +136,16 @@ class ExerciseImageViewSet(viewsets.ModelViewSet):
     def thumbnails(self, request, pk):
         '''
         Return a list of the image's thumbnails
+
+        Missing thumbnails are generated in the background, until they are
+        done the URL of a placeholder image is returned for them.
         '''
         try:
             image = ExerciseImage.objects.get(pk=pk)
         except ExerciseImage.DoesNotExist:
             return Response([])
 
-        thumbnails = {}
-        for alias in aliases.all():
-            t = get_thumbnailer(image.image)
-            thumbnails[alias] = {
-                'url': t.get_thumbnail(aliases.get(alias)).url,
-                'settings': aliases.get(alias)
-            }
+        thumbnails = get_thumbnail_urls(image)
         thumbnails['original'] = image.image.url
         return Response(thumbnails)
 
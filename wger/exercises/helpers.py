@@ -0,0 +1,353 @@
+# -*- coding: utf-8 -*-
+
+# This file is part of wger Workout Manager.
+#
+# wger Workout Manager is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# wger Workout Manager is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with Workout Manager.  If not, see <http://www.gnu.org/licenses/>.
+
+import logging
+import multiprocessing
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.templatetags.static import static
+from easy_thumbnails.alias import aliases
+from easy_thumbnails.files import get_thumbnailer
+
+from wger.core.models import Language
+from wger.exercises.models import Exercise, ExerciseImage
+from wger.utils.cache import cache_mapper
+from wger.utils.helpers import close_connections
+
+logger = logging.getLogger(__name__)
+
+
+def get_search_entry(exercise, image):
+    '''
+    Returns the entry of an exercise in the search index
+
+    The URLs of the image and its thumbnail are resolved here, so that
+    searching does not need to access the files. Thumbnails are never
+    generated here, if it doesn't exist yet the URL of a placeholder is used.
+    The thumbnails are queued when the image is uploaded, the entry is updated
+    when they are done, see ThumbnailPipeline.update_search_index.
+
+    :param exercise: the exercise, with its category
+    :param image: the exercise's main image or None
+    '''
+    image_url = None
+    thumbnail_url = None
+    if image:
+        image_url = image.image.url
+        thumbnail = get_thumbnailer(image.image) \
+            .get_existing_thumbnail(aliases.get('micro_cropped'))
+        thumbnail_url = thumbnail.url if thumbnail else \
+            static('images/icons/image-placeholder.svg')
+
+    return {'id': exercise.pk,
+            'name': exercise.name,
+            'search_name': exercise.name.lower(),
+            'category': exercise.category.name,
+            'image': image_url,
+            'image_thumbnail': thumbnail_url}
+
+
+def get_search_index(language_id):
+    '''
+    Returns the search index of the accepted exercises of a language
+
+    The index is a dictionary with the exercise IDs and their entries, it is
+    kept in the cache and updated by the exercise and image signals.
+    '''
+    cache_key = cache_mapper.get_exercise_search_index_key(language_id)
+    index = cache.get(cache_key)
+    if index is None:
+        exercises = Exercise.objects.accepted() \
+            .filter(language_id=language_id) \
+            .select_related('category')
+        images = {image.exercise_id: image
+                  for image in ExerciseImage.objects.accepted()
+                                                    .filter(exercise__in=exercises, is_main=True)}
+        index = {exercise.pk: get_search_entry(exercise, images.get(exercise.pk))
+                 for exercise in exercises}
+        cache.set(cache_key, index)
+    return index
+
+
+def update_search_index(exercise_id):
+    '''
+    Updates the entry of a single exercise in the cached search indexes
+
+    :param exercise_id: the ID of the changed, added or deleted exercise
+    '''
+    exercise = Exercise.objects.accepted() \
+        .filter(pk=exercise_id) \
+        .select_related('category') \
+        .first()
+
+    keys = {cache_mapper.get_exercise_search_index_key(pk): pk
+            for pk in Language.objects.values_list('pk', flat=True)}
+    changed = {}
+    for key, index in cache.get_many(keys.keys()).items():
+        if exercise and exercise.language_id == keys[key]:
+            index[exercise.pk] = get_search_entry(exercise, exercise.main_image)
+        elif index.pop(exercise_id, None) is None:
+            continue
+        changed[key] = index
+    cache.set_many(changed)
+
+
+def search_exercises(term, languages):
+    '''
+    Searches the accepted exercises whose names contain the term
+
+    :param term: the search term, case insensitive
+    :param languages: list of languages to search in
+    :return: a list of index entries, sorted by category and name
+    '''
+    thumbnail_pipeline.update_search_index()
+
+    term = term.lower()
+    results = []
+    for language in languages:
+        results += [entry for entry in get_search_index(language.pk).values()
+                    if term in entry['search_name']]
+    return sorted(results, key=lambda entry: (entry['category'], entry['name']))
+
+
+def get_existing_thumbnails(image):
+    '''
+    Returns the thumbnails of an exercise image that were already generated
+
+    :param image: the exercise image
+    :return: a dictionary with the aliases and their thumbnails, None for
+             the thumbnails that still need to be generated
+    '''
+    thumbnailer = get_thumbnailer(image.image)
+    return {alias: thumbnailer.get_existing_thumbnail(aliases.get(alias))
+            for alias in aliases.all()}
+
+
+def generate_thumbnails(image_pk, image_name):
+    '''
+    Generates the thumbnails of all aliases for an exercise image
+
+    This runs in the worker processes of the thumbnail pipeline. Errors are
+    returned instead of raised, so that the image is always marked as done.
+
+    :param image_pk: the ID of the exercise image
+    :param image_name: the name of the image file in the storage
+    :return: a tuple with the image's ID and an error message or None
+    '''
+    thumbnailer = get_thumbnailer(default_storage, relative_name=image_name)
+    try:
+        for alias in aliases.all():
+            thumbnailer.get_thumbnail(aliases.get(alias))
+    except Exception as e:
+        return image_pk, '{0}'.format(e)
+    return image_pk, None
+
+
+class ThumbnailPipeline(object):
+    '''
+    Generates the thumbnails of exercise images in a pool of worker processes
+
+    The pool is started with the first queued image. While the thumbnails of
+    an image are being generated, a flag is kept in the cache so that views
+    can show placeholders instead of generating them in the request.
+    '''
+
+    PENDING_TIMEOUT = 10 * 60
+    '''
+    Seconds after which an image is not considered pending anymore, in case
+    its worker process died
+    '''
+
+    def __init__(self, processes=None):
+        '''
+        :param processes: number of worker processes, defaults to the
+                          THUMBNAIL_PROCESSES setting. With 0 the thumbnails
+                          are generated synchronously.
+        '''
+        if processes is None:
+            processes = settings.WGER_SETTINGS['THUMBNAIL_PROCESSES']
+        self.processes = processes
+        self.pool = None
+        self.results = {}
+        self.errors = {}
+        self.exercise_ids = {}
+        self.finished = set()
+        self.lock = threading.Lock()
+
+    def get_pool(self):
+        '''
+        Returns the process pool, starting it if necessary
+        '''
+        if self.pool is None:
+            close_connections()
+            self.pool = multiprocessing.Pool(self.processes, initializer=close_connections)
+        return self.pool
+
+    def is_pending(self, image_pk):
+        '''
+        Checks whether the thumbnails of an image are being generated
+        '''
+        return bool(cache.get(cache_mapper.get_exercise_thumbnails_pending_key(image_pk)))
+
+    def queue(self, image):
+        '''
+        Queues the generation of the thumbnails of an exercise image
+
+        Images that are already queued are skipped.
+
+        :param image: the exercise image
+        '''
+        if not self.processes:
+            self.exercise_ids[image.pk] = image.exercise_id
+            self.done(generate_thumbnails(image.pk, image.image.name))
+            return
+
+        with self.lock:
+            if image.pk in self.results:
+                return
+            self.exercise_ids[image.pk] = image.exercise_id
+
+            cache.set(cache_mapper.get_exercise_thumbnails_pending_key(image.pk),
+                      True,
+                      self.PENDING_TIMEOUT)
+            self.results[image.pk] = self.get_pool().apply_async(generate_thumbnails,
+                                                                 (image.pk, image.image.name),
+                                                                 callback=self.done)
+
+    def queue_missing(self, images):
+        '''
+        Queues the images that have thumbnails that still need to be generated
+
+        :param images: iterable with exercise images
+        :return: the number of queued images
+        '''
+        count = 0
+        for image in images:
+            if None in get_existing_thumbnails(image).values():
+                self.queue(image)
+                count += 1
+        return count
+
+    def backfill(self, images, progress=None):
+        '''
+        Generates the missing thumbnails of the images and waits till they are done
+
+        :param images: iterable with exercise images
+        :param progress: optional callable, see wait()
+        :return: the failed images, see wait()
+        '''
+        missing = [image for image in images
+                   if None in get_existing_thumbnails(image).values()]
+        for done, image in enumerate(missing, 1):
+            self.queue(image)
+            if not self.processes and progress:
+                progress(done, len(missing))
+        return self.wait(progress)
+
+    def done(self, result):
+        '''
+        Called in the parent process when the thumbnails of an image are done
+
+        With worker processes this runs in the result thread of the pool, if
+        it raised, no other result would ever be done. Because of that only
+        the bookkeeping is done here, the search index is updated later by
+        update_search_index.
+        '''
+        try:
+            image_pk, error = result
+            with self.lock:
+                self.results.pop(image_pk, None)
+                exercise_id = self.exercise_ids.pop(image_pk, None)
+                if error:
+                    self.errors[image_pk] = error
+                elif exercise_id is not None:
+                    self.finished.add(exercise_id)
+            cache.delete(cache_mapper.get_exercise_thumbnails_pending_key(image_pk))
+            if error:
+                logger.error('Could not create thumbnails for image {0}: {1}'
+                             .format(image_pk, error))
+        except Exception:
+            logger.exception('Could not mark the thumbnails of an image as done')
+
+    def update_search_index(self):
+        '''
+        Replaces the placeholders of the images that are done in the search index
+        '''
+        with self.lock:
+            finished = self.finished
+            self.finished = set()
+        for exercise_id in finished:
+            update_search_index(exercise_id)
+
+    def wait(self, progress=None):
+        '''
+        Waits till all queued images are done
+
+        :param progress: optional callable that receives the number of done
+                         and of queued images after each finished image
+        :return: a dictionary with the IDs of the failed images and their
+                 errors, which is reset afterwards
+        '''
+        with self.lock:
+            results = list(self.results.values())
+        total = len(results)
+        for done, result in enumerate(results, 1):
+            result.wait()
+            if progress:
+                progress(done, total)
+
+        with self.lock:
+            errors = self.errors
+            self.errors = {}
+        return errors
+
+    def close(self):
+        '''
+        Waits till all queued images are done and stops the worker processes
+        '''
+        self.wait()
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+
+thumbnail_pipeline = ThumbnailPipeline()
+
+
+def get_thumbnail_urls(image):
+    '''
+    Returns the URLs of the thumbnails of an exercise image
+
+    Missing thumbnails are queued in the thumbnail pipeline, until they are
+    done the URL of a placeholder image is returned for them.
+
+    :param image: the exercise image
+    :return: a dictionary with the aliases, their URLs and settings
+    '''
+    existing = get_existing_thumbnails(image)
+    if None in existing.values() and not thumbnail_pipeline.is_pending(image.pk):
+        thumbnail_pipeline.queue(image)
+        existing = get_existing_thumbnails(image)
+
+    placeholder = static('images/icons/image-placeholder.svg')
+    return {alias: {'url': thumbnail.url if thumbnail else placeholder,
+                    'settings': aliases.get(alias)}
+            for alias, thumbnail in existing.items()}
@@ -16,26 +16,33 @@
 
 import requests
 import os
+import time
 
 from wger import get_version
+from multiprocessing.pool import ThreadPool
 from optparse import make_option
+from requests.adapters import HTTPAdapter
 from requests.utils import default_user_agent
+from django.core.cache import cache
 from django.core.exceptions import ImproperlyConfigured
 from django.core.management.base import BaseCommand, CommandError
-from django.core.files import File
-from django.core.files.temp import NamedTemporaryFile
+from django.core.files.base import ContentFile
 from django.core.validators import URLValidator
 from django.core.exceptions import ValidationError
 from django.conf import settings
+from django.utils.http import http_date
 
+from wger.exercises.helpers import thumbnail_pipeline
 from wger.exercises.models import Exercise, ExerciseImage
+from wger.utils.cache import cache_mapper
+from wger.utils.helpers import RateLimiter
 
 
 class Command(BaseCommand):
     '''
     Download exercise images from wger.de and updates the local database
 
-    The script assumes that the local IDs correspond to the remote ones, which
+    The script assumes that the local UUIDs correspond to the remote ones, which
     is the case if the user installed the exercises from the JSON fixtures.
     Otherwise, the exercise is simply skipped
     '''
@@ -46,6 +53,24 @@ class Command(BaseCommand):
                     dest='remote_url',
                     default='https://wger.de',
                     help='Remote URL to fetch the exercises from (default: https://wger.de)'),
+        make_option('--threads',
+                    action='store',
+                    type='int',
+                    dest='threads',
+                    default=4,
+                    help='Number of concurrent downloads (default: 4)'),
+        make_option('--rate-limit',
+                    action='store',
+                    type='float',
+                    dest='rate_limit',
+                    default=10,
+                    help='Maximum number of requests per second, 0 for no limit (default: 10)'),
+        make_option('--update',
+                    action='store_true',
+                    dest='update',
+                    default=False,
+                    help='Check whether the images already present locally changed on the '
+                         'remote server and download them again if so'),
     )
 
     help = ('Download exercise images from wger.de and update the local database\n'
@@ -53,7 +78,10 @@ class Command(BaseCommand):
             'ATTENTION: The script will download the images from the server and add them\n'
             '           to your local exercises. The exercises are identified by\n'
             '           their UUID field, if you manually edited or changed it\n'
-            '           the script will not be able to match them.')
+            '           the script will not be able to match them.\n'
+            '\n'
+            'Images already present locally are skipped, so an interrupted run can\n'
+            'simply be started again.')
 
     def handle(self, **options):
 
@@ -67,67 +95,157 @@ class Command(BaseCommand):
         except ValidationError:
             raise CommandError('Please enter a valid URL')
 
-        exercise_api = "{0}/api/v2/exercise/?limit=999"
-        image_api = "{0}/api/v2/exerciseimage/?exercise={1}"
-        thumbnail_api = "{0}/api/v2/exerciseimage/{1}/thumbnails/"
+        threads = max(options['threads'], 1)
+        self.remote_url = remote_url
+        self.rate_limiter = RateLimiter(options['rate_limit'])
 
-        headers = {'User-agent': default_user_agent('wger/{} + requests'.format(get_version()))}
+        # One session for all threads, so that the connections are kept alive
+        self.session = requests.Session()
+        self.session.headers['User-agent'] = default_user_agent('wger/{} + requests'
+                                                                .format(get_version()))
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=threads)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
 
         # Get all exercises
-        result = requests.get(exercise_api.format(remote_url), headers=headers).json()
-        for exercise_json in result['results']:
-            exercise_name = exercise_json['name'].encode('utf-8')
-            exercise_uuid = exercise_json['uuid']
-            exercise_id = exercise_json['id']
-
-            self.stdout.write('')
-            self.stdout.write(u"*** Processing {0} (ID: {1}, UUID: {2})".format(exercise_name,
-                                                                                exercise_id,
-                                                                                exercise_uuid))
-
-            try:
-                exercise = Exercise.objects.get(uuid=exercise_uuid)
-            except Exercise.DoesNotExist:
-                self.stdout.write('    Remote exercise not found in local DB, skipping...')
-                continue
-
-            # Get all images
-            images = requests.get(image_api.format(remote_url, exercise_id), headers=headers).json()
-
-            if images['count']:
-
-                for image_json in images['results']:
-                    image_id = image_json['id']
-                    result = requests.get(thumbnail_api.format(remote_url, image_id),
-                                          headers=headers).json()
-
-                    image_name = os.path.basename(result['original'])
-                    self.stdout.write('    Fetching image {0} - {1}'.format(image_id, image_name))
-
-                    try:
-                        image = ExerciseImage.objects.get(pk=image_id)
-                        self.stdout.write('    --> Image already present locally, skipping...')
+        exercises = {exercise.uuid: exercise for exercise in Exercise.objects.all()}
+        remote_exercises = []
+        for exercise_json in self.get_json('{0}/api/v2/exercise/?limit=999'.format(remote_url)):
+            exercise = exercises.get(exercise_json['uuid'])
+            if exercise:
+                remote_exercises.append((exercise, exercise_json))
+            else:
+                self.stdout.write(u'*** Remote exercise {0} (UUID: {1}) not found in local DB, '
+                                  u'skipping...'.format(exercise_json['name'],
+                                                        exercise_json['uuid']))
+
+        # Images that were already downloaded, by UUID and by ID for remote
+        # servers that don't send the UUID of the images
+        local_images = {}
+        local_ids = {}
+        for image in ExerciseImage.objects.all():
+            local_images[image.uuid] = image
+            local_ids[image.pk] = image
+
+        pool = ThreadPool(threads)
+        try:
+            # Get the images of all exercises
+            downloads = []
+            skipped = 0
+            for exercise, images in pool.imap(self.get_images, remote_exercises):
+                for image_json in images:
+                    if 'uuid' in image_json:
+                        image = local_images.get(image_json['uuid'])
+                    else:
+                        image = local_ids.get(image_json['id'])
+
+                    if image and not options['update']:
+                        skipped += 1
                         continue
-                    except ExerciseImage.DoesNotExist:
-                        self.stdout.write('    --> Image not found in local DB, creating now...')
-                        image = ExerciseImage()
-                        image.pk = image_id
-
-                    # Save the downloaded image, see link for details
-                    # http://stackoverflow.com/questions/1308386/programmatically-saving-image-to-
-                    retrieved_image = requests.get(result['original'], headers=headers)
-                    img_temp = NamedTemporaryFile(delete=True)
-                    img_temp.write(retrieved_image.content)
-                    img_temp.flush()
-
-                    image.exercise = exercise
-                    image.is_main = image_json['is_main']
-                    image.status = image_json['status']
-                    image.image.save(
-                        os.path.basename(image_name),
-                        File(img_temp),
-                    )
-                    image.save()
+                    downloads.append((exercise, image_json, image))
+
+            self.stdout.write('*** Downloading {0} images, {1} already present locally'
+                              .format(len(downloads), skipped))
+
+            # The images are downloaded by the threads but saved here, so that
+            # the threads don't need their own DB connections
+            for exercise, image_json, image, response in pool.imap_unordered(self.download,
+                                                                             downloads):
+                self.save_image(exercise, image_json, image, response)
+        finally:
+            pool.close()
+            pool.join()
+
+        # The thumbnails of the new images are generated in the background
+        self.stdout.write('')
+        self.stdout.write('*** Waiting for the thumbnails to be generated')
+        thumbnail_pipeline.close()
+
+    def get_json(self, url):
+        '''
+        Returns the results of a list API endpoint, following the pagination
+        '''
+        results = []
+        while url:
+            self.rate_limiter.wait()
+            response = self.session.get(url)
+            response.raise_for_status()
+            result = response.json()
+            results += result['results']
+            url = result.get('next')
+        return results
+
+    def get_images(self, remote_exercise):
+        '''
+        Fetches the list of images of a remote exercise
+        '''
+        exercise, exercise_json = remote_exercise
+        url = '{0}/api/v2/exerciseimage/?exercise={1}'.format(self.remote_url,
+                                                              exercise_json['id'])
+        return exercise, self.get_json(url)
+
+    def download(self, image_download):
+        '''
+        Downloads an image
+
+        Images that are already present locally are only downloaded again if
+        they changed, the request is conditional on their ETag, when known, and
+        the modification time of the local file.
+        '''
+        exercise, image_json, image = image_download
+        headers = {}
+        if image:
+            etag = cache.get(cache_mapper.get_exercise_image_etag_key(image.uuid))
+            if etag:
+                headers['If-None-Match'] = etag
+            try:
+                modified = image.image.storage.modified_time(image.image.name)
+                headers['If-Modified-Since'] = http_date(time.mktime(modified.timetuple()))
+            except (IOError, OSError, NotImplementedError):
+                pass
 
+        self.rate_limiter.wait()
+        try:
+            response = self.session.get(image_json['image'], headers=headers)
+        except requests.RequestException as e:
+            response = e
+        return exercise, image_json, image, response
+
+    def save_image(self, exercise, image_json, image, response):
+        '''
+        Saves a downloaded image to the local database
+        '''
+        image_name = os.path.basename(image_json['image'])
+        self.stdout.write(u'    Image {0} - {1} for {2}'.format(image_json['id'],
+                                                                image_name,
+                                                                exercise.name))
+
+        if isinstance(response, Exception) or response.status_code not in (200, 304):
+            self.stderr.write(u'    --> Could not download image: {0}'.format(
+                response if isinstance(response, Exception) else response.status_code))
+            return
+
+        if response.status_code == 304:
+            self.stdout.write('    --> Image not modified, skipping...')
+            return
+
+        if image:
+            self.stdout.write('    --> Image modified, updating now...')
+        else:
+            self.stdout.write('    --> Image not found in local DB, creating now...')
+            image = ExerciseImage()
+            if 'uuid' in image_json:
+                image.uuid = image_json['uuid']
             else:
-                self.stdout.write('    No images for this exercise, nothing to do')
+                image.pk = image_json['id']
+
+        image.exercise = exercise
+        image.is_main = image_json['is_main']
+        image.status = image_json['status']
+        image.image.save(image_name, ContentFile(response.content), save=False)
+        image.save()
+
+        if response.headers.get('ETag'):
+            cache.set(cache_mapper.get_exercise_image_etag_key(image.uuid),
+                      response.headers['ETag'],
+                      None)
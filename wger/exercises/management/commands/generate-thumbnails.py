@@ -0,0 +1,61 @@
+# -*- coding: utf-8 *-*
+
+# This file is part of wger Workout Manager.
+#
+# wger Workout Manager is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# wger Workout Manager is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from wger.exercises.helpers import ThumbnailPipeline
+from wger.exercises.models import ExerciseImage
+
+
+class Command(BaseCommand):
+    '''
+    Generates the missing thumbnails of all exercise images
+    '''
+
+    option_list = BaseCommand.option_list + (
+        make_option('--processes',
+                    action='store',
+                    type='int',
+                    dest='processes',
+                    default=None,
+                    help='Number of worker processes, 0 generates the thumbnails in this '
+                         'process (default: the THUMBNAIL_PROCESSES setting)'),
+    )
+
+    help = 'Generates the missing thumbnails of all exercise images'
+
+    def handle(self, **options):
+
+        pipeline = ThumbnailPipeline(processes=options['processes'])
+        self.stdout.write('Checking the thumbnails of {0} images'
+                          .format(ExerciseImage.objects.count()))
+
+        errors = pipeline.backfill(ExerciseImage.objects.all().iterator(),
+                                   progress=self.show_progress)
+        pipeline.close()
+        pipeline.update_search_index()
+        for pk, error in sorted(errors.items()):
+            self.stderr.write('Could not generate the thumbnails of image {0}: {1}'
+                              .format(pk, error))
+
+    def show_progress(self, done, total):
+        '''
+        Writes the number of images whose thumbnails were generated
+        '''
+        if done == total or not done % 10:
+            self.stdout.write('    {0}/{1} images done'.format(done, total))
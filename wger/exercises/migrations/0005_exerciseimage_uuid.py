@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import uuid
+
+
+def generate_uuids(apps, schema_editor):
+    '''
+    Generate new UUIDs for each exercise image
+    '''
+    ExerciseImage = apps.get_model("exercises", "ExerciseImage")
+    for image in ExerciseImage.objects.all():
+        image.uuid = uuid.uuid4()
+        image.save()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('exercises', '0004_auto_20180530_0456'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='exerciseimage',
+            name='uuid',
+            field=models.CharField(default=uuid.uuid4, editable=False, max_length=36, verbose_name='UUID'),
+        ),
+        migrations.RunPython(generate_uuids, migrations.RunPython.noop),
+    ]
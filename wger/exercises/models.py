@@ -39,8 +39,9 @@ from wger.utils.helpers import smart_capitalize
 from wger.utils.managers import SubmissionManager
 from wger.utils.models import AbstractLicenseModel, AbstractSubmissionModel
 from wger.utils.cache import (
-    delete_template_fragment_cache,
-    reset_workout_canonical_form,
+    delete_on_commit,
+    reset_exercise_day_index,
+    reset_template_namespace,
     cache_mapper
 )
 
@@ -139,17 +140,13 @@ class ExerciseCategory(models.Model):
         super(ExerciseCategory, self).save(*args, **kwargs)
 
         # Cached template fragments
-        for language in Language.objects.all():
-            delete_template_fragment_cache('exercise-overview', language.id)
-            delete_template_fragment_cache('exercise-overview-mobile', language.id)
+        reset_template_namespace('exercise-overview', 'exercise-overview-mobile')
 
     def delete(self, *args, **kwargs):
         '''
         Reset all cached infos
         '''
-        for language in Language.objects.all():
-            delete_template_fragment_cache('exercise-overview', language.id)
-            delete_template_fragment_cache('exercise-overview-mobile', language.id)
+        reset_template_namespace('exercise-overview', 'exercise-overview-mobile')
 
         super(ExerciseCategory, self).delete(*args, **kwargs)
 
@@ -233,18 +230,16 @@ class Exercise(AbstractSubmissionModel, AbstractLicenseModel, models.Model):
         super(Exercise, self).save(*args, **kwargs)
 
         # Cached objects
-        cache.delete(cache_mapper.get_exercise_muscle_bg_key(self))
+        delete_on_commit(cache_mapper.get_exercise_muscle_bg_key(self))
 
         # Cached template fragments
-        for language in Language.objects.all():
-            delete_template_fragment_cache('muscle-overview', language.id)
-            delete_template_fragment_cache('exercise-overview', language.id)
-            delete_template_fragment_cache('exercise-overview-mobile', language.id)
-            delete_template_fragment_cache('equipment-overview', language.id)
+        reset_template_namespace('muscle-overview',
+                                 'exercise-overview',
+                                 'exercise-overview-mobile',
+                                 'equipment-overview')
 
-        # Cached workouts
-        for set in self.set_set.all():
-            reset_workout_canonical_form(set.exerciseday.training_id)
+        # Cached workout days
+        reset_workout_canonical_forms([self.pk])
 
     def delete(self, *args, **kwargs):
         '''
@@ -252,20 +247,19 @@ class Exercise(AbstractSubmissionModel, AbstractLicenseModel, models.Model):
         '''
 
         # Cached objects
-        cache.delete(cache_mapper.get_exercise_muscle_bg_key(self))
+        delete_on_commit(cache_mapper.get_exercise_muscle_bg_key(self))
 
         # Cached template fragments
-        for language in Language.objects.all():
-            delete_template_fragment_cache('muscle-overview', language.id)
-            delete_template_fragment_cache('exercise-overview', language.id)
-            delete_template_fragment_cache('exercise-overview-mobile', language.id)
-            delete_template_fragment_cache('equipment-overview', language.id)
+        reset_template_namespace('muscle-overview',
+                                 'exercise-overview',
+                                 'exercise-overview-mobile',
+                                 'equipment-overview')
 
-        # Cached workouts
-        for set in self.set_set.all():
-            reset_workout_canonical_form(set.exerciseday.training.pk)
+        # Cached workout days
+        reset_workout_canonical_forms([self.pk])
 
         super(Exercise, self).delete(*args, **kwargs)
+        reset_exercise_day_index([self.pk])
 
     def __str__(self):
         '''
@@ -344,6 +338,61 @@ class Exercise(AbstractSubmissionModel, AbstractLicenseModel, models.Model):
                              fail_silently=True)
 
 
+def get_exercise_day_ids(exercise_ids):
+    '''
+    Returns a dictionary with the IDs of the workout days that use each of the
+    given exercises
+
+    This reverse index is cached per exercise, the entries that are missing are
+    built together with a single query.
+    '''
+    keys = {cache_mapper.get_exercise_days_key(pk): pk for pk in exercise_ids}
+    day_index = {keys[key]: value for key, value in cache.get_many(keys.keys()).items()}
+
+    missing_ids = [pk for pk in exercise_ids if pk not in day_index]
+    if missing_ids:
+        new_entries = {pk: set() for pk in missing_ids}
+        for exercise_id, day_id in Exercise.set_set.through.objects \
+                .filter(exercise__in=missing_ids) \
+                .values_list('exercise_id', 'set__exerciseday_id'):
+            new_entries[exercise_id].add(day_id)
+
+        day_index.update(new_entries)
+        cache.set_many({cache_mapper.get_exercise_days_key(pk): day_ids
+                        for pk, day_ids in new_entries.items()})
+    return day_index
+
+
+def add_exercise_day_ids(exercise_day_ids):
+    '''
+    Adds workout days to the cached index of the days that use each exercise
+
+    Only the entries that are already cached are updated, the others are
+    built when needed, see get_exercise_day_ids.
+
+    :param exercise_day_ids: dictionary with the new day IDs for each exercise ID
+    '''
+    keys = {cache_mapper.get_exercise_days_key(pk): pk for pk in exercise_day_ids}
+    day_index = cache.get_many(keys.keys())
+    for key, day_ids in day_index.items():
+        day_ids.update(exercise_day_ids[keys[key]])
+    cache.set_many(day_index)
+
+
+def reset_workout_canonical_forms(exercise_ids):
+    '''
+    Resets the cached canonical form of all the workout days that use the given
+    exercises
+
+    This can be used with many exercises at once, e.g. when moderating them
+    in batch.
+    '''
+    day_ids = set()
+    for exercise_day_ids in get_exercise_day_ids(exercise_ids).values():
+        day_ids.update(exercise_day_ids)
+    delete_on_commit(*[cache_mapper.get_day_canonical(pk) for pk in day_ids])
+
+
 def exercise_image_upload_dir(instance, filename):
     '''
     Returns the upload target for exercise images
@@ -376,6 +425,14 @@ class ExerciseImage(AbstractSubmissionModel, AbstractLicenseModel, models.Model)
                                               "marked by the system."))
     '''A flag indicating whether the image is the exercise's main image'''
 
+    uuid = models.CharField(verbose_name='UUID',
+                            max_length=36,
+                            editable=False,
+                            default=uuid.uuid4)
+    '''
+    Globally unique ID, to identify the image across installations
+    '''
+
     class Meta:
         '''
         Set default ordering
@@ -399,11 +456,10 @@ class ExerciseImage(AbstractSubmissionModel, AbstractLicenseModel, models.Model)
         #
         # Reset all cached infos
         #
-        for language in Language.objects.all():
-            delete_template_fragment_cache('muscle-overview', language.id)
-            delete_template_fragment_cache('exercise-overview', language.id)
-            delete_template_fragment_cache('exercise-overview-mobile', language.id)
-            delete_template_fragment_cache('equipment-overview', language.id)
+        reset_template_namespace('muscle-overview',
+                                 'exercise-overview',
+                                 'exercise-overview-mobile',
+                                 'equipment-overview')
 
         # And go on
         super(ExerciseImage, self).save(*args, **kwargs)
@@ -414,11 +470,10 @@ class ExerciseImage(AbstractSubmissionModel, AbstractLicenseModel, models.Model)
         '''
         super(ExerciseImage, self).delete(*args, **kwargs)
 
-        for language in Language.objects.all():
-            delete_template_fragment_cache('muscle-overview', language.id)
-            delete_template_fragment_cache('exercise-overview', language.id)
-            delete_template_fragment_cache('exercise-overview-mobile', language.id)
-            delete_template_fragment_cache('equipment-overview', language.id)
+        reset_template_namespace('muscle-overview',
+                                 'exercise-overview',
+                                 'exercise-overview-mobile',
+                                 'equipment-overview')
 
         # Make sure there is always a main image
         if not ExerciseImage.objects.accepted() \
@@ -486,8 +541,7 @@ class ExerciseComment(models.Model):
         '''
         Reset cached workouts
         '''
-        for set in self.exercise.set_set.all():
-            reset_workout_canonical_form(set.exerciseday.training_id)
+        reset_workout_canonical_forms([self.exercise_id])
 
         super(ExerciseComment, self).save(*args, **kwargs)
 
@@ -495,8 +549,7 @@ class ExerciseComment(models.Model):
         '''
         Reset cached workouts
         '''
-        for set in self.exercise.set_set.all():
-            reset_workout_canonical_form(set.exerciseday.training.pk)
+        reset_workout_canonical_forms([self.exercise_id])
 
         super(ExerciseComment, self).delete(*args, **kwargs)
 
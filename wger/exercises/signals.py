@@ -15,22 +15,64 @@
 # You should have received a copy of the GNU Affero General Public License
 
 
+from django.db import transaction
+from django.db.models import Q
 from django.db.models.signals import pre_save
+from django.db.models.signals import post_save
+from django.db.models.signals import pre_delete
 from django.db.models.signals import post_delete
 from django.dispatch import receiver
-from django.core.cache import cache
 from easy_thumbnails.files import get_thumbnailer
-from easy_thumbnails.signal_handlers import generate_aliases
-from easy_thumbnails.signals import saved_file
 
-from wger.exercises.models import ExerciseImage, Muscle
+from wger.core.models import Language
+from wger.exercises.helpers import thumbnail_pipeline, update_search_index
+from wger.exercises.models import (
+    Exercise,
+    ExerciseCategory,
+    ExerciseImage,
+    Muscle,
+    reset_workout_canonical_forms
+)
+from wger.utils.cache import (
+    cache_mapper,
+    delete_on_commit,
+    get_template_cache_name,
+    reset_template_namespace
+)
+
+
+@receiver(pre_delete, sender=Muscle)
+def collect_exercises_on_delete_muscle(sender, instance, **kwargs):
+    '''
+    Remember the exercises that use the muscle, since the relations are
+    already gone when the muscle is deleted
+    '''
+    instance.exercise_ids = list(Exercise.objects.filter(Q(muscles=instance) |
+                                                         Q(muscles_secondary=instance))
+                                                 .values_list('pk', flat=True)
+                                                 .distinct())
+
 
 @receiver(post_delete, sender=Muscle)
 def reset_cache_on_delete_muscle(sender, instance, **kwargs):
     '''
-    Resets the cache after muscle is deleted.
+    Resets the cached entries that depend on the deleted muscle.
+
+    These are the muscle overview, the muscle backgrounds and details of the
+    exercises that used it and the workout days with these exercises.
     '''
-    cache.clear()
+    exercise_ids = getattr(instance, 'exercise_ids', [])
+    reset_template_namespace('muscle-overview', 'equipment-overview')
+    if not exercise_ids:
+        return
+
+    keys = [cache_mapper.get_exercise_muscle_bg_key(pk) for pk in exercise_ids]
+    for language_id in Language.objects.values_list('pk', flat=True):
+        keys += [get_template_cache_name('exercise-detail-muscles', pk, language_id)
+                 for pk in exercise_ids]
+    delete_on_commit(*keys)
+
+    reset_workout_canonical_forms(exercise_ids)
 
 
 @receiver(post_delete, sender=ExerciseImage)
@@ -60,10 +102,55 @@ def delete_exercise_image_on_update(sender, instance, **kwargs):
 
     new_file = instance.image
     if not old_file == new_file:
-        thumbnailer = get_thumbnailer(instance.image)
+        thumbnailer = get_thumbnailer(old_file)
         thumbnailer.delete_thumbnails()
-        instance.image.delete(save=False)
+        old_file.delete(save=False)
 
 
-# Generate thumbnails when uploading a new image
-saved_file.connect(generate_aliases)
+@receiver(post_save, sender=Exercise)
+@receiver(post_delete, sender=Exercise)
+def update_search_index_on_exercise(sender, instance, **kwargs):
+    '''
+    Update the exercise's entry in the search index
+    '''
+    update_search_index(instance.pk)
+
+
+@receiver(post_save, sender=ExerciseImage)
+@receiver(post_delete, sender=ExerciseImage)
+def update_search_index_on_image(sender, instance, **kwargs):
+    '''
+    The main image of the exercise might have changed
+    '''
+    update_search_index(instance.exercise_id)
+
+
+@receiver(post_save, sender=ExerciseImage)
+@receiver(post_delete, sender=ExerciseImage)
+def reset_canonical_forms_on_image(sender, instance, **kwargs):
+    '''
+    The rendered workouts, e.g. the PDFs, show the main images of the exercises
+    '''
+    if kwargs.get('raw'):
+        return
+    reset_workout_canonical_forms([instance.exercise_id])
+
+
+@receiver(post_save, sender=ExerciseCategory)
+def reset_search_index_on_category(sender, instance, **kwargs):
+    '''
+    Category names are part of the search index entries
+    '''
+    delete_on_commit(*[cache_mapper.get_exercise_search_index_key(pk)
+                       for pk in Language.objects.values_list('pk', flat=True)])
+
+
+@receiver(post_save, sender=ExerciseImage)
+def queue_thumbnails(sender, instance, **kwargs):
+    '''
+    Generate the missing thumbnails of the image in the background
+
+    This is only done after the transaction was committed, since the worker
+    processes can't see the image before that.
+    '''
+    transaction.on_commit(lambda: thumbnail_pipeline.queue_missing([instance]))
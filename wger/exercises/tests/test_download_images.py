@@ -0,0 +1,165 @@
+# This file is part of wger Workout Manager.
+#
+# wger Workout Manager is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# wger Workout Manager is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+
+import json
+import threading
+import time
+
+from django.core.management import call_command
+from django.utils.six import StringIO
+from django.utils.six.moves.BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+
+from wger.core.tests.base_testcase import WorkoutManagerTestCase
+from wger.exercises.models import Exercise, ExerciseImage
+from wger.utils.helpers import RateLimiter
+
+
+class StubRequestHandler(BaseHTTPRequestHandler):
+    '''
+    Serves a remote installation with one exercise and one image
+    '''
+
+    def do_GET(self):
+        self.server.requests.append((self.path, dict(self.headers.items())))
+
+        if self.path == '/media/protestschwein.jpg':
+            if self.headers.get('If-None-Match') == '"v1"':
+                self.send_response(304)
+                self.end_headers()
+                return
+            with open('wger/exercises/tests/protestschwein.jpg', 'rb') as image_file:
+                content = image_file.read()
+            self.send_response(200)
+            self.send_header('Content-Type', 'image/jpeg')
+            self.send_header('ETag', '"v1"')
+        else:
+            content = json.dumps(self.server.responses[self.path]).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, *args):
+        pass
+
+
+class DownloadExerciseImagesTestCase(WorkoutManagerTestCase):
+    '''
+    Tests the download-exercise-images command against a stub server
+    '''
+
+    def setUp(self):
+        super(DownloadExerciseImagesTestCase, self).setUp()
+        self.server = HTTPServer(('127.0.0.1', 0), StubRequestHandler)
+        self.url = 'http://127.0.0.1:{0}'.format(self.server.server_port)
+        self.server.requests = []
+        self.server.responses = {
+            '/api/v2/exercise/?limit=999': {
+                'next': None,
+                'results': [{'id': 81,
+                             'name': 'An exercise',
+                             'uuid': Exercise.objects.get(pk=2).uuid},
+                            {'id': 82,
+                             'name': 'Not here',
+                             'uuid': 'ae3328ba-9a35-4731-bc23-5e9a7a8d2a4d'}]},
+            '/api/v2/exerciseimage/?exercise=81': {
+                'next': None,
+                'results': [{'id': 300,
+                             'uuid': '1b020b3a-3732-4c7e-92fd-cf4ea6d5ab5b',
+                             'image': self.url + '/media/protestschwein.jpg',
+                             'is_main': True,
+                             'status': '2'}]},
+        }
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+        super(DownloadExerciseImagesTestCase, self).tearDown()
+
+    def download(self, **options):
+        '''
+        Helper function that runs the command against the stub server
+        '''
+        self.server.requests = []
+        call_command('download-exercise-images',
+                     remote_url=self.url,
+                     rate_limit=0,
+                     stdout=StringIO(),
+                     stderr=StringIO(),
+                     **options)
+        return [path for path, headers in self.server.requests]
+
+    def test_download(self):
+        '''
+        Test downloading the images and resuming
+        '''
+        count = ExerciseImage.objects.count()
+        paths = self.download()
+        self.assertEqual(sorted(paths), ['/api/v2/exercise/?limit=999',
+                                         '/api/v2/exerciseimage/?exercise=81',
+                                         '/media/protestschwein.jpg'])
+        image = ExerciseImage.objects.get(uuid='1b020b3a-3732-4c7e-92fd-cf4ea6d5ab5b')
+        self.assertEqual(image.exercise_id, 2)
+        self.assertTrue(image.is_main)
+        self.assertEqual(image.status, '2')
+
+        # Images already present are skipped
+        paths = self.download(threads=2)
+        self.assertNotIn('/media/protestschwein.jpg', paths)
+        self.assertEqual(ExerciseImage.objects.count(), count + 1)
+
+    def test_update_conditional(self):
+        '''
+        Test that images present locally are only downloaded again if they changed
+        '''
+        self.download()
+        image = ExerciseImage.objects.get(uuid='1b020b3a-3732-4c7e-92fd-cf4ea6d5ab5b')
+
+        self.download(update=True)
+        path, headers = self.server.requests[-1]
+        self.assertEqual(path, '/media/protestschwein.jpg')
+        self.assertEqual(headers.get('If-None-Match'), '"v1"')
+        self.assertIn('If-Modified-Since', headers)
+        self.assertEqual(ExerciseImage.objects.get(pk=image.pk).image, image.image)
+
+
+class RateLimiterTestCase(WorkoutManagerTestCase):
+    '''
+    Tests the rate limiter
+    '''
+
+    def test_rate_limit(self):
+        '''
+        Test that the requests are spaced out
+        '''
+        limiter = RateLimiter(50)
+        start = time.time()
+        for i in range(6):
+            limiter.wait()
+        self.assertGreaterEqual(time.time() - start, 0.1)
+
+    def test_no_limit(self):
+        '''
+        Test that there is no waiting without a limit
+        '''
+        limiter = RateLimiter(0)
+        start = time.time()
+        for i in range(100):
+            limiter.wait()
+        self.assertLess(time.time() - start, 0.1)
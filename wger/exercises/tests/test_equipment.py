@@ -24,7 +24,7 @@ from wger.core.tests.base_testcase import (
     WorkoutManagerAddTestCase
 )
 from wger.exercises.models import Equipment, Exercise
-from wger.utils.cache import get_template_cache_name
+from wger.utils.cache import get_versioned_template_cache_name
 from wger.utils.constants import PAGINATION_OBJECTS_PER_PAGE
 
 
@@ -142,9 +142,9 @@ class EquipmentCacheTestCase(WorkoutManagerTestCase):
         if self.is_mobile:
             self.client.get(reverse('exercise:equipment:overview'))
         else:
-            self.assertFalse(cache.get(get_template_cache_name('equipment-overview', 2)))
+            self.assertFalse(cache.get(get_versioned_template_cache_name('equipment-overview', 2)))
             self.client.get(reverse('exercise:equipment:overview'))
-            self.assertTrue(cache.get(get_template_cache_name('equipment-overview', 2)))
+            self.assertTrue(cache.get(get_versioned_template_cache_name('equipment-overview', 2)))
 
     def test_equipmet_cache_update(self):
         '''
@@ -152,12 +152,12 @@ class EquipmentCacheTestCase(WorkoutManagerTestCase):
         performing certain operations
         '''
 
-        self.assertFalse(cache.get(get_template_cache_name('equipment-overview', 2)))
+        self.assertFalse(cache.get(get_versioned_template_cache_name('equipment-overview', 2)))
 
         self.client.get(reverse('exercise:equipment:overview'))
         self.client.get(reverse('exercise:exercise:view', kwargs={'id': 2}))
 
-        old_overview = cache.get(get_template_cache_name('equipment-overview', 2))
+        old_overview = cache.get(get_versioned_template_cache_name('equipment-overview', 2))
 
         exercise = Exercise.objects.get(pk=2)
         exercise.name = 'Very cool exercise 2'
@@ -165,12 +165,12 @@ class EquipmentCacheTestCase(WorkoutManagerTestCase):
         exercise.equipment.add(Equipment.objects.get(pk=2))
         exercise.save()
 
-        self.assertFalse(cache.get(get_template_cache_name('equipment-overview', 2)))
+        self.assertFalse(cache.get(get_versioned_template_cache_name('equipment-overview', 2)))
 
         self.client.get(reverse('exercise:equipment:overview'))
         self.client.get(reverse('exercise:exercise:view', kwargs={'id': 2}))
 
-        new_overview = cache.get(get_template_cache_name('equipment-overview', 2))
+        new_overview = cache.get(get_versioned_template_cache_name('equipment-overview', 2))
 
         self.assertNotEqual(old_overview, new_overview)
 
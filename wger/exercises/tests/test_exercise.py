@@ -16,6 +16,7 @@ import json
 
 from django.core import mail
 from django.core.cache import cache
+from django.core.files import File
 from django.core.urlresolvers import reverse
 
 from wger.core.tests.base_testcase import (
@@ -23,12 +24,24 @@ from wger.core.tests.base_testcase import (
     WorkoutManagerTestCase,
     WorkoutManagerDeleteTestCase
 )
+from wger.core.models import Language
+from wger.exercises.helpers import get_search_index, search_exercises
 from wger.exercises.models import (
     Exercise,
+    ExerciseImage,
     Muscle,
     ExerciseCategory,
+    get_exercise_day_ids,
+    reset_workout_canonical_forms
+)
+from wger.manager.models import Set, Workout
+from wger.utils.cache import (
+    get_template_cache_name,
+    get_template_namespace_version,
+    get_versioned_template_cache_name,
+    reset_template_namespace,
+    cache_mapper
 )
-from wger.utils.cache import get_template_cache_name, cache_mapper
 
 
 class ExerciseRepresentationTestCase(WorkoutManagerTestCase):
@@ -404,6 +417,86 @@ class DeleteExercisesTestCase(WorkoutManagerDeleteTestCase):
     user_fail = 'test'
 
 
+class ExerciseSearchIndexTestCase(WorkoutManagerTestCase):
+    '''
+    Tests the cached exercise search index
+    '''
+
+    def get_entry(self, exercise_id, language_id=2):
+        '''
+        Helper returning the cached entry of an exercise
+        '''
+        index = cache.get(cache_mapper.get_exercise_search_index_key(language_id))
+        return index.get(exercise_id)
+
+    def test_search_uses_index(self):
+        '''
+        Test that searching with a built index does not need the database
+        '''
+        languages = [Language.objects.get(pk=2)]
+        self.assertEqual([e['id'] for e in search_exercises('cool', languages)], [2])
+
+        with self.assertNumQueries(0):
+            self.assertEqual([e['id'] for e in search_exercises('COOL', languages)], [2])
+
+    def test_update_exercise(self):
+        '''
+        Test that changed exercises are updated in the index
+        '''
+        get_search_index(2)
+
+        exercise = Exercise.objects.get(pk=2)
+        exercise.name_original = 'Very hot exercise'
+        exercise.save()
+        self.assertEqual(self.get_entry(2)['name'], 'Very Hot Exercise')
+        self.assertEqual(self.get_entry(2)['search_name'], 'very hot exercise')
+
+        exercise.status = Exercise.STATUS_PENDING
+        exercise.save()
+        self.assertIsNone(self.get_entry(2))
+
+        exercise.status = Exercise.STATUS_ACCEPTED
+        exercise.language_id = 1
+        exercise.save()
+        self.assertIsNone(self.get_entry(2))
+        self.assertFalse(cache.get(cache_mapper.get_exercise_search_index_key(1)))
+
+        get_search_index(1)
+        exercise.delete()
+        self.assertIsNone(self.get_entry(2, language_id=1))
+
+    def test_update_image(self):
+        '''
+        Test that the image and thumbnail URLs are resolved when adding images
+        '''
+        get_search_index(2)
+        self.assertIsNone(self.get_entry(2)['image'])
+
+        image = ExerciseImage()
+        image.exercise = Exercise.objects.get(pk=2)
+        image.status = ExerciseImage.STATUS_ACCEPTED
+        with open('wger/exercises/tests/protestschwein.jpg', 'rb') as image_file:
+            image.image.save('protestschwein.jpg', File(image_file))
+        image.save()
+
+        entry = self.get_entry(2)
+        self.assertEqual(entry['image'], image.image.url)
+        self.assertTrue(entry['image_thumbnail'])
+
+        image.delete()
+        self.assertIsNone(self.get_entry(2)['image'])
+
+    def test_update_category(self):
+        '''
+        Test that the index is reset when a category changes
+        '''
+        get_search_index(2)
+        category = ExerciseCategory.objects.get(pk=2)
+        category.name = 'Cool category'
+        category.save()
+        self.assertFalse(cache.get(cache_mapper.get_exercise_search_index_key(2)))
+
+
 class ExercisesCacheTestCase(WorkoutManagerTestCase):
     '''
     Exercise cache test case
@@ -414,38 +507,49 @@ class ExercisesCacheTestCase(WorkoutManagerTestCase):
         Test the exercise overview cache is correctly generated on visit
         '''
         if self.is_mobile:
-            self.assertFalse(cache.get(get_template_cache_name('exercise-overview-mobile', 2)))
+            self.assertFalse(cache.get(
+                get_versioned_template_cache_name('exercise-overview-mobile', 2)))
             self.client.get(reverse('exercise:exercise:overview'))
-            self.assertTrue(cache.get(get_template_cache_name('exercise-overview-mobile', 2)))
+            self.assertTrue(cache.get(
+                get_versioned_template_cache_name('exercise-overview-mobile', 2)))
         else:
-            self.assertFalse(cache.get(get_template_cache_name('exercise-overview', 2)))
+            self.assertFalse(cache.get(get_versioned_template_cache_name('exercise-overview', 2)))
             self.client.get(reverse('exercise:exercise:overview'))
-            self.assertTrue(cache.get(get_template_cache_name('exercise-overview', 2)))
+            self.assertTrue(cache.get(get_versioned_template_cache_name('exercise-overview', 2)))
 
     def test_exercise_detail(self):
         '''
         Test that the exercise detail cache is correctly generated on visit
         '''
 
+    def test_reset_template_namespace(self):
+        '''
+        Test that resetting a fragment only increments its version
+        '''
+        version = get_template_namespace_version('exercise-overview')
+        with self.assertNumQueries(0):
+            reset_template_namespace('exercise-overview')
+        self.assertEqual(get_template_namespace_version('exercise-overview'), version + 1)
+
     def test_overview_cache_update(self):
         '''
         Test that the template cache for the overview is correctly reseted when
         performing certain operations
         '''
         self.assertFalse(cache.get(cache_mapper.get_exercise_muscle_bg_key(2)))
-        self.assertFalse(cache.get(get_template_cache_name('muscle-overview', 2)))
+        self.assertFalse(cache.get(get_versioned_template_cache_name('muscle-overview', 2)))
         self.assertFalse(cache.get(get_template_cache_name('muscle-overview-mobile', 2)))
         self.assertFalse(cache.get(get_template_cache_name('muscle-overview-search', 2)))
-        self.assertFalse(cache.get(get_template_cache_name('exercise-overview', 2)))
+        self.assertFalse(cache.get(get_versioned_template_cache_name('exercise-overview', 2)))
 
         self.client.get(reverse('exercise:exercise:overview'))
         self.client.get(reverse('exercise:exercise:view', kwargs={'id': 2}))
 
         old_exercise_bg = cache.get(cache_mapper.get_exercise_muscle_bg_key(2))
-        old_muscle_overview = cache.get(get_template_cache_name('muscle-overview', 2))
-        old_exercise_overview = cache.get(get_template_cache_name('exercise-overview', 2))
-        old_exercise_overview_mobile = cache.get(get_template_cache_name('exercise-overview-mobile',
-                                                                         2))
+        old_muscle_overview = cache.get(get_versioned_template_cache_name('muscle-overview', 2))
+        old_exercise_overview = cache.get(get_versioned_template_cache_name('exercise-overview', 2))
+        old_exercise_overview_mobile = cache.get(
+            get_versioned_template_cache_name('exercise-overview-mobile', 2))
 
         exercise = Exercise.objects.get(pk=2)
         exercise.name = 'Very cool exercise 2'
@@ -454,19 +558,20 @@ class ExercisesCacheTestCase(WorkoutManagerTestCase):
         exercise.save()
 
         self.assertFalse(cache.get(cache_mapper.get_exercise_muscle_bg_key(2)))
-        self.assertFalse(cache.get(get_template_cache_name('muscle-overview', 2)))
-        self.assertFalse(cache.get(get_template_cache_name('exercise-overview', 2)))
-        self.assertFalse(cache.get(get_template_cache_name('exercise-overview-mobile', 2)))
+        self.assertFalse(cache.get(get_versioned_template_cache_name('muscle-overview', 2)))
+        self.assertFalse(cache.get(get_versioned_template_cache_name('exercise-overview', 2)))
+        self.assertFalse(cache.get(
+            get_versioned_template_cache_name('exercise-overview-mobile', 2)))
 
         self.client.get(reverse('exercise:exercise:overview'))
         self.client.get(reverse('exercise:muscle:overview'))
         self.client.get(reverse('exercise:exercise:view', kwargs={'id': 2}))
 
         new_exercise_bg = cache.get(cache_mapper.get_exercise_muscle_bg_key(2))
-        new_muscle_overview = cache.get(get_template_cache_name('muscle-overview', 2))
-        new_exercise_overview = cache.get(get_template_cache_name('exercise-overview', 2))
-        new_exercise_overview_mobile = cache.get(get_template_cache_name('exercise-overview-mobile',
-                                                                         2))
+        new_muscle_overview = cache.get(get_versioned_template_cache_name('muscle-overview', 2))
+        new_exercise_overview = cache.get(get_versioned_template_cache_name('exercise-overview', 2))
+        new_exercise_overview_mobile = cache.get(
+            get_versioned_template_cache_name('exercise-overview-mobile', 2))
 
         if not self.is_mobile:
             self.assertNotEqual(old_exercise_bg, new_exercise_bg)
@@ -488,11 +593,11 @@ class WorkoutCacheTestCase(WorkoutManagerTestCase):
         exercise = Exercise.objects.get(pk=2)
         for set in exercise.set_set.all():
             set.exerciseday.training.canonical_representation
-            workout_id = set.exerciseday.training_id
-            self.assertTrue(cache.get(cache_mapper.get_workout_canonical(workout_id)))
+            day_id = set.exerciseday_id
+            self.assertTrue(cache.get(cache_mapper.get_day_canonical(day_id)))
 
             exercise.save()
-            self.assertFalse(cache.get(cache_mapper.get_workout_canonical(workout_id)))
+            self.assertFalse(cache.get(cache_mapper.get_day_canonical(day_id)))
 
     def test_canonical_form_cache_delete(self):
         '''
@@ -500,16 +605,46 @@ class WorkoutCacheTestCase(WorkoutManagerTestCase):
         '''
         exercise = Exercise.objects.get(pk=2)
 
-        workout_ids = []
+        day_ids = []
         for set in exercise.set_set.all():
-            workout_id = set.exerciseday.training_id
-            workout_ids.append(workout_id)
+            day_ids.append(set.exerciseday_id)
             set.exerciseday.training.canonical_representation
-            self.assertTrue(cache.get(cache_mapper.get_workout_canonical(workout_id)))
+            self.assertTrue(cache.get(cache_mapper.get_day_canonical(set.exerciseday_id)))
 
         exercise.delete()
-        for workout_id in workout_ids:
-            self.assertFalse(cache.get(cache_mapper.get_workout_canonical(workout_id)))
+        for day_id in day_ids:
+            self.assertFalse(cache.get(cache_mapper.get_day_canonical(day_id)))
+
+    def test_canonical_form_cache_batch(self):
+        '''
+        Tests resetting the workout cache for several exercises at once
+        '''
+        for workout in Workout.objects.all():
+            workout.canonical_representation
+
+        # The reverse index is built with one query and then read from the cache
+        with self.assertNumQueries(1):
+            reset_workout_canonical_forms([1, 2])
+        for day_id in (1, 2, 5):
+            self.assertFalse(cache.get(cache_mapper.get_day_canonical(day_id)))
+        self.assertTrue(cache.get(cache_mapper.get_day_canonical(3)))
+        self.assertTrue(cache.get(cache_mapper.get_day_canonical(4)))
+
+        with self.assertNumQueries(0):
+            reset_workout_canonical_forms([1, 2])
+
+    def test_day_index_update(self):
+        '''
+        Tests that the exercise to day index is updated when editing sets
+        '''
+        self.assertEqual(get_exercise_day_ids([1, 2]), {1: set([1]), 2: set([2, 5])})
+
+        Set.objects.get(pk=3).exercises.add(Exercise.objects.get(pk=1))
+        self.assertEqual(cache.get(cache_mapper.get_exercise_days_key(1)), set([1, 5]))
+
+        Set.objects.get(pk=2).exercises.remove(Exercise.objects.get(pk=2))
+        self.assertFalse(cache.get(cache_mapper.get_exercise_days_key(2)))
+        self.assertEqual(get_exercise_day_ids([1, 2]), {1: set([1, 5]), 2: set([5])})
 
 
 # TODO: fix test, all registered users can upload exercises
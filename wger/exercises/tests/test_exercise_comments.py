@@ -126,11 +126,11 @@ class WorkoutCacheTestCase(WorkoutManagerTestCase):
         comment = ExerciseComment.objects.get(pk=1)
         for set in comment.exercise.set_set.all():
             set.exerciseday.training.canonical_representation
-            workout_id = set.exerciseday.training_id
-            self.assertTrue(cache.get(cache_mapper.get_workout_canonical(workout_id)))
+            day_id = set.exerciseday_id
+            self.assertTrue(cache.get(cache_mapper.get_day_canonical(day_id)))
 
             comment.save()
-            self.assertFalse(cache.get(cache_mapper.get_workout_canonical(workout_id)))
+            self.assertFalse(cache.get(cache_mapper.get_day_canonical(day_id)))
 
     def test_canonical_form_cache_delete(self):
         '''
@@ -138,16 +138,15 @@ class WorkoutCacheTestCase(WorkoutManagerTestCase):
         '''
         comment = ExerciseComment.objects.get(pk=1)
 
-        workout_ids = []
+        day_ids = []
         for set in comment.exercise.set_set.all():
-            workout_id = set.exerciseday.training_id
-            workout_ids.append(workout_id)
+            day_ids.append(set.exerciseday_id)
             set.exerciseday.training.canonical_representation
-            self.assertTrue(cache.get(cache_mapper.get_workout_canonical(workout_id)))
+            self.assertTrue(cache.get(cache_mapper.get_day_canonical(set.exerciseday_id)))
 
         comment.delete()
-        for workout_id in workout_ids:
-            self.assertFalse(cache.get(cache_mapper.get_workout_canonical(workout_id)))
+        for day_id in day_ids:
+            self.assertFalse(cache.get(cache_mapper.get_day_canonical(day_id)))
 
 
 class ExerciseCommentApiTestCase(api_base_test.ApiBaseResourceTestCase):
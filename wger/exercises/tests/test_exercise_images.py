@@ -12,6 +12,7 @@
 #
 # You should have received a copy of the GNU Affero General Public License
 
+from django.core.cache import cache
 from django.core.files import File
 from django.core.urlresolvers import reverse
 
@@ -21,7 +22,13 @@ from wger.core.tests.base_testcase import (
     WorkoutManagerAddTestCase,
     WorkoutManagerDeleteTestCase
 )
+from wger.exercises.helpers import (
+    ThumbnailPipeline,
+    get_existing_thumbnails,
+    thumbnail_pipeline
+)
 from wger.exercises.models import Exercise, ExerciseImage
+from wger.utils.cache import cache_mapper
 
 
 class MainImageTestCase(WorkoutManagerTestCase):
@@ -148,3 +155,92 @@ class DeleteExerciseImageTestCase(WorkoutManagerDeleteTestCase):
 #     data = {'is_main': 'true',
 #             'exercise': '1',
 #             'id': 1}
+
+
+class ThumbnailPipelineTestCase(WorkoutManagerTestCase):
+    '''
+    Tests the background generation of the thumbnails
+    '''
+
+    def setUp(self):
+        super(ThumbnailPipelineTestCase, self).setUp()
+        self.image = ExerciseImage()
+        self.image.exercise = Exercise.objects.get(pk=2)
+        self.image.status = ExerciseImage.STATUS_ACCEPTED
+        self.image.image.save('protestschwein.jpg',
+                              File(open('wger/exercises/tests/protestschwein.jpg', 'rb')))
+        self.image.save()
+
+    def test_backfill_synchronous(self):
+        '''
+        Test generating the thumbnails without worker processes
+        '''
+        progress = []
+        self.assertIn(None, get_existing_thumbnails(self.image).values())
+
+        pipeline = ThumbnailPipeline(processes=0)
+        errors = pipeline.backfill([self.image], lambda done, total: progress.append(total))
+        self.assertEqual(errors, {})
+        self.assertNotIn(None, get_existing_thumbnails(self.image).values())
+        self.assertEqual(progress, [1])
+
+        # Nothing left to do
+        self.assertEqual(pipeline.backfill([self.image]), {})
+
+    def test_worker_processes(self):
+        '''
+        Test generating the thumbnails in the worker processes
+        '''
+        progress = []
+        pipeline = ThumbnailPipeline(processes=1)
+        pipeline.queue(self.image)
+        self.assertTrue(pipeline.is_pending(self.image.pk))
+
+        self.assertEqual(pipeline.wait(lambda done, total: progress.append((done, total))), {})
+        pipeline.close()
+        self.assertFalse(pipeline.is_pending(self.image.pk))
+        self.assertNotIn(None, get_existing_thumbnails(self.image).values())
+        self.assertEqual(progress, [(1, 1)])
+
+    def test_search_index_update(self):
+        '''
+        Test that the search index is only updated outside of the done callback
+        '''
+        pipeline = ThumbnailPipeline(processes=0)
+        pipeline.queue(self.image)
+        self.assertEqual(pipeline.finished, {self.image.exercise_id})
+
+        pipeline.update_search_index()
+        self.assertEqual(pipeline.finished, set())
+
+    def test_done_error(self):
+        '''
+        Test that errors in the done callback don't propagate
+        '''
+        pipeline = ThumbnailPipeline(processes=0)
+        pipeline.done(None)
+        pipeline.done((self.image.pk, 'Broken image'))
+        self.assertEqual(pipeline.errors, {self.image.pk: 'Broken image'})
+        self.assertEqual(pipeline.finished, set())
+
+    def test_api_placeholders(self):
+        '''
+        Test that the API returns placeholders for pending thumbnails
+        '''
+        url = '/api/v2/exerciseimage/{0}/thumbnails/'.format(self.image.pk)
+        cache.set(cache_mapper.get_exercise_thumbnails_pending_key(self.image.pk), True)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['micro']['url'],
+                         '/static/images/icons/image-placeholder.svg')
+        self.assertEqual(response.data['original'], self.image.image.url)
+
+        cache.delete(cache_mapper.get_exercise_thumbnails_pending_key(self.image.pk))
+        processes = thumbnail_pipeline.processes
+        thumbnail_pipeline.processes = 0
+        try:
+            response = self.client.get(url)
+        finally:
+            thumbnail_pipeline.processes = processes
+        self.assertNotIn('placeholder', response.data['micro']['url'])
+        self.assertEqual(response.data['micro']['settings'], {'size': (30, 30)})
@@ -24,7 +24,12 @@ from wger.core.tests.base_testcase import (
     WorkoutManagerAddTestCase,
     WorkoutManagerAccessTestCase)
 from wger.exercises.models import Muscle
-from wger.utils.cache import get_template_cache_name
+from wger.manager.models import Workout
+from wger.utils.cache import (
+    cache_mapper,
+    get_template_cache_name,
+    get_versioned_template_cache_name
+)
 
 
 class MuscleRepresentationTestCase(WorkoutManagerTestCase):
@@ -123,9 +128,34 @@ class MuscleCacheTestCase(WorkoutManagerTestCase):
         '''
 
         if not self.is_mobile:
-            self.assertFalse(cache.get(get_template_cache_name('muscle-overview', 2)))
+            self.assertFalse(cache.get(get_versioned_template_cache_name('muscle-overview', 2)))
             self.client.get(reverse('exercise:muscle:overview'))
-            self.assertTrue(cache.get(get_template_cache_name('muscle-overview', 2)))
+            self.assertTrue(cache.get(get_versioned_template_cache_name('muscle-overview', 2)))
+
+    def test_delete_muscle(self):
+        '''
+        Test that deleting a muscle only resets the entries that depend on it
+        '''
+        for pk in (1, 2, 3):
+            self.client.get(reverse('exercise:exercise:view', kwargs={'id': pk}))
+        for workout in Workout.objects.all():
+            workout.canonical_representation
+        cache.set('unrelated-key', 'foobar')
+
+        Muscle.objects.get(pk=3).delete()
+
+        # Exercises 1 and 2 use the muscle, they are on days 1, 2 and 5
+        self.assertFalse(cache.get(cache_mapper.get_exercise_muscle_bg_key(1)))
+        self.assertFalse(cache.get(cache_mapper.get_exercise_muscle_bg_key(2)))
+        self.assertFalse(cache.get(get_template_cache_name('exercise-detail-muscles', 1, 2)))
+        for day_id in (1, 2, 5):
+            self.assertFalse(cache.get(cache_mapper.get_day_canonical(day_id)))
+
+        # Everything else survives
+        self.assertEqual(cache.get('unrelated-key'), 'foobar')
+        self.assertTrue(cache.get(cache_mapper.get_exercise_muscle_bg_key(3)))
+        self.assertTrue(cache.get(cache_mapper.get_day_canonical(3)))
+        self.assertTrue(cache.get(cache_mapper.get_workout_canonical(1)))
 
 
 class MuscleOverviewTestCase(WorkoutManagerAccessTestCase):
@@ -19,6 +19,8 @@ from django import forms
 from django.utils.translation import ugettext as _
 
 from wger.core.forms import UserPersonalInformationForm
+from wger.gym.models import Gym
+from wger.manager.models import Workout
 from wger.utils.widgets import BootstrapSelectMultiple
 
 
@@ -90,3 +92,37 @@ class GymUserAddForm(GymUserPermisssionForm, UserPersonalInformationForm):
         except User.DoesNotExist:
             return username
         raise forms.ValidationError(_("A user with that username already exists."))
+
+
+class WorkoutExportForm(forms.Form):
+    '''
+    Form used to export the workouts of all members of a gym
+    '''
+    images = forms.BooleanField(label=_('with images'),
+                                required=False)
+    comments = forms.BooleanField(label=_('with comments'),
+                                  required=False)
+
+
+class WorkoutCopyForm(forms.Form):
+    '''
+    Form used to copy a workout to several members of a gym
+    '''
+    workout = forms.ModelChoiceField(queryset=Workout.objects.none(),
+                                     label=_('Workout'))
+    members = forms.ModelMultipleChoiceField(queryset=User.objects.none(),
+                                             label=_('Members'),
+                                             widget=BootstrapSelectMultiple())
+    comment = forms.CharField(max_length=100,
+                              label=_('Description'),
+                              help_text=_('The goal or description of the new workouts, '
+                                          'leave empty to keep the current one.'),
+                              required=False)
+
+    def __init__(self, user, gym, *args, **kwargs):
+        '''
+        Only the user's own workouts can be copied to the members of the gym
+        '''
+        super(WorkoutCopyForm, self).__init__(*args, **kwargs)
+        self.fields['workout'].queryset = Workout.objects.filter(user=user)
+        self.fields['members'].queryset = Gym.objects.get_members(gym.pk)
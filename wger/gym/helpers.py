@@ -14,7 +14,43 @@
 #
 # You should have received a copy of the GNU Affero General Public License
 
-from wger.manager.models import WorkoutLog, WorkoutSession
+import datetime
+import functools
+import logging
+import multiprocessing
+import tempfile
+import threading
+import time
+import uuid
+import zipfile
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import connection
+from django.db.models import Max, Min, Q
+from django.utils import translation
+
+from wger.core.models import UserCache
+from wger.gym.models import Gym
+from wger.manager.helpers import get_workout_pdf_key, render_workout_pdf
+from wger.manager.models import Schedule, WorkoutLog, WorkoutSession
+from wger.utils.cache import cache_mapper, get_cached_pdf, set_cached_pdf
+from wger.utils.helpers import close_connections, get_commit_hook
+
+logger = logging.getLogger(__name__)
+
+# How long the state of a workout export and its file are available
+WORKOUT_EXPORT_TIMEOUT = 60 * 60 * 24
+
+# How often a running workout export saves its state, at least
+WORKOUT_EXPORT_HEARTBEAT = 60
+
+# After how long without an update a running workout export is considered
+# failed, e.g. because the process running it was stopped
+WORKOUT_EXPORT_STALE_TIMEOUT = 5 * 60
 
 
 def get_user_last_activity(user):
@@ -49,6 +85,176 @@ def get_user_last_activity(user):
     return last_activity
 
 
+def get_users_last_activity(**filters):
+    '''
+    Find out when several users were last active.
+
+    This does the same as get_user_last_activity, but for many users at once
+    with one aggregate query per table.
+
+    :param filters: lookups on the user_id field of the logs and sessions,
+                    e.g. user_id__in=[1, 2]
+    :return: a dictionary with the user IDs of the active users as keys and
+             their last activity as values
+    '''
+    last_activity = {}
+    for model in (WorkoutLog, WorkoutSession):
+        dates = model.objects.filter(**filters)\
+            .order_by()\
+            .values_list('user_id')\
+            .annotate(last=Max('date'))
+        for user_id, date in dates:
+            if user_id not in last_activity or last_activity[user_id] < date:
+                last_activity[user_id] = date
+    return last_activity
+
+
+def save_users_last_activity(last_activity, chunk_size=1000):
+    '''
+    Saves the last activity of several users in their user cache, with one
+    UPDATE for each date and chunk of users.
+
+    :param last_activity: a dictionary with user IDs as keys and their last
+                          activity (or None) as values
+    :param chunk_size: maximum number of users updated per query
+    :return: the number of updated cache entries
+    '''
+    users = {}
+    for user_id, date in last_activity.items():
+        users.setdefault(date, []).append(user_id)
+
+    updated = 0
+    for date, user_ids in users.items():
+        # Some databases limit the number of query parameters
+        size = min(chunk_size, connection.ops.bulk_batch_size(['user_id'], user_ids))
+        for i in range(0, len(user_ids), size):
+            updated += UserCache.objects.filter(user_id__in=user_ids[i:i + size])\
+                .update(last_activity=date)
+    return updated
+
+
+def update_users_last_activity(id_range, chunk_size=1000):
+    '''
+    Recalculates the last activity of the users with an ID in the given range
+    and saves it in their user cache.
+
+    Only the entries that changed are written.
+
+    :param id_range: tuple with the first and last user ID (both inclusive)
+    :param chunk_size: maximum number of users updated per query
+    :return: the number of updated cache entries
+    '''
+    start, end = id_range
+    last_activity = get_users_last_activity(user_id__gte=start, user_id__lte=end)
+
+    # Users that don't have a cache entry yet
+    missing = User.objects.filter(pk__range=(start, end), usercache__isnull=True)\
+        .values_list('pk', flat=True)
+    UserCache.objects.bulk_create([UserCache(user_id=user_id) for user_id in missing])
+
+    changed = {}
+    cached = UserCache.objects.filter(user_id__gte=start, user_id__lte=end)\
+        .values_list('user_id', 'last_activity')
+    for user_id, old_date in cached.iterator():
+        new_date = last_activity.get(user_id)
+        if new_date != old_date:
+            changed[user_id] = new_date
+    return save_users_last_activity(changed, chunk_size)
+
+
+def update_all_users_last_activity(chunk_size=1000, processes=1):
+    '''
+    Recalculates the last activity of all users
+
+    The users are processed in ranges of IDs, in parallel if more than one
+    process is used.
+
+    :param chunk_size: number of users processed and updated at a time
+    :param processes: number of worker processes
+    :return: the number of updated cache entries
+    '''
+    id_range = User.objects.aggregate(first=Min('pk'), last=Max('pk'))
+    if id_range['first'] is None:
+        return 0
+    ranges = [(start, start + chunk_size - 1)
+              for start in range(id_range['first'], id_range['last'] + 1, chunk_size)]
+
+    if processes <= 1:
+        return sum(update_users_last_activity(r, chunk_size) for r in ranges)
+
+    close_connections()
+    pool = multiprocessing.Pool(processes, initializer=close_connections)
+    try:
+        return sum(pool.imap_unordered(functools.partial(update_users_last_activity,
+                                                         chunk_size=chunk_size),
+                                       ranges))
+    finally:
+        pool.close()
+        pool.join()
+
+
+class LastActivityUpdate(object):
+    '''
+    Collects the changes to the last activity of the users during a
+    transaction and saves them at once when it is committed
+
+    A new log or session can only make the last activity more recent, so its
+    date is simply saved if it is later than the cached one. Deleting entries
+    or moving them to an earlier date needs the activity to be calculated
+    again.
+    '''
+
+    def __init__(self):
+        self.dates = {}
+        self.recalculate = set()
+
+    def add(self, user_pk, date=None):
+        '''
+        Add a change
+
+        :param user_pk: the ID of the user
+        :param date: the date of the new activity, None if the last activity
+                     needs to be calculated again
+        '''
+        if date is None:
+            self.recalculate.add(user_pk)
+        elif user_pk not in self.dates or self.dates[user_pk] < date:
+            self.dates[user_pk] = date
+
+    def __call__(self):
+        for user_pk, date in self.dates.items():
+            if user_pk not in self.recalculate:
+                UserCache.objects.filter(user_id=user_pk)\
+                    .filter(Q(last_activity__isnull=True) | Q(last_activity__lt=date))\
+                    .update(last_activity=date)
+
+        if self.recalculate:
+            last_activity = get_users_last_activity(user_id__in=self.recalculate)
+            save_users_last_activity({user_pk: last_activity.get(user_pk)
+                                      for user_pk in self.recalculate})
+
+
+def update_user_last_activity(user_pk, date=None):
+    '''
+    Update the cached last activity of a user when the current transaction
+    is committed, or right away if there is none.
+
+    All changes of the same transaction (or savepoint) are saved together,
+    see LastActivityUpdate.
+
+    :param user_pk: the ID of the user
+    :param date: the date of the new activity, None if the last activity
+                 needs to be calculated again
+    '''
+    update = get_commit_hook(LastActivityUpdate)
+    if update is None:
+        update = LastActivityUpdate()
+        update.add(user_pk, date)
+        update()
+    else:
+        update.add(user_pk, date)
+
+
 def is_any_gym_admin(user):
     '''
     Small utility that checks that the user object has any administrator
@@ -80,3 +286,186 @@ def get_permission_list(user):
         form_group_permission.append('manager')
 
     return form_group_permission
+
+
+def render_member_workout(params):
+    '''
+    Renders the current workout of a gym member
+
+    This is the function run by the worker processes of the workout export, so
+    it only receives and returns simple values.
+
+    :param params: tuple with the ID of the member, the images and comments
+                   flags, the language and the base URL of the installation
+    :return: tuple with the ID of the member, the file name of the PDF and its
+             content. The file name is None if the member has no workout and
+             False if it could not be rendered
+    '''
+    user_pk, images, comments, language, base_url = params
+    translation.activate(language)
+
+    user = User.objects.get(pk=user_pk)
+    workout, schedule = Schedule.objects.get_current_workout(user)
+    if not workout:
+        return user_pk, None, None
+
+    url = base_url + workout.get_absolute_url()
+    try:
+        cache_key = get_workout_pdf_key(workout, images, comments, False, url, user.username)
+        entry = get_cached_pdf(cache_key)
+        if entry is None:
+            content = render_workout_pdf(workout, images, comments, False, url, user.username)
+            entry = set_cached_pdf(cache_key, content)
+    except Exception:
+        logger.exception('Could not render workout %s', workout.pk)
+        return user_pk, False, None
+    return user_pk, 'Workout-{0}-{1}.pdf'.format(user.username, workout.pk), entry['content']
+
+
+def get_workout_export(job_id):
+    '''
+    Returns the state of a workout export
+
+    :return: a dictionary with the gym and the user that started the export,
+             its status ('running', 'done' or 'failed'), the number of members
+             and of the ones already processed, the members without workout,
+             the ones whose workout could not be rendered, the timestamp of
+             its last update and, when done, the name of the ZIP file in the
+             storage. None if the export does not exist (anymore)
+    '''
+    key = cache_mapper.get_gym_workout_export_key(job_id)
+    export = cache.get(key)
+    if export and export['status'] == 'running' \
+            and time.time() - export['updated'] > WORKOUT_EXPORT_STALE_TIMEOUT:
+        logger.error('The export %s of the workouts of gym %s stopped', job_id, export['gym'])
+        export['status'] = 'failed'
+        cache.set(key, export, WORKOUT_EXPORT_TIMEOUT)
+    return export
+
+
+def start_workout_export(gym, user, base_url, images=False, comments=False, processes=None):
+    '''
+    Starts exporting the current workouts of all members of a gym
+
+    The workouts are rendered by a pool of worker processes and written to a
+    ZIP file as they are done, all in a background thread. The progress can be
+    followed with get_workout_export, which needs a cache that is shared by
+    all processes of the installation.
+
+    :param base_url: the URL of the installation, used for the links in the PDFs
+    :param processes: number of worker processes, by default the
+                      PDF_EXPORT_PROCESSES setting. With 0 the workouts are
+                      rendered synchronously
+    :return: the ID of the export
+    '''
+    if processes is None:
+        processes = settings.WGER_SETTINGS['PDF_EXPORT_PROCESSES']
+
+    job_id = uuid.uuid4().hex
+    member_ids = list(Gym.objects.get_members(gym.pk).values_list('pk', flat=True))
+    cache.set(cache_mapper.get_gym_workout_export_key(job_id),
+              {'gym': gym.pk,
+               'user': user.pk,
+               'status': 'running',
+               'total': len(member_ids),
+               'done': 0,
+               'no_workout': [],
+               'errors': [],
+               'file': None,
+               'updated': time.time()},
+              WORKOUT_EXPORT_TIMEOUT)
+
+    params = [(pk, images, comments, translation.get_language(), base_url)
+              for pk in member_ids]
+    if not processes:
+        run_workout_export(job_id, params, processes)
+    else:
+        thread = threading.Thread(target=run_workout_export,
+                                  args=(job_id, params, processes))
+        thread.daemon = True
+        thread.start()
+    return job_id
+
+
+def delete_old_workout_exports(gym_pk):
+    '''
+    Deletes the ZIP files of a gym's exports that are not available anymore
+    '''
+    path = 'gym/exports/{0}'.format(gym_pk)
+    if not default_storage.exists(path):
+        return
+
+    limit = datetime.datetime.now() - datetime.timedelta(seconds=WORKOUT_EXPORT_TIMEOUT)
+    for filename in default_storage.listdir(path)[1]:
+        name = '{0}/{1}'.format(path, filename)
+        if default_storage.modified_time(name) < limit:
+            default_storage.delete(name)
+
+
+def get_export_results(results, heartbeat):
+    '''
+    Yields the results of the worker processes of a workout export
+
+    :param results: the iterator returned by the pool's imap_unordered
+    :param heartbeat: callable that is called while waiting for a result
+    '''
+    while True:
+        try:
+            yield results.next(WORKOUT_EXPORT_HEARTBEAT)
+        except multiprocessing.TimeoutError:
+            heartbeat()
+        except StopIteration:
+            return
+
+
+def run_workout_export(job_id, params, processes):
+    '''
+    Renders the workouts of an export and saves them to a ZIP file
+
+    :param params: list of parameters for render_member_workout
+    '''
+    key = cache_mapper.get_gym_workout_export_key(job_id)
+    state = cache.get(key)
+
+    def save_state():
+        state['updated'] = time.time()
+        cache.set(key, state, WORKOUT_EXPORT_TIMEOUT)
+
+    pool = None
+    try:
+        if processes:
+            close_connections()
+            pool = multiprocessing.Pool(processes, initializer=close_connections)
+            results = get_export_results(pool.imap_unordered(render_member_workout, params),
+                                         save_state)
+        else:
+            results = (render_member_workout(i) for i in params)
+
+        with tempfile.TemporaryFile() as export_file:
+            with zipfile.ZipFile(export_file, 'w') as zip_file:
+                for user_pk, filename, content in results:
+                    if filename:
+                        zip_file.writestr(filename, content)
+                    elif filename is None:
+                        state['no_workout'].append(user_pk)
+                    else:
+                        state['errors'].append(user_pk)
+                    state['done'] += 1
+                    save_state()
+
+            delete_old_workout_exports(state['gym'])
+            state['file'] = default_storage.save(
+                'gym/exports/{0}/{1}.zip'.format(state['gym'], job_id),
+                File(export_file))
+        state['status'] = 'done'
+    except Exception:
+        logger.exception('Could not export the workouts of gym %s', state['gym'])
+        state['status'] = 'failed'
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+        if processes:
+            close_connections()
+
+    save_state()
@@ -0,0 +1,84 @@
+# This file is part of wger Workout Manager.
+#
+# wger Workout Manager is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# wger Workout Manager is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+
+from django.contrib.auth.models import User
+from django.core.urlresolvers import reverse
+
+from wger.core.tests.base_testcase import WorkoutManagerTestCase
+from wger.manager.models import Workout
+
+
+class GymCopyWorkoutTestCase(WorkoutManagerTestCase):
+    '''
+    Test case for copying a workout to several gym members
+    '''
+
+    def copy_workout(self, fail=False):
+        '''
+        Helper function to test copying a workout to members of gym 1
+        '''
+        trainer = User.objects.get(username='trainer1')
+        workout = Workout.objects.get(pk=1).copy([trainer])[0]
+        members = list(User.objects.filter(username__in=('member1', 'member2')))
+        count_before = Workout.objects.count()
+
+        response = self.client.get(reverse('gym:gym:copy-workout', kwargs={'gym_pk': 1}))
+        self.assertEqual(response.status_code, 403 if fail else 200)
+
+        response = self.client.post(reverse('gym:gym:copy-workout', kwargs={'gym_pk': 1}),
+                                    {'workout': workout.pk,
+                                     'members': [member.pk for member in members],
+                                     'comment': 'Gym workout'})
+        if fail:
+            self.assertEqual(response.status_code, 403)
+            self.assertEqual(Workout.objects.count(), count_before)
+        else:
+            self.assertEqual(response.status_code, 302)
+            self.assertEqual(Workout.objects.count(), count_before + 2)
+            for member in members:
+                copy = Workout.objects.filter(user=member).latest('pk')
+                self.assertEqual(copy.comment, 'Gym workout')
+                self.assertEqual(copy.day_set.count(), workout.day_set.count())
+
+    def test_copy_trainer(self):
+        '''
+        Test copying a workout as a trainer of the gym
+        '''
+        self.user_login('trainer1')
+        self.copy_workout()
+
+    def test_copy_other_gym(self):
+        '''
+        Test copying a workout as a trainer of another gym
+        '''
+        self.user_login('trainer4')
+        self.copy_workout(fail=True)
+
+    def test_copy_member(self):
+        '''
+        Test copying a workout as a regular member
+        '''
+        self.user_login('member1')
+        self.copy_workout(fail=True)
+
+    def test_copy_foreign_workout(self):
+        '''
+        Test that only the trainer's own workouts can be copied
+        '''
+        self.user_login('trainer1')
+        response = self.client.post(reverse('gym:gym:copy-workout', kwargs={'gym_pk': 1}),
+                                    {'workout': 1,
+                                     'members': [User.objects.get(username='member1').pk]})
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(Workout.objects.filter(user__username='member1').exists())
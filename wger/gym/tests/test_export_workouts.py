@@ -0,0 +1,156 @@
+# This file is part of wger Workout Manager.
+#
+# wger Workout Manager is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# wger Workout Manager is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+
+import time
+import zipfile
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.urlresolvers import reverse
+from django.utils.six import BytesIO
+
+from wger.core.tests.base_testcase import WorkoutManagerTestCase
+from wger.gym.helpers import (
+    WORKOUT_EXPORT_STALE_TIMEOUT,
+    get_workout_export,
+    start_workout_export
+)
+from wger.gym.models import Gym
+from wger.manager.models import Workout
+from wger.utils.cache import cache_mapper
+
+
+class GymWorkoutExportTestCase(WorkoutManagerTestCase):
+    '''
+    Test case for the export of the workouts of gym members
+    '''
+
+    def tearDown(self):
+        for path in ('gym/exports/1', 'gym/exports'):
+            if default_storage.exists(path):
+                for filename in default_storage.listdir(path)[1]:
+                    default_storage.delete('{0}/{1}'.format(path, filename))
+        super(GymWorkoutExportTestCase, self).tearDown()
+
+    def test_export(self):
+        '''
+        Test exporting the workouts of all members
+        '''
+        gym = Gym.objects.get(pk=1)
+        members = Gym.objects.get_members(1)
+        job_id = start_workout_export(gym,
+                                      User.objects.get(username='manager1'),
+                                      'http://localhost',
+                                      processes=0)
+        export = get_workout_export(job_id)
+
+        self.assertEqual(export['status'], 'done')
+        self.assertEqual(export['total'], members.count())
+        self.assertEqual(export['done'], members.count())
+
+        with default_storage.open(export['file']) as export_file:
+            zip_file = zipfile.ZipFile(export_file)
+            names = zip_file.namelist()
+            self.assertEqual(len(names), members.count() - len(export['no_workout']))
+            for user in members.exclude(pk__in=export['no_workout']):
+                workout = Workout.objects.filter(user=user).latest('creation_date')
+                name = 'Workout-{0}-{1}.pdf'.format(user.username, workout.pk)
+                self.assertIn(name, names)
+                self.assertTrue(zip_file.read(name).startswith(b'%PDF'))
+
+        for user_pk in export['no_workout']:
+            self.assertFalse(Workout.objects.filter(user_id=user_pk).exists())
+
+    def test_export_views(self):
+        '''
+        Test starting an export, following its progress and downloading it
+        '''
+        self.user_login('manager1')
+        response = self.client.get(reverse('gym:export:workouts', kwargs={'gym_pk': 1}))
+        self.assertEqual(response.status_code, 200)
+
+        with self.settings(WGER_SETTINGS=dict(settings.WGER_SETTINGS, PDF_EXPORT_PROCESSES=0)):
+            response = self.client.post(reverse('gym:export:workouts', kwargs={'gym_pk': 1}),
+                                        {'images': 'on'})
+        self.assertEqual(response.status_code, 302)
+        job_id = response['Location'].rsplit('/', 1)[1]
+
+        response = self.client.get(reverse('gym:export:workouts-status',
+                                           kwargs={'job_id': job_id}))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['percent'], 100)
+        self.assertContains(response, reverse('gym:export:workouts-download',
+                                              kwargs={'job_id': job_id}))
+
+        response = self.client.get(reverse('gym:export:workouts-download',
+                                           kwargs={'job_id': job_id}))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/zip')
+        zip_file = zipfile.ZipFile(BytesIO(b''.join(response.streaming_content)))
+        self.assertTrue(zip_file.namelist())
+
+        # Only the user that started the export can access it
+        self.user_login('general_manager1')
+        response = self.client.get(reverse('gym:export:workouts-status',
+                                           kwargs={'job_id': job_id}))
+        self.assertEqual(response.status_code, 404)
+
+    def test_export_stale(self):
+        '''
+        Test that exports that stopped being updated are marked as failed
+        '''
+        job_id = 'a' * 32
+        state = {'gym': 1,
+                 'user': User.objects.get(username='manager1').pk,
+                 'status': 'running',
+                 'total': 10,
+                 'done': 2,
+                 'no_workout': [],
+                 'errors': [],
+                 'file': None,
+                 'updated': time.time()}
+        cache.set(cache_mapper.get_gym_workout_export_key(job_id), state)
+        self.assertEqual(get_workout_export(job_id)['status'], 'running')
+
+        state['updated'] -= WORKOUT_EXPORT_STALE_TIMEOUT + 1
+        cache.set(cache_mapper.get_gym_workout_export_key(job_id), state)
+        self.user_login('manager1')
+        response = self.client.get(reverse('gym:export:workouts-status',
+                                           kwargs={'job_id': job_id}))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['export']['status'], 'failed')
+        self.assertEqual(get_workout_export(job_id)['status'], 'failed')
+
+    def test_export_trainer(self):
+        '''
+        Test that the trainers of the gym can export the workouts
+        '''
+        self.user_login('trainer1')
+        response = self.client.get(reverse('gym:export:workouts', kwargs={'gym_pk': 1}))
+        self.assertEqual(response.status_code, 200)
+
+    def test_export_unauthorized(self):
+        '''
+        Test that unauthorized users can't export the workouts
+        '''
+        for username in ('manager3', 'test', 'member1', 'trainer4'):
+            self.user_login(username)
+            response = self.client.get(reverse('gym:export:workouts', kwargs={'gym_pk': 1}))
+            self.assertEqual(response.status_code, 403)
+
+        self.user_logout()
+        response = self.client.get(reverse('gym:export:workouts', kwargs={'gym_pk': 1}))
+        self.assertEqual(response.status_code, 302)
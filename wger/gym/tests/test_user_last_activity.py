@@ -15,9 +15,17 @@
 import datetime
 
 from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import transaction
+from django.utils.six import StringIO
 
-from wger.core.tests.base_testcase import WorkoutManagerTestCase
-from wger.gym.helpers import get_user_last_activity
+from wger.core.models import UserCache
+from wger.core.tests.base_testcase import WorkoutManagerTestCase, run_commit_hooks
+from wger.gym.helpers import (
+    get_user_last_activity,
+    update_all_users_last_activity,
+    LastActivityUpdate
+)
 from wger.manager.models import WorkoutSession, WorkoutLog
 
 
@@ -43,6 +51,7 @@ class UserLastActivityTestCase(WorkoutManagerTestCase):
         log.save()
         session.date = datetime.date(2014, 10, 1)
         session.save()
+        run_commit_hooks(LastActivityUpdate)
         user = User.objects.get(username='admin')
         self.assertEqual(get_user_last_activity(user), datetime.date(2014, 10, 2))
         self.assertEqual(user.usercache.last_activity, datetime.date(2014, 10, 2))
@@ -52,12 +61,125 @@ class UserLastActivityTestCase(WorkoutManagerTestCase):
         log.save()
         session.date = datetime.date(2014, 10, 5)
         session.save()
+        run_commit_hooks(LastActivityUpdate)
         user = User.objects.get(username='admin')
         self.assertEqual(get_user_last_activity(user), datetime.date(2014, 10, 5))
         self.assertEqual(user.usercache.last_activity, datetime.date(2014, 10, 5))
 
         # No logs, but session
         WorkoutLog.objects.filter(user=user).delete()
+        run_commit_hooks(LastActivityUpdate)
         user = User.objects.get(username='admin')
         self.assertEqual(get_user_last_activity(user), datetime.date(2014, 10, 5))
         self.assertEqual(user.usercache.last_activity, datetime.date(2014, 10, 5))
+
+
+class UpdateUserLastActivityTestCase(WorkoutManagerTestCase):
+    '''
+    Test that the cached last activity is kept up to date
+    '''
+
+    def get_last_activity(self):
+        '''
+        Helper function that returns the cached last activity of the admin user
+        '''
+        return UserCache.objects.get(user__username='admin').last_activity
+
+    def test_new_log(self):
+        '''
+        Test that a new log only updates the cache if it is more recent
+        '''
+        user = User.objects.get(username='admin')
+        log = WorkoutLog.objects.get(pk=1)
+
+        for date in (datetime.date(2014, 1, 10), datetime.date(2014, 2, 10)):
+            log.pk = None
+            log.date = date
+            log.save()
+
+        # One conditional update for the whole transaction
+        with self.assertNumQueries(1):
+            run_commit_hooks(LastActivityUpdate)
+        self.assertEqual(self.get_last_activity(), datetime.date(2014, 2, 10))
+        self.assertEqual(get_user_last_activity(user), datetime.date(2014, 2, 10))
+
+    def test_earlier_date(self):
+        '''
+        Test that the activity is calculated again if an entry is moved back
+        '''
+        log = WorkoutLog.objects.get(pk=1)
+        log.date = datetime.date(2014, 3, 1)
+        log.save()
+        run_commit_hooks(LastActivityUpdate)
+        self.assertEqual(self.get_last_activity(), datetime.date(2014, 3, 1))
+
+        log.date = datetime.date(2014, 1, 1)
+        log.save()
+        run_commit_hooks(LastActivityUpdate)
+        self.assertEqual(self.get_last_activity(), datetime.date(2014, 1, 30))
+
+    def test_delete(self):
+        '''
+        Test that the activity is calculated again after deleting entries
+        '''
+        WorkoutSession.objects.filter(user__username='admin').delete()
+        run_commit_hooks(LastActivityUpdate)
+        self.assertEqual(self.get_last_activity(), datetime.date(2013, 10, 30))
+
+        WorkoutLog.objects.filter(user__username='admin').delete()
+        run_commit_hooks(LastActivityUpdate)
+        self.assertEqual(self.get_last_activity(), None)
+
+    def test_rollback(self):
+        '''
+        Test that changes of a rolled back savepoint are not saved
+        '''
+        log = WorkoutLog.objects.get(pk=1)
+        try:
+            with transaction.atomic():
+                log.pk = None
+                log.date = datetime.date(2015, 1, 1)
+                log.save()
+                raise ValueError
+        except ValueError:
+            pass
+
+        run_commit_hooks(LastActivityUpdate)
+        self.assertEqual(self.get_last_activity(), datetime.date(2014, 1, 30))
+
+
+class UpdateUsersLastActivityTestCase(WorkoutManagerTestCase):
+    '''
+    Test recalculating the last activity of all users at once
+    '''
+
+    def assert_last_activity(self):
+        '''
+        Helper function that compares the cached values with the calculated ones
+        '''
+        for user in User.objects.select_related('usercache'):
+            self.assertEqual(user.usercache.last_activity, get_user_last_activity(user))
+
+    def test_update(self):
+        '''
+        Test that the cached values are corrected and only changed ones written
+        '''
+        UserCache.objects.update(last_activity=datetime.date(2010, 1, 1))
+        UserCache.objects.filter(user__username='test').delete()
+        WorkoutLog.objects.filter(pk=1).update(date=datetime.date(2015, 3, 2))
+
+        updated = update_all_users_last_activity(chunk_size=3)
+        self.assertEqual(updated, User.objects.count())
+        self.assert_last_activity()
+        self.assertEqual(User.objects.get(username='admin').usercache.last_activity,
+                         datetime.date(2015, 3, 2))
+
+        self.assertEqual(update_all_users_last_activity(chunk_size=3), 0)
+
+    def test_command(self):
+        '''
+        Test the update-user-cache command
+        '''
+        UserCache.objects.update(last_activity=None)
+        call_command('update-user-cache', chunk_size=2, stdout=StringIO())
+        self.assert_last_activity()
@@ -51,6 +51,9 @@ patterns_gym = [
     url(r'^(?P<gym_pk>\d+)/add-member$',
         gym.GymAddUserView.as_view(),
         name='add-user'),
+    url(r'^(?P<gym_pk>\d+)/copy-workout$',
+        gym.copy_workout,
+        name='copy-workout'),
     url(r'^add$',
         gym.GymAddView.as_view(),
         name='add'),
@@ -175,6 +178,15 @@ patterns_export = [
     url(r'^users/(?P<gym_pk>\d+)$',
         export.users,
         name='users'),
+    url(r'^workouts/(?P<gym_pk>\d+)$',
+        export.workouts,
+        name='workouts'),
+    url(r'^workouts/status/(?P<job_id>[0-9a-f]{32})$',
+        export.workouts_status,
+        name='workouts-status'),
+    url(r'^workouts/download/(?P<job_id>[0-9a-f]{32})$',
+        export.workouts_download,
+        name='workouts-download'),
 ]
 
 #
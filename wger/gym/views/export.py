@@ -20,13 +20,20 @@ import datetime
 import logging
 
 from django.contrib.auth.decorators import login_required
+from django.core.files.storage import default_storage
+from django.core.urlresolvers import reverse
+from django.http import Http404
 from django.http.response import (
+    FileResponse,
     HttpResponseForbidden,
+    HttpResponseRedirect,
     HttpResponse
 )
-from django.shortcuts import get_object_or_404
+from django.shortcuts import get_object_or_404, render
 from django.utils.translation import ugettext as _
 
+from wger.gym.forms import WorkoutExportForm
+from wger.gym.helpers import get_workout_export, start_workout_export
 from wger.gym.models import Gym
 
 logger = logging.getLogger(__name__)
@@ -88,3 +95,97 @@ def users(request, gym_pk):
     response['Content-Disposition'] = 'attachment; filename={0}'.format(filename)
     response['Content-Length'] = len(response.content)
     return response
+
+
+def can_export(user, gym):
+    '''
+    Checks whether the user can export the workouts of the members of a gym
+
+    General managers can export the ones of all gyms, managers and trainers
+    only the ones of their own gym.
+    '''
+    if user.has_perm('gym.manage_gyms'):
+        return True
+
+    return (user.has_perm('gym.manage_gym') or user.has_perm('gym.gym_trainer')) \
+        and user.userprofile.gym_id == gym.pk
+
+
+@login_required
+def workouts(request, gym_pk):
+    '''
+    Starts exporting the current workouts of all members in selected gym
+
+    The workouts are rendered in the background, the user is redirected to a
+    page showing the progress of the export and, when done, the link to the
+    ZIP file with the PDFs.
+    '''
+    gym = get_object_or_404(Gym, pk=gym_pk)
+    if not can_export(request.user, gym):
+        return HttpResponseForbidden()
+
+    if request.method == 'POST':
+        form = WorkoutExportForm(request.POST)
+        if form.is_valid():
+            job_id = start_workout_export(gym,
+                                          request.user,
+                                          request.build_absolute_uri('/').rstrip('/'),
+                                          images=form.cleaned_data['images'],
+                                          comments=form.cleaned_data['comments'])
+            return HttpResponseRedirect(reverse('gym:export:workouts-status',
+                                                kwargs={'job_id': job_id}))
+    else:
+        form = WorkoutExportForm()
+
+    context = {'title': _('Export workouts'),
+               'form': form,
+               'form_action': reverse('gym:export:workouts', kwargs={'gym_pk': gym.pk}),
+               'submit_text': _('Export'),
+               'extend_template': 'base.html'}
+    return render(request, 'form.html', context)
+
+
+def get_export_or_404(request, job_id):
+    '''
+    Loads a workout export, which only the user that started it can access
+    '''
+    export = get_workout_export(job_id)
+    if export is None or export['user'] != request.user.pk:
+        raise Http404
+    return export
+
+
+@login_required
+def workouts_status(request, job_id):
+    '''
+    Shows the progress of a workout export
+    '''
+    export = get_export_or_404(request, job_id)
+    gym = get_object_or_404(Gym, pk=export['gym'])
+    if not can_export(request.user, gym):
+        return HttpResponseForbidden()
+
+    context = {'gym': gym,
+               'export': export,
+               'job_id': job_id,
+               'percent': export['done'] * 100 // export['total'] if export['total'] else 100}
+    return render(request, 'gym/workout_export.html', context)
+
+
+@login_required
+def workouts_download(request, job_id):
+    '''
+    Sends the ZIP file of a finished workout export
+    '''
+    export = get_export_or_404(request, job_id)
+    gym = get_object_or_404(Gym, pk=export['gym'])
+    if not can_export(request.user, gym):
+        return HttpResponseForbidden()
+
+    if export['status'] != 'done':
+        raise Http404
+
+    response = FileResponse(default_storage.open(export['file']),
+                            content_type='application/zip')
+    response['Content-Disposition'] = 'attachment; filename=Workouts-gym-{0}.zip'.format(gym.pk)
+    return response
@@ -39,7 +39,7 @@ from django.views.generic import (
     UpdateView
 )
 
-from wger.gym.forms import GymUserAddForm, GymUserPermisssionForm
+from wger.gym.forms import GymUserAddForm, GymUserPermisssionForm, WorkoutCopyForm
 from wger.gym.helpers import (
     get_user_last_activity,
     is_any_gym_admin,
@@ -460,3 +460,33 @@ class GymDeleteView(WgerDeleteMixin, LoginRequiredMixin, PermissionRequiredMixin
         context['title'] = _(u'Delete {0}?').format(self.object)
         context['form_action'] = reverse('gym:gym:delete', kwargs={'pk': self.kwargs['pk']})
         return context
+
+
+@login_required
+def copy_workout(request, gym_pk):
+    '''
+    Copies one of the user's workouts to several members of the gym at once
+    '''
+    gym = get_object_or_404(Gym, pk=gym_pk)
+
+    if not request.user.has_perm('gym.manage_gyms') \
+            and not ((request.user.has_perm('gym.manage_gym')
+                      or request.user.has_perm('gym.gym_trainer'))
+                     and request.user.userprofile.gym_id == gym.pk):
+        return HttpResponseForbidden()
+
+    if request.method == 'POST':
+        form = WorkoutCopyForm(request.user, gym, request.POST)
+        if form.is_valid():
+            comment = form.cleaned_data['comment'] or None
+            form.cleaned_data['workout'].copy(form.cleaned_data['members'], comment=comment)
+            return HttpResponseRedirect(reverse('gym:gym:user-list', kwargs={'pk': gym.pk}))
+    else:
+        form = WorkoutCopyForm(request.user, gym)
+
+    context = {'title': _('Copy workout to members'),
+               'form': form,
+               'form_action': reverse('gym:gym:copy-workout', kwargs={'gym_pk': gym.pk}),
+               'submit_text': _('Copy'),
+               'extend_template': 'base.html'}
+    return render(request, 'form.html', context)
@@ -64,6 +64,14 @@ class WorkoutLogSerializer(serializers.ModelSerializer):
         exclude = ('user',)
 
 
+class WorkoutLogBulkSerializer(serializers.Serializer):
+    '''
+    Serializer to save several workout logs and their session at once
+    '''
+    logs = WorkoutLogSerializer(many=True)
+    session = WorkoutSessionSerializer(required=False)
+
+
 class ScheduleStepSerializer(serializers.ModelSerializer):
     '''
     ScheduleStep serializer
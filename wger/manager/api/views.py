@@ -17,9 +17,9 @@
 
 import datetime
 
-from rest_framework import viewsets
+from rest_framework import exceptions, status, viewsets
 from rest_framework.response import Response
-from rest_framework.decorators import detail_route
+from rest_framework.decorators import detail_route, list_route
 
 from wger.manager.api.serializers import (
     WorkoutSerializer,
@@ -30,6 +30,7 @@ from wger.manager.api.serializers import (
     SetSerializer,
     ScheduleSerializer,
     WorkoutLogSerializer,
+    WorkoutLogBulkSerializer,
     WorkoutSessionSerializer
 )
 from wger.manager.models import (
@@ -43,6 +44,7 @@ from wger.manager.models import (
     WorkoutSession
 )
 from wger.utils.viewsets import WgerOwnerObjectModelViewSet
+from wger.weight.helpers import save_workout_logs
 
 
 class WorkoutViewSet(viewsets.ModelViewSet):
@@ -272,6 +274,29 @@ class WorkoutLogViewSet(WgerOwnerObjectModelViewSet):
         '''
         serializer.save(user=self.request.user)
 
+    @list_route(methods=['post'])
+    def bulk(self, request):
+        '''
+        Save several workout logs at once, e.g. all the logs of a workout day
+
+        Optionally a workout session can be passed as well, if there is already
+        one for its date it is updated.
+        '''
+        serializer = WorkoutLogBulkSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        logs = [WorkoutLog(**data) for data in serializer.validated_data['logs']]
+        session = serializer.validated_data.get('session')
+
+        workouts = {log.workout for log in logs}
+        if session:
+            workouts.add(session['workout'])
+        if any(workout.get_owner_object().user != request.user for workout in workouts):
+            raise exceptions.PermissionDenied('You are not allowed to do this')
+
+        session = save_workout_logs(request.user, logs, session)
+        return Response({'logs': len(logs), 'session': session.pk if session else None},
+                        status=status.HTTP_201_CREATED)
+
     def get_owner_objects(self):
         '''
         Return objects to check for ownership permission
@@ -19,9 +19,12 @@ import datetime
 from calendar import HTMLCalendar
 
 from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4
 from reportlab.lib.units import cm
 from reportlab.platypus import (
     Paragraph,
+    SimpleDocTemplate,
+    Spacer,
     Table,
     KeepTogether,
     ListFlowable,
@@ -30,10 +33,15 @@ from reportlab.platypus import (
 )
 
 from django.core.urlresolvers import reverse
+from django.utils import translation
+from django.utils.six import BytesIO
 from django.utils.translation import ugettext as _
+from wger import get_version
+from wger.utils.cache import get_pdf_cache_key
 from wger.utils.helpers import normalize_decimal
 
 from wger.utils.pdf import styleSheet
+from wger.utils.pdf import render_footer
 
 
 def render_workout_day(day, nr_of_weeks=7, images=False, comments=False, only_table=False):
@@ -189,6 +197,85 @@ def render_workout_day(day, nr_of_weeks=7, images=False, comments=False, only_ta
     return KeepTogether(t)
 
 
+def get_workout_pdf_key(workout, images, comments, only_table, url, username):
+    '''
+    Returns the key of a workout's rendered PDF
+
+    The key depends on the version of the workout's canonical representation,
+    which changes whenever the workout, its days or their exercises are edited.
+
+    :param url: the absolute URL of the workout, shown in the footer
+    :param username: the name of the user the PDF is rendered for
+    '''
+    return get_pdf_cache_key('workout',
+                             workout.pk,
+                             workout.canonical_representation['version'],
+                             images,
+                             comments,
+                             only_table,
+                             translation.get_language(),
+                             workout.user.userprofile.weight_unit,
+                             username,
+                             url,
+                             datetime.date.today(),
+                             get_version())
+
+
+def render_workout_pdf(workout, images, comments, only_table, url, username):
+    '''
+    Renders a PDF with the contents of the given workout
+
+    See also
+    * http://www.blog.pythonlibrary.org/2010/09/21/reportlab
+    * http://www.reportlab.com/apis/reportlab/dev/platypus.html
+
+    :param only_table: boolean indicating whether to render the days without
+           the table for the logs
+    :param url: the absolute URL of the workout, shown in the footer
+    :param username: the name of the user the PDF is rendered for
+    :return: the content of the PDF
+    '''
+    buffer = BytesIO()
+
+    # Create the PDF object, using the buffer as its "file."
+    doc = SimpleDocTemplate(buffer,
+                            pagesize=A4,
+                            # pagesize = landscape(A4),
+                            leftMargin=cm,
+                            rightMargin=cm,
+                            topMargin=0.5 * cm,
+                            bottomMargin=0.5 * cm,
+                            title=_('Workout'),
+                            author='wger Workout Manager',
+                            subject=_('Workout for %s') % username)
+
+    # container for the 'Flowable' objects
+    elements = []
+
+    # Set the title
+    p = Paragraph('<para align="center"><strong>%(description)s</strong></para>' %
+                  {'description': workout},
+                  styleSheet["HeaderBold"])
+    elements.append(p)
+    elements.append(Spacer(10 * cm, 0.5 * cm))
+
+    # Iterate through the Workout and render the training days
+    for day in workout.canonical_representation['day_list']:
+        elements.append(render_workout_day(day,
+                                           images=images,
+                                           comments=comments,
+                                           only_table=only_table))
+        elements.append(Spacer(10 * cm, 0.5 * cm))
+
+    # Footer, date and info
+    elements.append(Spacer(10 * cm, 0.5 * cm))
+    elements.append(render_footer(url))
+
+    # write the document
+    doc.build(elements)
+    return buffer.getvalue()
+
+
 def reps_smart_text(settings, set_obj):
     '''
     "Smart" textual representation
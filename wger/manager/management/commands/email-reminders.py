@@ -15,17 +15,19 @@
 # You should have received a copy of the GNU Affero General Public License
 
 import datetime
+from optparse import make_option
 
 from django.template import loader
 from django.core.management.base import BaseCommand
 from django.core import mail
-from django.utils.translation import ugettext_lazy as _
+from django.db.models import Q
+from django.utils.translation import ugettext as _
 from django.utils import translation
 from django.conf import settings
 
 from django.contrib.sites.models import Site
 from wger.core.models import UserProfile
-from wger.manager.models import Schedule
+from wger.manager.models import Schedule, Workout
 
 
 class Command(BaseCommand):
@@ -33,92 +35,141 @@ class Command(BaseCommand):
     Helper admin command to send out email reminders
     '''
 
+    option_list = BaseCommand.option_list + (
+        make_option('--batch-size',
+                    action='store',
+                    type='int',
+                    dest='batch_size',
+                    default=100,
+                    help='Number of users that are checked and notified at a time '
+                         '(default: 100)'),
+    )
+
     help = 'Send out automatic email reminders for workouts'
 
     def handle(self, **options):
         '''
         Find if the currently active workout is overdue
+
+        The users are processed in batches, the schedules and workouts of each
+        batch are loaded together and the emails sent over one connection.
         '''
-        profile_list = UserProfile.objects.filter(workout_reminder_active=True)
+        today = datetime.date.today()
+        batch_size = max(options['batch_size'], 1)
+
+        # Only users that have provided an email address and that were not
+        # notified in the last week
+        profile_list = list(UserProfile.objects
+                            .filter(workout_reminder_active=True)
+                            .exclude(Q(user__email__isnull=True) | Q(user__email=''))
+                            .filter(Q(last_workout_notification__isnull=True) |
+                                    Q(last_workout_notification__lte=today -
+                                      datetime.timedelta(weeks=1)))
+                            .select_related('user', 'notification_language')
+                            .order_by('pk'))
+
+        site = Site.objects.get_current()
+        connection = mail.get_connection(fail_silently=True)
+        connection.open()
         counter = 0
-        for profile in profile_list:
-
-            # Only continue if the user has provided an email address.
-            # Checking it here so we check for NULL values and emtpy strings
-            if not profile.user.email:
-                continue
-
-            # Check if we already notified the user and update the profile otherwise
-            if profile.last_workout_notification and \
-               (datetime.date.today()
-                    - profile.last_workout_notification
-                    < datetime.timedelta(weeks=1)):
-                continue
-
-            (current_workout, schedule) = Schedule.objects.get_current_workout(profile.user)
-
-            # No schedules, use the default workout length in user profile
-            if not schedule and current_workout:
-                delta = (current_workout.creation_date
-                         + datetime.timedelta(weeks=profile.workout_duration)
-                         - datetime.date.today())
-
-                if datetime.timedelta(days=profile.workout_reminder) > delta:
+        try:
+            for i in range(0, len(profile_list), batch_size):
+                batch = profile_list[i:i + batch_size]
+                user_ids = [profile.user_id for profile in batch]
+
+                schedules = {}
+                for schedule in Schedule.objects.filter(user_id__in=user_ids, is_active=True)\
+                        .prefetch_related('schedulestep_set__workout'):
+                    schedules[schedule.user_id] = schedule
+
+                workouts = {}
+                for workout in Workout.objects.filter(user_id__in=user_ids)\
+                        .order_by('creation_date', 'pk'):
+                    workouts[workout.user_id] = workout
+
+                messages = []
+                notified = []
+                for profile in batch:
+                    overdue = self.get_overdue_workout(profile,
+                                                       schedules.get(profile.user_id),
+                                                       workouts.get(profile.user_id),
+                                                       today)
+                    if overdue is None:
+                        continue
+
+                    workout, delta = overdue
                     if int(options['verbosity']) >= 3:
-                        self.stdout.write("* Workout '{0}' overdue".format(current_workout))
-                    counter += 1
-
-                    self.send_email(profile.user,
-                                    current_workout,
-                                    delta)
-
-            # non-loop schedule, take the step's duration
-            elif schedule and not schedule.is_loop:
+                        self.stdout.write("* Workout '{0}' overdue".format(workout))
+                    messages.append(self.get_email(profile, workout, delta, site))
+                    notified.append(profile.pk)
+
+                if messages:
+                    # Update the last notification date field
+                    UserProfile.objects.filter(pk__in=notified)\
+                        .update(last_workout_notification=today)
+                    connection.send_messages(messages)
+                    counter += len(messages)
+        finally:
+            connection.close()
 
-                schedule_step = schedule.get_current_scheduled_workout()
-
-                # Only notify if the step is the last one in the schedule
-                if schedule_step == schedule.schedulestep_set.last():
+        if counter and int(options['verbosity']) >= 2:
+            self.stdout.write("Sent {0} email reminders".format(counter))
 
-                    delta = schedule.get_end_date() - datetime.date.today()
-                    if datetime.timedelta(days=profile.workout_reminder) > delta:
-                        if int(options['verbosity']) >= 3:
-                            self.stdout.write("* Workout '{0}' overdue - schedule".
-                                              format(schedule_step.workout))
+    @staticmethod
+    def get_overdue_workout(profile, schedule, workout, today):
+        '''
+        Checks whether the current workout of a user is about to expire
 
-                        counter += 1
-                        self.send_email(profile.user,
-                                        current_workout,
-                                        delta)
+        This follows Schedule.objects.get_current_workout, but works with the
+        already loaded active schedule, with its steps, and latest workout.
 
-        if counter and int(options['verbosity']) >= 2:
-            self.stdout.write("Sent {0} email reminders".format(counter))
+        :param schedule: the active schedule of the user or None
+        :param workout: the latest workout of the user or None
+        :return: a tuple with the workout and the time till it expires as a
+                 datetime.timedelta, or None if no reminder is needed
+        '''
+        steps = list(schedule.schedulestep_set.all()) if schedule else []
+        schedule_step = schedule.get_current_scheduled_workout() if steps else False
+
+        # non-loop schedule, take the step's duration. Only notify if the step
+        # is the last one in the schedule
+        if schedule_step:
+            if schedule.is_loop or schedule_step != steps[-1]:
+                return None
+            workout = schedule_step.workout
+            delta = schedule.get_end_date() - today
+
+        # No schedules, use the default workout length in user profile
+        elif workout:
+            delta = (workout.creation_date
+                     + datetime.timedelta(weeks=profile.workout_duration)
+                     - today)
+        else:
+            return None
+
+        if datetime.timedelta(days=profile.workout_reminder) > delta:
+            return workout, delta
+        return None
 
     @staticmethod
-    def send_email(user, workout, delta):
+    def get_email(profile, workout, delta, site):
         '''
-        Notify a user that a workout is about to expire
+        Composes the email that notifies a user that a workout is about to expire
 
-        :type user User
+        :type profile UserProfile
         :type workout Workout
         :type delta datetime.timedelta
+        :rtype mail.EmailMessage
         '''
-
-        # Update the last notification date field
-        user.userprofile.last_workout_notification = datetime.date.today()
-        user.userprofile.save()
-
-        # Compose and send the email
-        translation.activate(user.userprofile.notification_language.short_name)
-        context = {'site': Site.objects.get_current(),
-                   'workout': workout,
-                   'expired': True if delta.days < 0 else False,
-                   'days': abs(delta.days)}
-
-        subject = _('Workout will expire soon')
-        message = loader.render_to_string('workout/email_reminder.tpl', context)
-        mail.send_mail(subject,
-                       message,
-                       settings.WGER_SETTINGS['EMAIL_FROM'],
-                       [user.email],
-                       fail_silently=True)
+        with translation.override(profile.notification_language.short_name):
+            context = {'site': site,
+                       'workout': workout,
+                       'expired': True if delta.days < 0 else False,
+                       'days': abs(delta.days)}
+
+            subject = _('Workout will expire soon')
+            message = loader.render_to_string('workout/email_reminder.tpl', context)
+        return mail.EmailMessage(subject,
+                                 message,
+                                 settings.WGER_SETTINGS['EMAIL_FROM'],
+                                 [profile.user.email])
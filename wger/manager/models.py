@@ -15,12 +15,15 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with Workout Manager.  If not, see <http://www.gnu.org/licenses/>.
 
+import copy
 import datetime
+import hashlib
 import logging
+import uuid
 from django.utils.encoding import python_2_unicode_compatible
 
 import six
-from django.db import models
+from django.db import models, transaction
 from django.utils.translation import ugettext_lazy as _
 from django.contrib.auth.models import User
 from django.core.validators import MaxValueValidator
@@ -32,14 +35,15 @@ from django.core.validators import MinValueValidator
 from sortedm2m.fields import SortedManyToManyField
 
 from wger.core.models import DaysOfWeek, RepetitionUnit, WeightUnit
-from wger.exercises.models import Exercise
+from wger.exercises.models import Exercise, add_exercise_day_ids
 from wger.manager.helpers import reps_smart_text
 from wger.utils.cache import (
     cache_mapper,
-    reset_workout_canonical_form,
-    reset_workout_log
+    reset_day_canonical_form,
+    reset_workout_canonical_form
 )
 from wger.utils.fields import Html5DateField
+from wger.utils.helpers import bulk_copy, bulk_copy_m2m
 
 
 logger = logging.getLogger(__name__)
@@ -112,6 +116,31 @@ class Workout(models.Model):
         '''
         return self
 
+    @transaction.atomic
+    def copy(self, users, comment=None):
+        '''
+        Copies the workout with its days, sets and settings to each of the users
+
+        Only the workouts themselves are saved one by one, the rest is copied
+        with a bulk insert per model, regardless of the number of users.
+
+        :param users: the users that get a copy
+        :param comment: the description of the copies, None to keep the current one
+        :return: list with the copies, in the order of the users
+        '''
+        workout_copies = []
+        for user in users:
+            workout_copy = copy.copy(self)
+            workout_copy.pk = None
+            workout_copy.user = user
+            if comment is not None:
+                workout_copy.comment = comment
+            workout_copy.save()
+            workout_copies.append(workout_copy)
+
+        copy_workout_days({self.pk: [workout.pk for workout in workout_copies]})
+        return workout_copies
+
     @property
     def canonical_representation(self):
         '''
@@ -120,48 +149,63 @@ class Workout(models.Model):
         This form makes it easier to cache and use everywhere where all or part
         of a workout structure is needed. As an additional benefit, the template
         caches are not needed anymore.
+
+        Only a small index with the (sorted) IDs of the days is cached on the
+        workout level, the days themselves are cached individually so that
+        editing one of them doesn't invalidate the rest.
+
+        The index and the days get a new random version each time they are
+        built, the version of the whole representation is derived from them
+        and can be used e.g. in the keys of things rendered from it.
         '''
-        workout_canonical_form = cache.get(cache_mapper.get_workout_canonical(self.pk))
-        if not workout_canonical_form:
-            day_canonical_repr = []
-            muscles_front = []
-            muscles_back = []
-            muscles_front_secondary = []
-            muscles_back_secondary = []
+        day_list = None
+        workout_index = cache.get(cache_mapper.get_workout_canonical(self.pk))
+        if not workout_index or 'version' not in workout_index:
 
             # Sort list by weekday
-            day_list = [i for i in self.day_set.select_related()]
+            day_list = [i for i in Day.objects.filter(training_id=self.pk)
+                                              .prefetch_related('day')]
             day_list.sort(key=lambda day: day.get_first_day_id)
 
-            for day in day_list:
-                canonical_repr_day = day.get_canonical_representation()
-
-                # Collect all muscles
-                for i in canonical_repr_day['muscles']['front']:
-                    if i not in muscles_front:
-                        muscles_front.append(i)
-                for i in canonical_repr_day['muscles']['back']:
-                    if i not in muscles_back:
-                        muscles_back.append(i)
-                for i in canonical_repr_day['muscles']['frontsecondary']:
-                    if i not in muscles_front_secondary:
-                        muscles_front_secondary.append(i)
-                for i in canonical_repr_day['muscles']['backsecondary']:
-                    if i not in muscles_back_secondary:
-                        muscles_back_secondary.append(i)
-
-                day_canonical_repr.append(canonical_repr_day)
-
-            workout_canonical_form = {'obj': self,
-                                      'muscles': {'front': muscles_front,
-                                                  'back': muscles_back,
-                                                  'frontsecondary': muscles_front_secondary,
-                                                  'backsecondary': muscles_back_secondary},
-                                      'day_list': day_canonical_repr}
+            workout_index = {'obj': self,
+                             'day_ids': [day.pk for day in day_list],
+                             'version': uuid.uuid4().hex}
             # Save to cache
-            cache.set(cache_mapper.get_workout_canonical(self.pk), workout_canonical_form)
+            cache.set(cache_mapper.get_workout_canonical(self.pk), workout_index)
 
-        return workout_canonical_form
+        day_entries = get_canonical_day_entries(workout_index['day_ids'], day_list)
+        day_canonical_repr = [entry['day'] for entry in day_entries]
+        muscles_front = []
+        muscles_back = []
+        muscles_front_secondary = []
+        muscles_back_secondary = []
+
+        for canonical_repr_day in day_canonical_repr:
+            canonical_repr_day['obj'].training = workout_index['obj']
+
+            # Collect all muscles
+            for i in canonical_repr_day['muscles']['front']:
+                if i not in muscles_front:
+                    muscles_front.append(i)
+            for i in canonical_repr_day['muscles']['back']:
+                if i not in muscles_back:
+                    muscles_back.append(i)
+            for i in canonical_repr_day['muscles']['frontsecondary']:
+                if i not in muscles_front_secondary:
+                    muscles_front_secondary.append(i)
+            for i in canonical_repr_day['muscles']['backsecondary']:
+                if i not in muscles_back_secondary:
+                    muscles_back_secondary.append(i)
+
+        version = u':'.join([workout_index['version']] +
+                            [entry['version'] for entry in day_entries])
+        return {'obj': workout_index['obj'],
+                'version': hashlib.sha1(version.encode('utf-8')).hexdigest(),
+                'muscles': {'front': muscles_front,
+                            'back': muscles_back,
+                            'frontsecondary': muscles_front_secondary,
+                            'backsecondary': muscles_back_secondary},
+                'day_list': day_canonical_repr}
 
 
 class ScheduleManager(models.Manager):
@@ -416,6 +460,7 @@ class Day(models.Model):
         '''
 
         reset_workout_canonical_form(self.training_id)
+        reset_day_canonical_form(self.pk)
         super(Day, self).save(*args, **kwargs)
 
     def delete(self, *args, **kwargs):
@@ -424,6 +469,7 @@ class Day(models.Model):
         '''
 
         reset_workout_canonical_form(self.training_id)
+        reset_day_canonical_form(self.pk)
         super(Day, self).delete(*args, **kwargs)
 
     @property
@@ -431,123 +477,16 @@ class Day(models.Model):
         '''
         Return the canonical representation for this day
 
-        This is extracted from the workout representation because that one is cached
-        and this isn't.
+        This is read from the day's own cache entry, the rest of the workout is
+        not touched.
         '''
-        for i in self.training.canonical_representation['day_list']:
-            if int(i['obj'].pk) == int(self.pk):
-                return i
+        return get_canonical_days([self.pk])[0]
 
     def get_canonical_representation(self):
         '''
         Creates a canonical representation for this day
         '''
-        canonical_repr = []
-        muscles_front = []
-        muscles_back = []
-        muscles_front_secondary = []
-        muscles_back_secondary = []
-
-        for set_obj in self.set_set.select_related():
-            exercise_tmp = []
-            has_setting_tmp = True
-            for exercise in set_obj.exercises.select_related():
-                setting_tmp = []
-
-                # Muscles for this set
-                for muscle in exercise.muscles.all():
-                    if muscle.is_front and muscle.id not in muscles_front:
-                        muscles_front.append(muscle.id)
-                    elif not muscle.is_front and muscle.id not in muscles_back:
-                        muscles_back.append(muscle.id)
-
-                for muscle in exercise.muscles_secondary.all():
-                    if muscle.is_front and muscle.id not in muscles_front:
-                        muscles_front_secondary.append(muscle.id)
-                    elif not muscle.is_front and muscle.id not in muscles_back:
-                        muscles_back_secondary.append(muscle.id)
-
-                for setting in Setting.objects.filter(set=set_obj,
-                                                      exercise=exercise).order_by('order', 'id'):
-                    setting_tmp.append(setting)
-
-                # "Smart" textual representation
-                setting_text, setting_list, weight_list, reps_list, repetition_units, weight_units \
-                    = reps_smart_text(setting_tmp, set_obj)
-
-                # Flag indicating whether all exercises have settings
-                has_setting_tmp = True if len(setting_tmp) > 0 else False
-
-                # Exercise comments
-                comment_list = []
-                for i in exercise.exercisecomment_set.all():
-                    comment_list.append(i.comment)
-
-                # Flag indicating whether any of the settings has saved weight
-                has_weight = False
-                for i in setting_tmp:
-                    if i.weight:
-                        has_weight = True
-                        break
-
-                exercise_tmp.append({'obj': exercise,
-                                     'setting_obj_list': setting_tmp,
-                                     'setting_list': setting_list,
-                                     'repetition_units': repetition_units,
-                                     'weight_units': weight_units,
-                                     'weight_list': weight_list,
-                                     'has_weight': has_weight,
-                                     'reps_list': reps_list,
-                                     'setting_text': setting_text,
-                                     'comment_list': comment_list})
-
-            # If it's a superset, check that all exercises have the same repetitions.
-            # If not, just take the smallest number and drop the rest, because otherwise
-            # it doesn't make sense
-            if len(exercise_tmp) > 1:
-                common_reps = 100
-                for exercise in exercise_tmp:
-                    if len(exercise['setting_list']) < common_reps:
-                        common_reps = len(exercise['setting_list'])
-
-                for exercise in exercise_tmp:
-                    if len(exercise['setting_list']) > common_reps:
-                        exercise['setting_list'].pop(-1)
-                        exercise['setting_obj_list'].pop(-1)
-                        setting_text, setting_list, weight_list,\
-                            reps_list, repetition_units, weight_units = \
-                            reps_smart_text(exercise['setting_obj_list'], set_obj)
-                        exercise['setting_text'] = setting_text
-                        exercise['repetition_units'] = repetition_units
-
-            canonical_repr.append({'obj': set_obj,
-                                   'exercise_list': exercise_tmp,
-                                   'is_superset': True if len(exercise_tmp) > 1 else False,
-                                   'has_settings': has_setting_tmp,
-                                   'muscles': {
-                                       'back': muscles_back,
-                                       'front': muscles_front,
-                                       'frontsecondary': muscles_front_secondary,
-                                       'backsecondary': muscles_front_secondary
-                                   }})
-
-        # Days of the week
-        tmp_days_of_week = []
-        for day_of_week in self.day.select_related():
-            tmp_days_of_week.append(day_of_week)
-
-        return {'obj': self,
-                'days_of_week': {
-                    'text': u', '.join([six.text_type(_(i.day_of_week))
-                                       for i in tmp_days_of_week]),
-                    'day_list': tmp_days_of_week},
-                'muscles': {
-                    'back': muscles_back,
-                    'front': muscles_front,
-                    'frontsecondary': muscles_front_secondary,
-                    'backsecondary': muscles_front_secondary
-                },
-                'set_list': canonical_repr}
+        return CanonicalFormBuilder([self]).get_day(self)
 
 
 @python_2_unicode_compatible
@@ -590,7 +529,7 @@ class Set(models.Model):
         Reset all cached infos
         '''
 
-        reset_workout_canonical_form(self.exerciseday.training_id)
+        reset_day_canonical_form(self.exerciseday_id)
         super(Set, self).save(*args, **kwargs)
 
     def delete(self, *args, **kwargs):
@@ -598,7 +537,7 @@ class Set(models.Model):
         Reset all cached infos
         '''
 
-        reset_workout_canonical_form(self.exerciseday.training_id)
+        reset_day_canonical_form(self.exerciseday_id)
         super(Set, self).delete(*args, **kwargs)
 
 
@@ -662,7 +601,7 @@ class Setting(models.Model):
         '''
         Reset cache
         '''
-        reset_workout_canonical_form(self.set.exerciseday.training_id)
+        reset_day_canonical_form(self.set.exerciseday_id)
 
         # If the user selected "Until Failure", do only 1 "repetition",
         # everythin else doesn't make sense.
@@ -675,7 +614,7 @@ class Setting(models.Model):
         Reset cache
         '''
 
-        reset_workout_canonical_form(self.set.exerciseday.training_id)
+        reset_day_canonical_form(self.set.exerciseday_id)
         super(Setting, self).delete(*args, **kwargs)
 
     def get_owner_object(self):
@@ -685,6 +624,229 @@ class Setting(models.Model):
         return self.set.exerciseday.training
 
 
+def copy_workout_days(workout_pks):
+    '''
+    Copies the days, sets and settings of workouts that were copied already,
+    with a bulk insert per model
+
+    :param workout_pks: dictionary with the IDs of the copies for the ID of
+                        each workout, see bulk_copy
+    '''
+    day_pks = bulk_copy(Day.objects.filter(training__in=list(workout_pks)),
+                        'training',
+                        workout_pks)
+    bulk_copy_m2m(Day, 'day', day_pks)
+    set_pks = bulk_copy(Set.objects.filter(exerciseday__in=list(day_pks)),
+                        'exerciseday',
+                        day_pks)
+    bulk_copy_m2m(Set, 'exercises', set_pks)
+    bulk_copy(Setting.objects.filter(set__in=list(set_pks)), 'set', set_pks)
+
+    # The exercises were added without the m2m_changed signal
+    exercise_day_ids = {}
+    for exercise_id, day_id in Set.exercises.through.objects \
+            .filter(set__exerciseday__in=[pk for pks in day_pks.values() for pk in pks]) \
+            .values_list('exercise_id', 'set__exerciseday_id'):
+        exercise_day_ids.setdefault(exercise_id, set()).add(day_id)
+    add_exercise_day_ids(exercise_day_ids)
+
+
+class CanonicalFormBuilder(object):
+    '''
+    Builds the canonical representation of workout days
+
+    All the sets, exercises, muscles, comments and settings of the given days
+    are loaded with a fixed number of bulk queries, independently of the size
+    of the workout. The representation for each day is then assembled in memory.
+    '''
+
+    def __init__(self, days):
+        '''
+        :param days: list of Day objects. Prefetch the days of the week (the
+                     'day' field) to save one query per day.
+        '''
+        self.days = days
+
+        # Sets, grouped by day
+        self.sets = {day.pk: [] for day in days}
+        days_by_pk = {day.pk: day for day in days}
+        for set_obj in Set.objects.filter(exerciseday__in=days):
+            set_obj.exerciseday = days_by_pk[set_obj.exerciseday_id]
+            self.sets[set_obj.exerciseday_id].append(set_obj)
+        set_ids = [set_obj.pk for day_sets in self.sets.values() for set_obj in day_sets]
+
+        # Exercises, with their muscles and comments, in the order of each set
+        set_exercises = Set.exercises.through.objects.filter(set__in=set_ids) \
+                                                     .order_by('set', 'sort_value')
+        self.set_exercises = {set_id: [] for set_id in set_ids}
+        for item in set_exercises:
+            self.set_exercises[item.set_id].append(item.exercise_id)
+
+        exercise_ids = set([pk for pks in self.set_exercises.values() for pk in pks])
+        self.exercises = Exercise.objects.select_related() \
+                                         .prefetch_related('muscles',
+                                                           'muscles_secondary',
+                                                           'exercisecomment_set') \
+                                         .in_bulk(exercise_ids)
+
+        # Settings, grouped by set and exercise
+        self.settings = {}
+        for setting in Setting.objects.filter(set__in=set_ids) \
+                                      .select_related('repetition_unit', 'weight_unit') \
+                                      .order_by('order', 'id'):
+            self.settings.setdefault((setting.set_id, setting.exercise_id), []).append(setting)
+
+    def get_day(self, day):
+        '''
+        Returns the canonical representation for a day
+        '''
+        canonical_repr = []
+        muscles_front = []
+        muscles_back = []
+        muscles_front_secondary = []
+        muscles_back_secondary = []
+
+        for set_obj in self.sets[day.pk]:
+            exercise_tmp = []
+            has_setting_tmp = True
+            for exercise_id in self.set_exercises[set_obj.pk]:
+                exercise = self.exercises[exercise_id]
+
+                # Muscles for this set
+                for muscle in exercise.muscles.all():
+                    if muscle.is_front and muscle.id not in muscles_front:
+                        muscles_front.append(muscle.id)
+                    elif not muscle.is_front and muscle.id not in muscles_back:
+                        muscles_back.append(muscle.id)
+
+                for muscle in exercise.muscles_secondary.all():
+                    if muscle.is_front and muscle.id not in muscles_front:
+                        muscles_front_secondary.append(muscle.id)
+                    elif not muscle.is_front and muscle.id not in muscles_back:
+                        muscles_back_secondary.append(muscle.id)
+
+                setting_tmp = list(self.settings.get((set_obj.pk, exercise.pk), []))
+
+                # "Smart" textual representation
+                setting_text, setting_list, weight_list, reps_list, repetition_units, weight_units \
+                    = reps_smart_text(setting_tmp, set_obj)
+
+                # Flag indicating whether all exercises have settings
+                has_setting_tmp = True if len(setting_tmp) > 0 else False
+
+                # Exercise comments
+                comment_list = []
+                for i in exercise.exercisecomment_set.all():
+                    comment_list.append(i.comment)
+
+                # Flag indicating whether any of the settings has saved weight
+                has_weight = False
+                for i in setting_tmp:
+                    if i.weight:
+                        has_weight = True
+                        break
+
+                exercise_tmp.append({'obj': exercise,
+                                     'setting_obj_list': setting_tmp,
+                                     'setting_list': setting_list,
+                                     'repetition_units': repetition_units,
+                                     'weight_units': weight_units,
+                                     'weight_list': weight_list,
+                                     'has_weight': has_weight,
+                                     'reps_list': reps_list,
+                                     'setting_text': setting_text,
+                                     'comment_list': comment_list})
+
+            # If it's a superset, check that all exercises have the same repetitions.
+            # If not, just take the smallest number and drop the rest, because otherwise
+            # it doesn't make sense
+            if len(exercise_tmp) > 1:
+                common_reps = 100
+                for exercise in exercise_tmp:
+                    if len(exercise['setting_list']) < common_reps:
+                        common_reps = len(exercise['setting_list'])
+
+                for exercise in exercise_tmp:
+                    if len(exercise['setting_list']) > common_reps:
+                        exercise['setting_list'].pop(-1)
+                        exercise['setting_obj_list'].pop(-1)
+                        setting_text, setting_list, weight_list,\
+                            reps_list, repetition_units, weight_units = \
+                            reps_smart_text(exercise['setting_obj_list'], set_obj)
+                        exercise['setting_text'] = setting_text
+                        exercise['repetition_units'] = repetition_units
+
+            canonical_repr.append({'obj': set_obj,
+                                   'exercise_list': exercise_tmp,
+                                   'is_superset': True if len(exercise_tmp) > 1 else False,
+                                   'has_settings': has_setting_tmp,
+                                   'muscles': {
+                                       'back': muscles_back,
+                                       'front': muscles_front,
+                                       'frontsecondary': muscles_front_secondary,
+                                       'backsecondary': muscles_front_secondary
+                                   }})
+
+        # Days of the week
+        tmp_days_of_week = [day_of_week for day_of_week in day.day.all()]
+
+        return {'obj': day,
+                'days_of_week': {
+                    'text': u', '.join([six.text_type(_(i.day_of_week))
+                                       for i in tmp_days_of_week]),
+                    'day_list': tmp_days_of_week},
+                'muscles': {
+                    'back': muscles_back,
+                    'front': muscles_front,
+                    'frontsecondary': muscles_front_secondary,
+                    'backsecondary': muscles_front_secondary
+                },
+                'set_list': canonical_repr}
+
+
+def get_canonical_days(day_ids, day_list=None):
+    '''
+    Returns the canonical representation of the given days
+
+    The representations are read from the per-day cache entries, only the
+    missing ones are built (all together, with CanonicalFormBuilder) and saved.
+
+    :param day_ids: list with the IDs of the days, the result has the same order
+    :param day_list: optional list of already loaded Day objects, if not given
+                     the missing days are loaded from the database
+    '''
+    return [entry['day'] for entry in get_canonical_day_entries(day_ids, day_list)]
+
+
+def get_canonical_day_entries(day_ids, day_list=None):
+    '''
+    Returns the cache entries of the canonical representation of the given days
+
+    Besides the representation itself ('day'), each entry has a random
+    'version' that changes every time the day is built. See get_canonical_days
+    for the parameters.
+    '''
+    keys = {cache_mapper.get_day_canonical(pk): pk for pk in day_ids}
+    canonical_days = {keys[key]: value for key, value in cache.get_many(keys.keys()).items()
+                      if 'version' in value}
+
+    missing_ids = [pk for pk in day_ids if pk not in canonical_days]
+    if missing_ids:
+        if day_list is None:
+            day_list = Day.objects.filter(pk__in=missing_ids).prefetch_related('day')
+        missing_days = [day for day in day_list if day.pk in missing_ids]
+
+        builder = CanonicalFormBuilder(missing_days)
+        new_entries = {}
+        for day in missing_days:
+            canonical_days[day.pk] = {'day': builder.get_day(day),
+                                      'version': uuid.uuid4().hex}
+            new_entries[cache_mapper.get_day_canonical(day.pk)] = canonical_days[day.pk]
+        cache.set_many(new_entries)
+
+    return [canonical_days[pk] for pk in day_ids if pk in canonical_days]
+
+
 @python_2_unicode_compatible
 class WorkoutLog(models.Model):
     '''
@@ -763,9 +925,8 @@ class WorkoutLog(models.Model):
 
     def save(self, *args, **kwargs):
         '''
-        Reset cache
+        Plausibility checks
         '''
-        reset_workout_log(self.user_id, self.date.year, self.date.month, self.date.day)
 
         # If the user selected "Until Failure", do only 1 "repetition",
         # everythin else doesn't make sense.
@@ -773,13 +934,6 @@ class WorkoutLog(models.Model):
             self.reps = 1
         super(WorkoutLog, self).save(*args, **kwargs)
 
-    def delete(self, *args, **kwargs):
-        '''
-        Reset cache
-        '''
-        reset_workout_log(self.user_id, self.date.year, self.date.month, self.date.day)
-        super(WorkoutLog, self).delete(*args, **kwargs)
-
 
 @python_2_unicode_compatible
 class WorkoutSession(models.Model):
@@ -884,17 +1038,3 @@ class WorkoutSession(models.Model):
         Returns the object that has owner information
         '''
         return self
-
-    def save(self, *args, **kwargs):
-        '''
-        Reset cache
-        '''
-        reset_workout_log(self.user_id, self.date.year, self.date.month)
-        super(WorkoutSession, self).save(*args, **kwargs)
-
-    def delete(self, *args, **kwargs):
-        '''
-        Reset cache
-        '''
-        reset_workout_log(self.user_id, self.date.year, self.date.month)
-        super(WorkoutSession, self).delete(*args, **kwargs)
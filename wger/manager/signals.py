@@ -15,27 +15,107 @@
 # You should have received a copy of the GNU Affero General Public License
 
 
-from django.db.models.signals import post_save, post_delete
+from django.db.models.signals import pre_save, post_save, post_delete, m2m_changed
 
-from wger.gym.helpers import get_user_last_activity
-from wger.manager.models import WorkoutLog, WorkoutSession
-from wger.core.models import UserCache
+from wger.exercises.models import add_exercise_day_ids
+from wger.gym.helpers import update_user_last_activity
+from wger.manager.models import Schedule, ScheduleStep, Set, WorkoutLog, WorkoutSession
+from wger.utils.cache import reset_exercise_day_index, reset_schedule_steps
+from wger.weight.helpers import update_log_entries
 
 
 def update_activity_cache(sender, instance, **kwargs):
     '''
     Update the user's cached last activity date
+
+    A new or later date is only compared with the cached one, the activity
+    is calculated again if the log or session moved to an earlier date or to
+    another user.
+    '''
+    original = getattr(instance, '_original_log_date', None)
+    if original and (original[0] != instance.user_id or original[1] > instance.date):
+        update_user_last_activity(original[0])
+        update_user_last_activity(instance.user_id, instance.date)
+    elif original != (instance.user_id, instance.date):
+        update_user_last_activity(instance.user_id, instance.date)
+
+
+def reset_activity_cache(sender, instance, **kwargs):
+    '''
+    Calculate the user's last activity date again after deleting a log or session
+    '''
+    update_user_last_activity(instance.user_id)
+
+
+def update_exercise_day_index(sender, instance, action, reverse, pk_set, **kwargs):
+    '''
+    Keep the cached index of the workout days using an exercise up to date
+
+    Added exercises are simply appended to the cached entries, removed ones
+    reset the entries, since other sets of the same day might still use them.
+    '''
+    if reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            reset_exercise_day_index([instance.pk])
+
+    elif action == 'post_add':
+        add_exercise_day_ids({pk: {instance.exerciseday_id} for pk in pk_set})
+
+    elif action == 'post_remove':
+        reset_exercise_day_index(pk_set)
+
+    elif action == 'pre_clear':
+        reset_exercise_day_index(instance.exercises.values_list('pk', flat=True))
+
+
+m2m_changed.connect(update_exercise_day_index, sender=Set.exercises.through)
+
+
+def collect_log_date(sender, instance, **kwargs):
+    '''
+    Remember the date the log or session had before saving, it might change
+    '''
+    instance._original_log_date = None
+    if instance.pk:
+        instance._original_log_date = sender.objects.filter(pk=instance.pk)\
+            .values_list('user_id', 'date')\
+            .first()
+
+
+def update_log_cache(sender, instance, **kwargs):
+    '''
+    Update the affected days in the cached grouped workout logs
     '''
+    dates = {(instance.user_id, instance.date)}
+    if getattr(instance, '_original_log_date', None):
+        dates.add(instance._original_log_date)
 
-    user = instance.user
-    user.usercache.last_activity = get_user_last_activity(user)
-    user.usercache.save()
+    for user_pk, date in dates:
+        update_log_entries(user_pk, date)
 
 
+pre_save.connect(collect_log_date, sender=WorkoutLog)
+pre_save.connect(collect_log_date, sender=WorkoutSession)
+post_save.connect(update_log_cache, sender=WorkoutLog)
+post_save.connect(update_log_cache, sender=WorkoutSession)
+post_delete.connect(update_log_cache, sender=WorkoutLog)
+post_delete.connect(update_log_cache, sender=WorkoutSession)
 post_save.connect(update_activity_cache, sender=WorkoutSession)
 post_save.connect(update_activity_cache, sender=WorkoutLog)
+post_delete.connect(reset_activity_cache, sender=WorkoutSession)
+post_delete.connect(reset_activity_cache, sender=WorkoutLog)
+
+
+def reset_schedule_steps_cache(sender, instance, **kwargs):
+    '''
+    Reset the cached steps of the schedule, e.g. for the iCal export
+    '''
+    if kwargs.get('raw'):
+        return
+    reset_schedule_steps(instance.pk if sender == Schedule else instance.schedule_id)
+
 
-# TODO: this seems to cause problems when users are deleted
-#       perhaps because of the cascading, needs to be checked
-# post_delete.connect(update_activity_cache, sender=WorkoutSession)
-# post_delete.connect(update_activity_cache, sender=WorkoutLog)
+post_save.connect(reset_schedule_steps_cache, sender=Schedule)
+post_delete.connect(reset_schedule_steps_cache, sender=Schedule)
+post_save.connect(reset_schedule_steps_cache, sender=ScheduleStep)
+post_delete.connect(reset_schedule_steps_cache, sender=ScheduleStep)
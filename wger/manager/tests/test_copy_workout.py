@@ -14,11 +14,15 @@
 
 import logging
 
+from django.contrib.auth.models import User
 from django.core.urlresolvers import reverse
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 
 from wger.core.models import UserProfile
 from wger.core.tests.base_testcase import WorkoutManagerTestCase
-from wger.manager.models import Workout
+from wger.exercises.models import get_exercise_day_ids
+from wger.manager.models import Day, Set, Setting, Workout
 
 logger = logging.getLogger(__name__)
 
@@ -120,3 +124,56 @@ class CopyWorkoutTestCase(WorkoutManagerTestCase):
         self.user_login('admin')
         response = self.client.get(reverse('manager:workout:copy', kwargs={'pk': '3'}))
         self.assertEqual(response.status_code, 200)
+
+    def test_copy_many_users(self):
+        '''
+        Test copying a workout to several users at once
+        '''
+        workout = Workout.objects.get(pk=1)
+        users = list(User.objects.filter(username__in=('member1', 'member2', 'member3')))
+        get_exercise_day_ids([1, 2])
+
+        copies = workout.copy(users, comment='Copied')
+        self.assertEqual([copy.user for copy in copies], users)
+
+        for copy in copies:
+            self.assertEqual(copy.comment, 'Copied')
+            days_original = Day.objects.filter(training=workout).order_by('pk')
+            days_copy = Day.objects.filter(training=copy).order_by('pk')
+            self.assertEqual([day.description for day in days_original],
+                             [day.description for day in days_copy])
+            self.assertEqual([list(day.day.all()) for day in days_original],
+                             [list(day.day.all()) for day in days_copy])
+
+            sets_original = Set.objects.filter(exerciseday__training=workout).order_by('pk')
+            sets_copy = Set.objects.filter(exerciseday__training=copy).order_by('pk')
+            self.assertEqual([(s.sets, s.order, list(s.exercises.all())) for s in sets_original],
+                             [(s.sets, s.order, list(s.exercises.all())) for s in sets_copy])
+
+            settings_original = Setting.objects.filter(set__exerciseday__training=workout)
+            settings_copy = Setting.objects.filter(set__exerciseday__training=copy)
+            self.assertEqual([(s.exercise_id, s.reps, s.weight) for s in settings_original],
+                             [(s.exercise_id, s.reps, s.weight) for s in settings_copy])
+
+            # The cached index of the exercises' days was updated
+            for day in days_copy:
+                for exercise_id in Set.exercises.through.objects \
+                        .filter(set__exerciseday=day) \
+                        .values_list('exercise_id', flat=True):
+                    self.assertIn(day.pk, get_exercise_day_ids([exercise_id])[exercise_id])
+
+    def test_copy_many_users_queries(self):
+        '''
+        Test that only the workouts themselves are saved one by one
+        '''
+        workout = Workout.objects.get(pk=1)
+
+        users = list(User.objects.filter(username='member1'))
+        with CaptureQueriesContext(connection) as context:
+            workout.copy(users)
+        queries_one = len(context)
+
+        users = list(User.objects.filter(username__in=('member2', 'member3', 'member4')))
+        with CaptureQueriesContext(connection) as context:
+            workout.copy(users)
+        self.assertEqual(len(context), queries_one + 2)
@@ -165,22 +165,26 @@ class WorkoutCacheTestCase(WorkoutManagerTestCase):
         Tests the workout cache when saving
         '''
         day = Day.objects.get(pk=1)
-        day.canonical_representation
+        day.training.canonical_representation
         self.assertTrue(cache.get(cache_mapper.get_workout_canonical(day.training_id)))
+        self.assertTrue(cache.get(cache_mapper.get_day_canonical(day.pk)))
 
         day.save()
         self.assertFalse(cache.get(cache_mapper.get_workout_canonical(day.training_id)))
+        self.assertFalse(cache.get(cache_mapper.get_day_canonical(1)))
 
     def test_canonical_form_cache_delete(self):
         '''
         Tests the workout cache when deleting
         '''
         day = Day.objects.get(pk=1)
-        day.canonical_representation
+        day.training.canonical_representation
         self.assertTrue(cache.get(cache_mapper.get_workout_canonical(day.training_id)))
+        self.assertTrue(cache.get(cache_mapper.get_day_canonical(day.pk)))
 
         day.delete()
         self.assertFalse(cache.get(cache_mapper.get_workout_canonical(day.training_id)))
+        self.assertFalse(cache.get(cache_mapper.get_day_canonical(1)))
 
 
 class DayTestCase(WorkoutManagerTestCase):
@@ -15,8 +15,11 @@
 import datetime
 
 from django.contrib.auth.models import User
+from django.contrib.sites.models import Site
 from django.core import mail
+from django.core.mail.backends.locmem import EmailBackend
 from django.core.management import call_command
+from django.utils.six import StringIO
 
 from wger.core.models import UserProfile
 from wger.core.tests.base_testcase import WorkoutManagerTestCase
@@ -24,6 +27,22 @@ from wger.manager.models import Schedule
 from wger.manager.models import Workout
 
 
+class CountingEmailBackend(EmailBackend):
+    '''
+    Email backend that counts the connections and the send calls
+    '''
+    connections = 0
+    calls = []
+
+    def open(self):
+        CountingEmailBackend.connections += 1
+        return True
+
+    def send_messages(self, messages):
+        CountingEmailBackend.calls.append(len(messages))
+        return super(CountingEmailBackend, self).send_messages(messages)
+
+
 class EmailReminderTestCase(WorkoutManagerTestCase):
     '''
     Tests the email reminder command.
@@ -232,3 +251,55 @@ class EmailReminderTestCase(WorkoutManagerTestCase):
 
         call_command('email-reminders')
         self.assertEqual(len(mail.outbox), 0)
+
+
+class EmailReminderBatchTestCase(WorkoutManagerTestCase):
+    '''
+    Tests sending the email reminders to many users
+    '''
+
+    def setUp(self):
+        super(EmailReminderBatchTestCase, self).setUp()
+        Schedule.objects.all().delete()
+        Workout.objects.all().delete()
+        UserProfile.objects.update(workout_reminder_active=False)
+
+        for i in range(5):
+            user = User.objects.create_user('reminder{0}'.format(i),
+                                            'reminder{0}@example.com'.format(i),
+                                            'secret')
+            user.userprofile.workout_reminder_active = True
+            user.userprofile.save()
+            workout = Workout.objects.create(user=user)
+            Workout.objects.filter(pk=workout.pk)\
+                .update(creation_date=datetime.date(2012, 11, 20))
+
+        CountingEmailBackend.connections = 0
+        CountingEmailBackend.calls = []
+
+    def test_batches(self):
+        '''
+        Test that the emails are sent in batches over one connection
+        '''
+        with self.settings(EMAIL_BACKEND='wger.manager.tests.test_email_reminder.'
+                                         'CountingEmailBackend'):
+            call_command('email-reminders', batch_size=2, verbosity=2, stdout=StringIO())
+
+        self.assertEqual(len(mail.outbox), 5)
+        self.assertEqual(CountingEmailBackend.connections, 1)
+        self.assertEqual(CountingEmailBackend.calls, [2, 2, 1])
+        self.assertEqual(UserProfile.objects.filter(last_workout_notification=datetime.date.today())
+                         .count(), 5)
+
+        # The users are not notified again
+        call_command('email-reminders')
+        self.assertEqual(len(mail.outbox), 5)
+
+    def test_queries(self):
+        '''
+        Test that the number of queries does not depend on the number of users
+        '''
+        Site.objects.get_current()
+        with self.assertNumQueries(4):
+            call_command('email-reminders')
+        self.assertEqual(len(mail.outbox), 5)
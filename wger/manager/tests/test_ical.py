@@ -14,16 +14,18 @@
 
 import datetime
 
+import six
+from icalendar import Calendar
+
 from django.contrib.auth.models import User
+from django.core.cache import cache
 from django.core.urlresolvers import reverse
 
 from wger.core.tests.base_testcase import WorkoutManagerTestCase
+from wger.manager.models import Day, ScheduleStep
 from wger.utils.helpers import next_weekday, make_token
 
 
-# TODO: parse the generated calendar files with the icalendar library
-
-
 class IcalToolsTestCase(WorkoutManagerTestCase):
     '''
     Tests some tools used for iCal generation
@@ -67,8 +69,8 @@ class WorkoutICalExportTestCase(WorkoutManagerTestCase):
                          'attachment; filename=Calendar-workout-3.ics')
 
         # Approximate size
-        self.assertGreater(len(response.content), 540)
-        self.assertLess(len(response.content), 560)
+        self.assertGreater(len(response.content), 515)
+        self.assertLess(len(response.content), 535)
 
     def export_ical_token_wrong(self):
         '''
@@ -99,8 +101,8 @@ class WorkoutICalExportTestCase(WorkoutManagerTestCase):
                              'attachment; filename=Calendar-workout-3.ics')
 
             # Approximate size
-            self.assertGreater(len(response.content), 540)
-            self.assertLess(len(response.content), 560)
+            self.assertGreater(len(response.content), 515)
+            self.assertLess(len(response.content), 535)
 
     def test_export_ical_anonymous(self):
         '''
@@ -154,8 +156,8 @@ class ScheduleICalExportTestCase(WorkoutManagerTestCase):
                          'attachment; filename=Calendar-schedule-2.ics')
 
         # Approximate size
-        self.assertGreater(len(response.content), 1650)
-        self.assertLess(len(response.content), 1670)
+        self.assertGreater(len(response.content), 1600)
+        self.assertLess(len(response.content), 1620)
 
     def export_ical_token_wrong(self):
         '''
@@ -186,8 +188,8 @@ class ScheduleICalExportTestCase(WorkoutManagerTestCase):
                              'attachment; filename=Calendar-schedule-2.ics')
 
             # Approximate size
-            self.assertGreater(len(response.content), 1650)
-            self.assertLess(len(response.content), 1670)
+            self.assertGreater(len(response.content), 1600)
+            self.assertLess(len(response.content), 1620)
 
     def test_export_ical_anonymous(self):
         '''
@@ -217,3 +219,108 @@ class ScheduleICalExportTestCase(WorkoutManagerTestCase):
         self.export_ical(fail=True)
         self.export_ical_token()
         self.export_ical_token_wrong()
+
+
+class IcalCacheTestCase(WorkoutManagerTestCase):
+    '''
+    Tests the caching and the conditional requests of the iCal files
+    '''
+
+    def get_uids(self, response):
+        '''
+        Helper function that returns the UIDs of the events of an iCal file
+        '''
+        calendar = Calendar.from_ical(response.content)
+        return [six.text_type(event['uid']) for event in calendar.walk('vevent')]
+
+    def test_workout_uids(self):
+        '''
+        Test that the UIDs of the events don't change
+        '''
+        self.user_login('test')
+        url = reverse('manager:workout:ical', kwargs={'pk': 3})
+        uids = self.get_uids(self.client.get(url))
+        self.assertEqual(uids, ['workout-3-day-5-3@example.com',
+                                'workout-3-day-5-5@example.com'])
+
+        cache.clear()
+        self.assertEqual(self.get_uids(self.client.get(url)), uids)
+
+    def test_schedule_uids(self):
+        '''
+        Test that the UIDs of the events are unique and don't change
+        '''
+        self.user_login('admin')
+        url = reverse('manager:schedule:ical', kwargs={'pk': 2})
+        uids = self.get_uids(self.client.get(url))
+        self.assertTrue(uids)
+        self.assertEqual(len(uids), len(set(uids)))
+
+        cache.clear()
+        self.assertEqual(self.get_uids(self.client.get(url)), uids)
+
+    def test_conditional_requests(self):
+        '''
+        Test that clients that already have the file get a 304 without queries
+        '''
+        url = reverse('manager:workout:ical', kwargs={'pk': 3})
+        self.user_login('test')
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['ETag'])
+        self.assertTrue(response['Last-Modified'])
+
+        self.user_logout()
+        uid, token = make_token(User.objects.get(username='test'))
+        url = reverse('manager:workout:ical', kwargs={'pk': 3, 'uidb64': uid, 'token': token})
+
+        # Only the user of the token is loaded
+        with self.assertNumQueries(1):
+            not_modified = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified['ETag'], response['ETag'])
+
+        not_modified = self.client.get(url,
+                                       HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(not_modified.status_code, 304)
+
+        # A wrong token still gets no access
+        url = reverse('manager:workout:ical', kwargs={'pk': 3,
+                                                      'uidb64': 'AB',
+                                                      'token': 'abc-11223344556677889900'})
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 403)
+
+    def test_changes(self):
+        '''
+        Test that the file is rendered again when the workout, the profile or
+        the schedule change
+        '''
+        self.user_login('test')
+        url = reverse('manager:workout:ical', kwargs={'pk': 3})
+        etag = self.client.get(url)['ETag']
+
+        day = Day.objects.get(pk=5)
+        day.description = 'A new description'
+        day.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'A new description', response.content)
+        etag = response['ETag']
+
+        user = User.objects.get(username='test')
+        user.userprofile.workout_duration = 2
+        user.userprofile.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'UNTIL=20121204', response.content)
+
+        self.user_login('admin')
+        url = reverse('manager:schedule:ical', kwargs={'pk': 2})
+        response = self.client.get(url)
+        count = len(self.get_uids(response))
+        step = ScheduleStep.objects.filter(schedule_id=2).first()
+        step.delete()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertLess(len(self.get_uids(response)), count)
@@ -11,10 +11,15 @@
 # GNU General Public License for more details.
 #
 # You should have received a copy of the GNU Affero General Public License
+from django.conf import settings
 from django.contrib.auth.models import User
+from django.core.cache import cache
 from django.core.urlresolvers import reverse
+from django.utils.http import http_date
 
 from wger.core.tests.base_testcase import WorkoutManagerTestCase
+from wger.manager.models import Day
+from wger.utils.cache import cache_mapper, get_cached_pdf, set_cached_pdf
 from wger.utils.helpers import make_token
 
 
@@ -252,3 +257,97 @@ class WorkoutPdfTableExportTestCase(WorkoutManagerTestCase):
         self.export_pdf(fail=True)
         self.export_pdf_token()
         self.export_pdf_token_wrong()
+
+
+class WorkoutPdfCacheTestCase(WorkoutManagerTestCase):
+    '''
+    Tests the cache of the rendered workout PDFs
+    '''
+
+    def setUp(self):
+        super(WorkoutPdfCacheTestCase, self).setUp()
+        self.user_login('test')
+        self.url = reverse('manager:workout:pdf-log', kwargs={'id': 3})
+
+    def test_cached(self):
+        '''
+        Test that the PDFs are only rendered once
+        '''
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        cache_key = response['ETag'].strip('"')
+        entry = get_cached_pdf(cache_key)
+        self.assertEqual(entry['content'], response.content)
+        self.assertEqual(response['Last-Modified'], http_date(entry['last_modified']))
+
+        entry['content'] = b'cached'
+        cache.set(cache_key, entry)
+        response = self.client.get(self.url)
+        self.assertEqual(response.content, b'cached')
+        self.assertEqual(response['Content-Length'], '6')
+
+        # Different flags are cached separately
+        response = self.client.get(reverse('manager:workout:pdf-log',
+                                           kwargs={'id': 3, 'images': 1, 'comments': 0}))
+        self.assertNotEqual(response.content, b'cached')
+        self.assertNotEqual(response['ETag'].strip('"'), cache_key)
+
+    def test_conditional(self):
+        '''
+        Test that clients with the current PDF get a 304
+        '''
+        response = self.client.get(self.url)
+        etag = response['ETag']
+        last_modified = response['Last-Modified']
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertFalse(response.content)
+
+        response = self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH='"pdf-other"')
+        self.assertEqual(response.status_code, 200)
+
+    def test_changed_workout(self):
+        '''
+        Test that editing the workout changes the key of its PDFs
+        '''
+        etag = self.client.get(self.url)['ETag']
+
+        day = Day.objects.get(pk=5)
+        day.description = 'Changed day'
+        day.save()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_eviction(self):
+        '''
+        Test that the least recently used PDFs are evicted first
+        '''
+        with self.settings(WGER_SETTINGS=dict(settings.WGER_SETTINGS, PDF_CACHE_SIZE=25)):
+            set_cached_pdf('pdf-1', b'1' * 10)
+            set_cached_pdf('pdf-2', b'2' * 10)
+            get_cached_pdf('pdf-1')
+            set_cached_pdf('pdf-3', b'3' * 10)
+
+        self.assertTrue(get_cached_pdf('pdf-1'))
+        self.assertIsNone(get_cached_pdf('pdf-2'))
+        self.assertTrue(get_cached_pdf('pdf-3'))
+
+    def test_index_locked(self):
+        '''
+        Test that the index is not changed by cache hits or while it is locked
+        '''
+        set_cached_pdf('pdf-1', b'1' * 10)
+        index = cache.get(cache_mapper.PDF_CACHE_INDEX)
+        get_cached_pdf('pdf-1')
+        self.assertEqual(cache.get(cache_mapper.PDF_CACHE_INDEX), index)
+
+        cache.set(cache_mapper.PDF_CACHE_LOCK, True)
+        set_cached_pdf('pdf-2', b'2' * 10)
+        self.assertTrue(get_cached_pdf('pdf-2'))
+        self.assertNotIn('pdf-2', cache.get(cache_mapper.PDF_CACHE_INDEX))
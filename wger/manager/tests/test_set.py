@@ -365,10 +365,11 @@ class SetWorkoutCacheTestCase(WorkoutManagerTestCase):
         '''
         set = Set.objects.get(pk=1)
         set.exerciseday.training.canonical_representation
-        self.assertTrue(cache.get(cache_mapper.get_workout_canonical(set.exerciseday.training_id)))
+        self.assertTrue(cache.get(cache_mapper.get_day_canonical(set.exerciseday_id)))
 
         set.save()
-        self.assertFalse(cache.get(cache_mapper.get_workout_canonical(set.exerciseday.training_id)))
+        self.assertFalse(cache.get(cache_mapper.get_day_canonical(set.exerciseday_id)))
+        self.assertTrue(cache.get(cache_mapper.get_workout_canonical(set.exerciseday.training_id)))
 
     def test_canonical_form_cache_delete(self):
         '''
@@ -376,10 +377,10 @@ class SetWorkoutCacheTestCase(WorkoutManagerTestCase):
         '''
         set = Set.objects.get(pk=1)
         set.exerciseday.training.canonical_representation
-        self.assertTrue(cache.get(cache_mapper.get_workout_canonical(set.exerciseday.training_id)))
+        self.assertTrue(cache.get(cache_mapper.get_day_canonical(set.exerciseday_id)))
 
         set.delete()
-        self.assertFalse(cache.get(cache_mapper.get_workout_canonical(set.exerciseday.training_id)))
+        self.assertFalse(cache.get(cache_mapper.get_day_canonical(set.exerciseday_id)))
 
 
 class SettingWorkoutCacheTestCase(WorkoutManagerTestCase):
@@ -392,24 +393,24 @@ class SettingWorkoutCacheTestCase(WorkoutManagerTestCase):
         Tests the workout cache when saving
         '''
         setting = Setting.objects.get(pk=1)
-        workout_id = setting.set.exerciseday.training_id
+        day_id = setting.set.exerciseday_id
         setting.set.exerciseday.training.canonical_representation
-        self.assertTrue(cache.get(cache_mapper.get_workout_canonical(workout_id)))
+        self.assertTrue(cache.get(cache_mapper.get_day_canonical(day_id)))
 
         setting.save()
-        self.assertFalse(cache.get(cache_mapper.get_workout_canonical(workout_id)))
+        self.assertFalse(cache.get(cache_mapper.get_day_canonical(day_id)))
 
     def test_canonical_form_cache_delete(self):
         '''
         Tests the workout cache when deleting
         '''
         setting = Setting.objects.get(pk=1)
-        workout_id = setting.set.exerciseday.training_id
+        day_id = setting.set.exerciseday_id
         setting.set.exerciseday.training.canonical_representation
-        self.assertTrue(cache.get(cache_mapper.get_workout_canonical(workout_id)))
+        self.assertTrue(cache.get(cache_mapper.get_day_canonical(day_id)))
 
         setting.delete()
-        self.assertFalse(cache.get(cache_mapper.get_workout_canonical(workout_id)))
+        self.assertFalse(cache.get(cache_mapper.get_day_canonical(day_id)))
 
 
 class SetApiTestCase(api_base_test.ApiBaseResourceTestCase):
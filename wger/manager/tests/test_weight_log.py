@@ -18,8 +18,11 @@ import logging
 from django.contrib.auth.models import User
 from django.core.cache import cache
 from django.core.urlresolvers import reverse, reverse_lazy
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 
 from wger.core.tests import api_base_test
+from wger.core.tests.base_testcase import BaseTestCase
 from wger.core.tests.base_testcase import WorkoutManagerDeleteTestCase
 from wger.core.tests.base_testcase import WorkoutManagerTestCase
 from wger.exercises.models import Exercise
@@ -27,6 +30,7 @@ from wger.manager.models import Workout
 from wger.manager.models import WorkoutLog
 from wger.manager.models import WorkoutSession
 from wger.utils.cache import cache_mapper
+from wger.weight.helpers import group_log_entries, save_workout_logs, update_log_entries
 
 logger = logging.getLogger(__name__)
 
@@ -366,135 +370,312 @@ class WorkoutLogCacheTestCase(WorkoutManagerTestCase):
     Workout log cache test case
     '''
 
+    def test_cache_key(self):
+        '''
+        Test that the cache key does not depend on the running process
+        '''
+        self.assertEqual(cache_mapper.get_workout_log_list(1, 2012, 10),
+                         'workout-log-list-1-2012-10')
+        self.assertEqual(cache_mapper.get_workout_log_list(User.objects.get(pk=1), 2012, 10),
+                         'workout-log-list-1-2012-10')
+
     def test_calendar(self):
         '''
         Test the log cache is correctly generated on visit
         '''
-        log_hash = hash((1, 2012, 10))
         self.user_login('admin')
-        self.assertFalse(cache.get(cache_mapper.get_workout_log_list(log_hash)))
+        self.assertFalse(cache.get(cache_mapper.get_workout_log_list(1, 2012, 10)))
 
         self.client.get(reverse('manager:workout:calendar', kwargs={'year': 2012, 'month': 10}))
-        self.assertTrue(cache.get(cache_mapper.get_workout_log_list(log_hash)))
+        self.assertTrue(cache.get(cache_mapper.get_workout_log_list(1, 2012, 10)))
 
     def test_calendar_day(self):
         '''
         Test the log cache on the calendar day view is correctly generated on visit
         '''
-        log_hash = hash((1, 2012, 10, 1))
         self.user_login('admin')
-        self.assertFalse(cache.get(cache_mapper.get_workout_log_list(log_hash)))
+        self.assertFalse(cache.get(cache_mapper.get_workout_log_list(1, 2012, 10)))
 
-        self.client.get(reverse('manager:workout:calendar-day', kwargs={'username': 'admin',
-                                                                        'year': 2012,
-                                                                        'month': 10,
-                                                                        'day': 1}))
-        self.assertTrue(cache.get(cache_mapper.get_workout_log_list(log_hash)))
+        response = self.client.get(reverse('manager:workout:calendar-day',
+                                           kwargs={'username': 'admin',
+                                                   'year': 2012,
+                                                   'month': 10,
+                                                   'day': 1}))
+        self.assertTrue(cache.get(cache_mapper.get_workout_log_list(1, 2012, 10)))
+        self.assertEqual(list(response.context['logs'].keys()), [datetime.date(2012, 10, 1)])
 
     def test_calendar_anonymous(self):
         '''
         Test the log cache is correctly generated on visit by anonymous users
         '''
-        log_hash = hash((1, 2012, 10))
         self.user_logout()
-        self.assertFalse(cache.get(cache_mapper.get_workout_log_list(log_hash)))
+        self.assertFalse(cache.get(cache_mapper.get_workout_log_list(1, 2012, 10)))
 
         self.client.get(reverse('manager:workout:calendar', kwargs={'username': 'admin',
                                                                     'year': 2012,
                                                                     'month': 10}))
-        self.assertTrue(cache.get(cache_mapper.get_workout_log_list(log_hash)))
+        self.assertTrue(cache.get(cache_mapper.get_workout_log_list(1, 2012, 10)))
 
     def test_calendar_day_anonymous(self):
         '''
         Test the log cache is correctly generated on visit by anonymous users
         '''
-        log_hash = hash((1, 2012, 10, 1))
         self.user_logout()
-        self.assertFalse(cache.get(cache_mapper.get_workout_log_list(log_hash)))
+        self.assertFalse(cache.get(cache_mapper.get_workout_log_list(1, 2012, 10)))
 
         self.client.get(reverse('manager:workout:calendar-day', kwargs={'username': 'admin',
                                                                         'year': 2012,
                                                                         'month': 10,
                                                                         'day': 1}))
-        self.assertTrue(cache.get(cache_mapper.get_workout_log_list(log_hash)))
+        self.assertTrue(cache.get(cache_mapper.get_workout_log_list(1, 2012, 10)))
 
     def test_cache_update_log(self):
         '''
-        Test that the caches are cleared when saving a log
+        Test that the cache is updated in place when saving a log
         '''
-        log_hash = hash((1, 2012, 10))
-        log_hash_day = hash((1, 2012, 10, 1))
         self.user_login('admin')
         self.client.get(reverse('manager:workout:calendar', kwargs={'year': 2012, 'month': 10}))
-        self.client.get(reverse('manager:workout:calendar-day', kwargs={'username': 'admin',
-                                                                        'year': 2012,
-                                                                        'month': 10,
-                                                                        'day': 1}))
 
         log = WorkoutLog.objects.get(pk=1)
         log.weight = 35
         log.save()
 
-        self.assertFalse(cache.get(cache_mapper.get_workout_log_list(log_hash)))
-        self.assertFalse(cache.get(cache_mapper.get_workout_log_list(log_hash_day)))
+        logs = cache.get(cache_mapper.get_workout_log_list(1, 2012, 10))
+        self.assertTrue(logs)
+        entries = logs[log.date]['logs'][log.exercise]
+        self.assertEqual([e.weight for e in entries if e.pk == 1], [35])
+
+    def test_cache_update_log_date(self):
+        '''
+        Test that both months are updated when the date of a log changes
+        '''
+        self.user_login('admin')
+        self.client.get(reverse('manager:workout:calendar', kwargs={'year': 2012, 'month': 10}))
+        self.client.get(reverse('manager:workout:calendar', kwargs={'year': 2012, 'month': 11}))
+
+        log = WorkoutLog.objects.get(pk=1)
+        old_date = log.date
+        log.date = datetime.date(2012, 11, 20)
+        log.save()
+
+        logs_old = cache.get(cache_mapper.get_workout_log_list(1, 2012, 10))
+        logs_new = cache.get(cache_mapper.get_workout_log_list(1, 2012, 11))
+        old_ids = [e.pk
+                   for entries in logs_old.get(old_date, {'logs': {}})['logs'].values()
+                   for e in entries]
+        self.assertNotIn(1, old_ids)
+        self.assertIn(datetime.date(2012, 11, 20), logs_new)
+        self.assertEqual(list(logs_new.keys()), sorted(logs_new.keys()))
 
     def test_cache_update_log_2(self):
         '''
-        Test that the caches are only cleared for a the log's month
+        Test that the caches of other months are not touched
         '''
-        log_hash = hash((1, 2012, 10))
-        log_hash_day = hash((1, 2012, 10, 1))
         self.user_login('admin')
         self.client.get(reverse('manager:workout:calendar', kwargs={'year': 2012, 'month': 10}))
-        self.client.get(reverse('manager:workout:calendar-day', kwargs={'username': 'admin',
-                                                                        'year': 2012,
-                                                                        'month': 10,
-                                                                        'day': 1}))
+        logs_before = cache.get(cache_mapper.get_workout_log_list(1, 2012, 10))
 
         log = WorkoutLog.objects.get(pk=3)
         log.weight = 35
         log.save()
 
-        self.assertTrue(cache.get(cache_mapper.get_workout_log_list(log_hash)))
-        self.assertTrue(cache.get(cache_mapper.get_workout_log_list(log_hash_day)))
+        logs_after = cache.get(cache_mapper.get_workout_log_list(1, 2012, 10))
+        self.assertEqual(list(logs_before.keys()), list(logs_after.keys()))
 
     def test_cache_delete_log(self):
         '''
-        Test that the caches are cleared when deleting a log
+        Test that the cache is updated when deleting a log
         '''
-        log_hash = hash((1, 2012, 10))
-        log_hash_day = hash((1, 2012, 10, 1))
         self.user_login('admin')
         self.client.get(reverse('manager:workout:calendar', kwargs={'year': 2012, 'month': 10}))
-        self.client.get(reverse('manager:workout:calendar-day', kwargs={'username': 'admin',
-                                                                        'year': 2012,
-                                                                        'month': 10,
-                                                                        'day': 1}))
 
         log = WorkoutLog.objects.get(pk=1)
         log.delete()
 
-        self.assertFalse(cache.get(cache_mapper.get_workout_log_list(log_hash)))
-        self.assertFalse(cache.get(cache_mapper.get_workout_log_list(log_hash_day)))
+        logs = cache.get(cache_mapper.get_workout_log_list(1, 2012, 10))
+        self.assertTrue(logs)
+        log_ids = [e.pk
+                   for value in logs.values()
+                   for entries in value['logs'].values()
+                   for e in entries]
+        self.assertNotIn(1, log_ids)
 
     def test_cache_delete_log_2(self):
         '''
-        Test that the caches are only cleared for a the log's month
+        Test that the caches of other months are not touched
         '''
-        log_hash = hash((1, 2012, 10))
-        log_hash_day = hash((1, 2012, 10, 1))
         self.user_login('admin')
         self.client.get(reverse('manager:workout:calendar', kwargs={'year': 2012, 'month': 10}))
-        self.client.get(reverse('manager:workout:calendar-day', kwargs={'username': 'admin',
-                                                                        'year': 2012,
-                                                                        'month': 10,
-                                                                        'day': 1}))
 
         log = WorkoutLog.objects.get(pk=3)
         log.delete()
 
-        self.assertTrue(cache.get(cache_mapper.get_workout_log_list(log_hash)))
-        self.assertTrue(cache.get(cache_mapper.get_workout_log_list(log_hash_day)))
+        self.assertTrue(cache.get(cache_mapper.get_workout_log_list(1, 2012, 10)))
+
+    def test_cache_query_count(self):
+        '''
+        Test that updating the cache only queries the changed day
+        '''
+        self.user_login('admin')
+        self.client.get(reverse('manager:workout:calendar', kwargs={'year': 2012, 'month': 10}))
+
+        log = WorkoutLog.objects.get(pk=1)
+        user = User.objects.get(pk=1)
+        with CaptureQueriesContext(connection) as context:
+            update_log_entries(1, log.date)
+        self.assertEqual(len(context.captured_queries), 2)
+
+        with self.assertNumQueries(0):
+            group_log_entries(user, 2012, 10, 1)
+
+
+class SaveWorkoutLogsTestCase(WorkoutManagerTestCase):
+    '''
+    Tests saving several workout logs at once
+    '''
+
+    def get_logs(self, *dates):
+        '''
+        Helper function that returns unsaved logs for the given dates
+        '''
+        return [WorkoutLog(exercise_id=1, workout_id=1, reps=5, weight=20, date=date)
+                for date in dates]
+
+    def test_save(self):
+        '''
+        Test saving the logs and updating the cached months
+        '''
+        self.user_login('admin')
+        self.client.get(reverse('manager:workout:calendar', kwargs={'year': 2012, 'month': 10}))
+        count = WorkoutLog.objects.count()
+        user = User.objects.get(username='admin')
+
+        save_workout_logs(user, self.get_logs(datetime.date(2012, 10, 5),
+                                              datetime.date(2012, 10, 5),
+                                              datetime.date(2012, 10, 8)))
+        self.assertEqual(WorkoutLog.objects.count(), count + 3)
+        self.assertEqual(WorkoutLog.objects.filter(user=user, date='2012-10-05').count(), 2)
+
+        logs = cache.get(cache_mapper.get_workout_log_list(1, 2012, 10))
+        self.assertIn(datetime.date(2012, 10, 5), logs)
+        self.assertIn(datetime.date(2012, 10, 8), logs)
+        self.assertEqual(list(logs.keys()), sorted(logs.keys()))
+
+    def test_session(self):
+        '''
+        Test that an existing session is updated, not duplicated
+        '''
+        user = User.objects.get(username='admin')
+        session = save_workout_logs(user,
+                                    self.get_logs(datetime.date(2012, 10, 1)),
+                                    {'date': datetime.date(2012, 10, 1),
+                                     'workout': Workout.objects.get(pk=2),
+                                     'notes': 'Updated notes'})
+        self.assertEqual(session.pk, 1)
+        session = WorkoutSession.objects.get(pk=1)
+        self.assertEqual(session.notes, 'Updated notes')
+        self.assertEqual(session.workout_id, 1)
+
+        session = save_workout_logs(user,
+                                    self.get_logs(datetime.date(2012, 10, 2)),
+                                    {'date': datetime.date(2012, 10, 2),
+                                     'workout': Workout.objects.get(pk=2),
+                                     'impression': '3'})
+        self.assertEqual(session.workout_id, 2)
+        self.assertEqual(WorkoutSession.objects.filter(user=user, date='2012-10-02').count(), 1)
+
+    def test_view_single_insert(self):
+        '''
+        Test that the log form inserts all logs with one query
+        '''
+        self.user_login('admin')
+        count = WorkoutLog.objects.count()
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.post(reverse('manager:day:log', kwargs={'pk': 1}),
+                                        {'date': '2012-10-01',
+                                         'notes': 'My cool impression',
+                                         'impression': '3',
+                                         'form-0-reps': 10,
+                                         'form-0-weight': 10,
+                                         'form-1-reps': 8,
+                                         'form-1-weight': 10,
+                                         'form-TOTAL_FORMS': 3,
+                                         'form-INITIAL_FORMS': 0,
+                                         'form-MAX-NUM_FORMS': 3})
+        self.assertEqual(response.status_code, 302)
+        inserts = [query for query in context.captured_queries
+                   if query['sql'].startswith('INSERT')]
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual(WorkoutLog.objects.count(), count + 2)
+        self.assertEqual(WorkoutSession.objects.get(pk=1).notes, 'My cool impression')
+        self.assertEqual(WorkoutSession.objects.filter(user__username='admin',
+                                                       date='2012-10-01').count(), 1)
+
+
+class WorkoutLogBulkApiTestCase(BaseTestCase, api_base_test.ApiBaseTestCase):
+    '''
+    Tests the bulk endpoint of the workout log resource
+    '''
+    resource = WorkoutLog
+    data = {'logs': [{'exercise': 1,
+                      'workout': 3,
+                      'reps': 3,
+                      'repetition_unit': 1,
+                      'weight_unit': 1,
+                      'weight': 2,
+                      'date': '2016-01-10'},
+                     {'exercise': 2,
+                      'workout': 3,
+                      'reps': 5,
+                      'repetition_unit': 1,
+                      'weight_unit': 1,
+                      'weight': 2,
+                      'date': '2016-01-10'}],
+            'session': {'workout': 3,
+                        'date': '2016-01-10',
+                        'impression': '3'}}
+
+    def test_bulk(self):
+        '''
+        Test saving the logs and the session
+        '''
+        self.get_credentials()
+        count = WorkoutLog.objects.count()
+        response = self.client.post(self.url + 'bulk/', self.data)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['logs'], 2)
+        self.assertEqual(WorkoutLog.objects.count(), count + 2)
+        session = WorkoutSession.objects.get(pk=response.data['session'])
+        self.assertEqual(session.user.username, 'test')
+        self.assertEqual(session.impression, '3')
+
+    def test_bulk_other_user(self):
+        '''
+        Test that logs can't be saved for workouts of other users
+        '''
+        self.get_credentials(self.user_fail)
+        count = WorkoutLog.objects.count()
+        response = self.client.post(self.url + 'bulk/', self.data)
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(WorkoutLog.objects.count(), count)
+
+    def test_bulk_anonymous(self):
+        '''
+        Test that anonymous users can't save logs
+        '''
+        response = self.client.post(self.url + 'bulk/', self.data)
+        self.assertEqual(response.status_code, 403)
+
+    def test_bulk_invalid(self):
+        '''
+        Test that nothing is saved if one of the logs is invalid
+        '''
+        self.get_credentials()
+        count = WorkoutLog.objects.count()
+        data = {'logs': self.data['logs'] + [{'exercise': 1, 'workout': 3, 'reps': -1}]}
+        response = self.client.post(self.url + 'bulk/', data)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(WorkoutLog.objects.count(), count)
 
 
 class WorkoutLogApiTestCase(api_base_test.ApiBaseResourceTestCase):
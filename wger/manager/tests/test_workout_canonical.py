@@ -15,6 +15,8 @@
 from decimal import Decimal
 
 from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 
 from wger.core.models import (
     DaysOfWeek,
@@ -160,6 +162,34 @@ class WorkoutCanonicalFormTestCase(WorkoutManagerTestCase):
 
         self.assertEqual(day.canonical_representation['set_list'], canonical_form)
 
+    def test_canonical_form_query_count(self):
+        '''
+        Tests that the number of queries doesn't depend on the size of the workout
+        '''
+
+        workout = Workout.objects.get(pk=1)
+        with CaptureQueriesContext(connection) as context:
+            workout.canonical_representation
+        nr_of_queries = len(context.captured_queries)
+
+        # Add some more days, sets, exercises and settings to the workout
+        for i in range(1, 4):
+            day = Day.objects.create(training=workout, description='Day {0}'.format(i))
+            day.day.add(DaysOfWeek.objects.get(pk=i))
+            for j in range(1, 3):
+                set_obj = Set.objects.create(exerciseday=day, sets=4, order=j)
+                set_obj.exercises.add(Exercise.objects.get(pk=1))
+                set_obj.exercises.add(Exercise.objects.get(pk=2))
+                for exercise in set_obj.exercises.all():
+                    Setting.objects.create(set=set_obj, exercise=exercise, reps=8, order=1)
+
+        cache.clear()
+        workout = Workout.objects.get(pk=1)
+        with CaptureQueriesContext(connection) as context:
+            canonical_form = workout.canonical_representation
+        self.assertEqual(len(canonical_form['day_list']), 6)
+        self.assertEqual(len(context.captured_queries), nr_of_queries)
+
 
 class WorkoutCacheTestCase(WorkoutManagerTestCase):
     '''
@@ -197,3 +227,27 @@ class WorkoutCacheTestCase(WorkoutManagerTestCase):
 
         workout.delete()
         self.assertFalse(cache.get(cache_mapper.get_workout_canonical(1)))
+
+    def test_canonical_form_cache_day_fragments(self):
+        '''
+        Tests that changing a set only resets the cache of its own day
+        '''
+        workout = Workout.objects.get(pk=1)
+        workout.canonical_representation
+        for day_id in (1, 2, 4):
+            self.assertTrue(cache.get(cache_mapper.get_day_canonical(day_id)))
+
+        Set.objects.get(pk=1).save()
+        self.assertTrue(cache.get(cache_mapper.get_workout_canonical(1)))
+        self.assertFalse(cache.get(cache_mapper.get_day_canonical(1)))
+        self.assertTrue(cache.get(cache_mapper.get_day_canonical(2)))
+        self.assertTrue(cache.get(cache_mapper.get_day_canonical(4)))
+
+        # Only the changed day is built again
+        with CaptureQueriesContext(connection) as context:
+            canonical_form = Workout.objects.get(pk=1).canonical_representation
+        day_queries = [i for i in context.captured_queries
+                       if 'FROM "manager_day"' in i['sql']]
+        self.assertEqual(len(day_queries), 1)
+        self.assertEqual([i['obj'].pk for i in canonical_form['day_list']], [1, 2, 4])
+        self.assertTrue(cache.get(cache_mapper.get_day_canonical(1)))
@@ -170,9 +170,8 @@ class WorkoutLogCacheTestCase(WorkoutManagerTestCase):
 
     def test_cache_update_session(self):
         '''
-        Test that the caches are cleared when updating a workout session
+        Test that the caches are updated when updating a workout session
         '''
-        log_hash = hash((1, 2012, 10))
         self.user_login('admin')
         self.client.get(reverse('manager:workout:calendar', kwargs={'year': 2012, 'month': 10}))
 
@@ -180,13 +179,13 @@ class WorkoutLogCacheTestCase(WorkoutManagerTestCase):
         session.notes = 'Lorem ipsum'
         session.save()
 
-        self.assertFalse(cache.get(cache_mapper.get_workout_log_list(log_hash)))
+        logs = cache.get(cache_mapper.get_workout_log_list(1, 2012, 10))
+        self.assertEqual(logs[session.date]['session'].notes, 'Lorem ipsum')
 
     def test_cache_update_session_2(self):
         '''
-        Test that the caches are only cleared for a the session's month
+        Test that the caches are only updated for a the session's month
         '''
-        log_hash = hash((1, 2012, 10))
         self.user_login('admin')
         self.client.get(reverse('manager:workout:calendar', kwargs={'year': 2012, 'month': 10}))
 
@@ -195,33 +194,34 @@ class WorkoutLogCacheTestCase(WorkoutManagerTestCase):
         session.notes = 'Lorem ipsum'
         session.save()
 
-        self.assertTrue(cache.get(cache_mapper.get_workout_log_list(log_hash)))
+        logs = cache.get(cache_mapper.get_workout_log_list(1, 2012, 10))
+        self.assertTrue(logs)
+        self.assertNotIn(session.date, logs)
 
     def test_cache_delete_session(self):
         '''
-        Test that the caches are cleared when deleting a workout session
+        Test that the caches are updated when deleting a workout session
         '''
-        log_hash = hash((1, 2012, 10))
         self.user_login('admin')
         self.client.get(reverse('manager:workout:calendar', kwargs={'year': 2012, 'month': 10}))
 
         session = WorkoutSession.objects.get(pk=1)
         session.delete()
 
-        self.assertFalse(cache.get(cache_mapper.get_workout_log_list(log_hash)))
+        logs = cache.get(cache_mapper.get_workout_log_list(1, 2012, 10))
+        self.assertFalse(logs.get(session.date, {}).get('session'))
 
     def test_cache_delete_session_2(self):
         '''
-        Test that the caches are only cleared for a the session's month
+        Test that the caches are only updated for a the session's month
         '''
-        log_hash = hash((1, 2012, 10))
         self.user_login('admin')
         self.client.get(reverse('manager:workout:calendar', kwargs={'year': 2012, 'month': 10}))
 
         session = WorkoutSession.objects.get(pk=2)
         session.delete()
 
-        self.assertTrue(cache.get(cache_mapper.get_workout_log_list(log_hash)))
+        self.assertTrue(cache.get(cache_mapper.get_workout_log_list(1, 2012, 10)))
 
 
 class WorkoutSessionApiTestCase(api_base_test.ApiBaseResourceTestCase):
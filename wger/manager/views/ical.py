@@ -17,17 +17,25 @@
 import six
 import logging
 import datetime
+import time
 
 from icalendar import Calendar
 from icalendar import Event
-from icalendar.tools import UIDGenerator
 
+from django.core.cache import cache
 from django.shortcuts import get_object_or_404
-from django.http import HttpResponse, HttpResponseForbidden
+from django.http import Http404, HttpResponse, HttpResponseForbidden
 from django.contrib.sites.models import Site
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
 
 from wger import get_version
 from wger.manager.models import Workout, Schedule
+from wger.utils.cache import (
+    cache_mapper,
+    get_ical_cache_key,
+    get_user_profile_version
+)
 from wger.utils.helpers import next_weekday, check_token
 
 
@@ -44,6 +52,10 @@ to make this work, looking at the module test files or the official RF is
 
 * https://tools.ietf.org/html/rfc5545
 * https://github.com/collective/icalendar/tree/master/src/icalendar/tests
+
+Calendar applications poll the feeds regularly, so the serialized files are
+cached and their ETag and Last-Modified headers allow conditional requests.
+The events have stable UIDs, so that they are not imported again each time.
 '''
 
 
@@ -60,7 +72,7 @@ def get_calendar():
     return calendar
 
 
-def get_events_workout(calendar, workout, duration, start_date=None):
+def get_events_workout(calendar, workout, duration, start_date=None, uid_prefix=None):
     '''
     Creates all necessary events from the given workout and adds them to
     the calendar. Each event's occurrence ist set to weekly (one event for
@@ -70,12 +82,13 @@ def get_events_workout(calendar, workout, duration, start_date=None):
     :param workout: Workout
     :param duration: duration in weeks
     :param start_date: start date, default: profile default
+    :param uid_prefix: prefix of the UIDs of the events, default: the workout
     :return: None
     '''
 
     start_date = start_date if start_date else workout.creation_date
     end_date = start_date + datetime.timedelta(weeks=duration)
-    generator = UIDGenerator()
+    uid_prefix = uid_prefix if uid_prefix else 'workout-{0}'.format(workout.pk)
     site = Site.objects.get_current()
 
     for day in workout.canonical_representation['day_list']:
@@ -95,11 +108,74 @@ def get_events_workout(calendar, workout, duration, start_date=None):
             event.add('dtstart', next_weekday(start_date, weekday.id - 1))
             event.add('dtend', next_weekday(start_date, weekday.id - 1))
             event.add('rrule', {'freq': 'weekly', 'until': end_date})
-            event['uid'] = generator.uid(host_name=site.domain)
+            event['uid'] = '{0}-day-{1}-{2}@{3}'.format(uid_prefix,
+                                                        day['obj'].pk,
+                                                        weekday.id,
+                                                        site.domain)
             event.add('priority', 5)
             calendar.add_component(event)
 
 
+def load_workout(pk):
+    '''
+    Loads a workout, from its cached canonical representation if possible
+    '''
+    workout_index = cache.get(cache_mapper.get_workout_canonical(pk))
+    if workout_index:
+        return workout_index['obj']
+    return get_object_or_404(Workout, pk=pk)
+
+
+def load_schedule(pk):
+    '''
+    Loads a schedule and its steps, from the cache if possible
+
+    :return: a dictionary with the schedule and the list of its steps, as
+             tuples with the ID of the step, the ID of its workout and its
+             duration
+    '''
+    cache_key = cache_mapper.get_schedule_steps(pk)
+    schedule_steps = cache.get(cache_key)
+    if schedule_steps is None:
+        schedule = get_object_or_404(Schedule, pk=pk)
+        schedule_steps = {'obj': schedule,
+                          'steps': [(step.pk, step.workout_id, step.duration)
+                                    for step in schedule.schedulestep_set.all()]}
+        cache.set(cache_key, schedule_steps)
+    return schedule_steps
+
+
+def get_ical_response(request, cache_key, filename, render):
+    '''
+    Returns a response with an iCal file, which is only rendered if it is not cached
+
+    The ETag of the response is the cache key and the Last-Modified date the
+    time the file was rendered, so clients that already have it get a 304.
+
+    :param cache_key: the key of the file, see get_ical_cache_key
+    :param filename: the filename of the download
+    :param render: callable that renders the calendar and returns its content
+    '''
+    response = get_conditional_response(request, etag=cache_key)
+    if response is None:
+        entry = cache.get(cache_key)
+        if entry is None:
+            entry = {'content': render(),
+                     'last_modified': int(time.time())}
+            cache.set(cache_key, entry)
+
+        response = get_conditional_response(request,
+                                            etag=cache_key,
+                                            last_modified=entry['last_modified'])
+        if response is None:
+            response = HttpResponse(entry['content'], content_type='text/calendar')
+            response['Content-Disposition'] = 'attachment; filename={0}'.format(filename)
+            response['Content-Length'] = len(entry['content'])
+        response['Last-Modified'] = http_date(entry['last_modified'])
+    response['ETag'] = quote_etag(cache_key)
+    return response
+
+
 # Views
 def export(request, pk, uidb64=None, token=None):
     '''
@@ -108,28 +184,35 @@ def export(request, pk, uidb64=None, token=None):
 
     # Load the workout
     if uidb64 is not None and token is not None:
-        if check_token(uidb64, token):
-            workout = get_object_or_404(Workout, pk=pk)
-        else:
+        if not check_token(uidb64, token):
             return HttpResponseForbidden()
+        workout = load_workout(pk)
     else:
         if request.user.is_anonymous():
             return HttpResponseForbidden()
-        workout = get_object_or_404(Workout, pk=pk, user=request.user)
+        workout = load_workout(pk)
+        if workout.user_id != request.user.pk:
+            raise Http404
 
-    # Create the calendar
-    calendar = get_calendar()
+    cache_key = get_ical_cache_key('workout',
+                                   workout.pk,
+                                   workout.canonical_representation['version'],
+                                   get_user_profile_version(workout.user_id),
+                                   Site.objects.get_current().domain,
+                                   get_version())
 
-    # Create the events and add them to the calendar
-    get_events_workout(calendar, workout, workout.user.userprofile.workout_duration)
+    def render():
+        # Create the calendar
+        calendar = get_calendar()
 
-    # Send the file to the user
-    response = HttpResponse(content_type='text/calendar')
-    response['Content-Disposition'] = \
-        'attachment; filename=Calendar-workout-{0}.ics'.format(workout.pk)
-    response.write(calendar.to_ical())
-    response['Content-Length'] = len(response.content)
-    return response
+        # Create the events and add them to the calendar
+        get_events_workout(calendar, workout, workout.user.userprofile.workout_duration)
+        return calendar.to_ical()
+
+    return get_ical_response(request,
+                             cache_key,
+                             'Calendar-workout-{0}.ics'.format(workout.pk),
+                             render)
 
 
 def export_schedule(request, pk, uidb64=None, token=None):
@@ -139,28 +222,45 @@ def export_schedule(request, pk, uidb64=None, token=None):
 
     # Load the schedule
     if uidb64 is not None and token is not None:
-        if check_token(uidb64, token):
-            schedule = get_object_or_404(Schedule, pk=pk)
-        else:
+        if not check_token(uidb64, token):
             return HttpResponseForbidden()
+        schedule_steps = load_schedule(pk)
     else:
         if request.user.is_anonymous():
             return HttpResponseForbidden()
-        schedule = get_object_or_404(Schedule, pk=pk, user=request.user)
-
-    # Create the calendar
-    calendar = get_calendar()
-
-    # Create the events and add them to the calendar
-    start_date = datetime.date.today()
-    for step in schedule.schedulestep_set.all():
-        get_events_workout(calendar, step.workout, step.duration, start_date)
-        start_date = start_date + datetime.timedelta(weeks=step.duration)
-
-    # Send the file to the user
-    response = HttpResponse(content_type='text/calendar')
-    response['Content-Disposition'] = \
-        'attachment; filename=Calendar-schedule-{0}.ics'.format(schedule.pk)
-    response.write(calendar.to_ical())
-    response['Content-Length'] = len(response.content)
-    return response
+        schedule_steps = load_schedule(pk)
+        if schedule_steps['obj'].user_id != request.user.pk:
+            raise Http404
+
+    schedule = schedule_steps['obj']
+    steps = [(step_pk, load_workout(workout_pk), duration)
+             for step_pk, workout_pk, duration in schedule_steps['steps']]
+    today = datetime.date.today()
+    cache_key = get_ical_cache_key('schedule',
+                                   schedule.pk,
+                                   schedule_steps['steps'],
+                                   [workout.canonical_representation['version']
+                                    for step_pk, workout, duration in steps],
+                                   today,
+                                   Site.objects.get_current().domain,
+                                   get_version())
+
+    def render():
+        # Create the calendar
+        calendar = get_calendar()
+
+        # Create the events and add them to the calendar
+        start_date = today
+        for step_pk, workout, duration in steps:
+            get_events_workout(calendar,
+                               workout,
+                               duration,
+                               start_date,
+                               'schedule-{0}-step-{1}'.format(schedule.pk, step_pk))
+            start_date = start_date + datetime.timedelta(weeks=duration)
+        return calendar.to_ical()
+
+    return get_ical_response(request,
+                             cache_key,
+                             'Calendar-schedule-{0}.ics'.format(schedule.pk),
+                             render)
@@ -50,7 +50,7 @@ from wger.utils.generic_views import (
     WgerDeleteMixin
 )
 from wger.utils.helpers import check_access
-from wger.weight.helpers import process_log_entries, group_log_entries
+from wger.weight.helpers import process_log_entries, group_log_entries, save_workout_logs
 
 
 logger = logging.getLogger(__name__)
@@ -158,30 +158,18 @@ def add(request, pk):
         if dateform.is_valid() and session_form.is_valid() and formset.is_valid():
             log_date = dateform.cleaned_data['date']
 
-            if WorkoutSession.objects.filter(user=request.user, date=log_date).exists():
-                session = WorkoutSession.objects.get(user=request.user, date=log_date)
-                session_form = HelperWorkoutSessionForm(data=post_copy, instance=session)
-
-            # Save the Workout Session only if there is not already one for this date
-            instance = session_form.save(commit=False)
-            if not WorkoutSession.objects.filter(user=request.user, date=log_date).exists():
-                instance.date = log_date
-                instance.user = request.user
-                instance.workout = day.training
-            else:
-                session = WorkoutSession.objects.get(user=request.user, date=log_date)
-                instance.instance = session
-            instance.save()
-
             # Log entries (only the ones with actual content)
-            instances = [i for i in formset.save(commit=False) if i.reps]
-            for instance in instances:
-                if not instance.weight:
-                    instance.weight = 0
-                instance.user = request.user
-                instance.workout = day.training
-                instance.date = log_date
-                instance.save()
+            logs = [i for i in formset.save(commit=False) if i.reps]
+            for log in logs:
+                if not log.weight:
+                    log.weight = 0
+                log.workout = day.training
+                log.date = log_date
+
+            # Save the logs together with the workout session, an already
+            # existing session for this date is updated
+            session = dict(session_form.cleaned_data, date=log_date, workout=day.training)
+            save_workout_logs(request.user, logs, session)
 
             return HttpResponseRedirect(reverse('manager:log:log', kwargs={'pk': day.training_id}))
     else:
@@ -140,54 +140,10 @@ def copy_workout(request, pk):
 
         if workout_form.is_valid():
 
-            # Copy workout
-            days = workout.day_set.all()
-
-            workout_copy = workout
-            workout_copy.pk = None
-            workout_copy.comment = workout_form.cleaned_data['comment']
-            workout_copy.user = request.user
-            workout_copy.save()
-
-            # Copy the days
-            for day in days:
-                sets = day.set_set.all()
-
-                day_copy = day
-                days_of_week = [i for i in day.day.all()]
-                day_copy.pk = None
-                day_copy.training = workout_copy
-                day_copy.save()
-                for i in days_of_week:
-                    day_copy.day.add(i)
-                day_copy.save()
-
-                # Copy the sets
-                for current_set in sets:
-                    current_set_id = current_set.id
-                    exercises = current_set.exercises.all()
-
-                    current_set_copy = current_set
-                    current_set_copy.pk = None
-                    current_set_copy.exerciseday = day_copy
-                    current_set_copy.save()
-
-                    # Exercises has Many2Many relationship
-                    current_set_copy.exercises = exercises
-
-                    # Go through the exercises
-                    for exercise in exercises:
-                        settings = exercise.setting_set.filter(set_id=current_set_id)
-
-                        # Copy the settings
-                        for setting in settings:
-                            setting_copy = setting
-                            setting_copy.pk = None
-                            setting_copy.set = current_set_copy
-                            setting_copy.save()
-
+            workout_copy = workout.copy([request.user],
+                                        comment=workout_form.cleaned_data['comment'])[0]
             return HttpResponseRedirect(reverse('manager:workout:view',
-                                                kwargs={'pk': workout.id}))
+                                                kwargs={'pk': workout_copy.id}))
     else:
         workout_form = WorkoutCopyForm({'comment': workout.comment})
 
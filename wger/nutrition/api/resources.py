@@ -90,6 +90,14 @@ class NutritionPlanResource(ModelResource):
         '''
         return object_list.filter(user=bundle.request.user)
 
+    def obj_get_list(self, bundle, **kwargs):
+        '''
+        Look up the closest weight entries of all plans at once
+        '''
+        object_list = super(NutritionPlanResource, self).obj_get_list(bundle, **kwargs)
+        NutritionPlan.get_closest_weight_entries(bundle.request.user, object_list)
+        return object_list
+
     def dehydrate(self, bundle):
         '''
         Also send the nutritional values
@@ -29,6 +29,7 @@ from wger.nutrition.api.serializers import (
     IngredientSerializer
 )
 from wger.nutrition.forms import UnitChooserForm
+from wger.nutrition.helpers import ingredient_index
 from wger.nutrition.models import (
     Ingredient,
     Meal,
@@ -126,16 +127,14 @@ def search(request):
     json_response = {}
     if q:
         languages = load_ingredient_languages(request)
-        ingredients = Ingredient.objects.filter(name__icontains=q,
-                                                language__in=languages,
-                                                status__in=Ingredient.INGREDIENT_STATUS_OK)
+        ingredients = ingredient_index.search(q, languages)
 
-        for ingredient in ingredients:
+        for ingredient_id, name in ingredients:
             ingredient_json = {
-                'value': ingredient.name,
+                'value': name,
                 'data': {
-                    'id': ingredient.id,
-                    'name': ingredient.name,
+                    'id': ingredient_id,
+                    'name': name,
                 }
             }
             results.append(ingredient_json)
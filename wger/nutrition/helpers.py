@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+
+# This file is part of wger Workout Manager.
+#
+# wger Workout Manager is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# wger Workout Manager is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with Workout Manager.  If not, see <http://www.gnu.org/licenses/>.
+
+import threading
+from collections import defaultdict
+
+from wger.nutrition.models import Ingredient
+from wger.utils.cache import get_ingredient_index_version
+
+
+class IngredientIndex(object):
+    '''
+    In-memory search index over the names of the accepted ingredients
+
+    Every process keeps one index per language, they are built on the first
+    search and rebuilt after an ingredient of that language was changed. The
+    names are indexed by their trigrams, so that a search only needs to check
+    the names sharing the rarest trigram of the search term instead of the
+    whole table.
+    '''
+
+    MAX_RESULTS = 25
+    '''
+    Maximal number of results returned by a search
+    '''
+
+    NGRAM_LENGTH = 3
+
+    def __init__(self):
+        self.indexes = {}
+        self.lock = threading.Lock()
+
+    @classmethod
+    def get_ngrams(cls, name):
+        '''
+        Returns the set of n-grams of the given (lowercase) name
+        '''
+        return set(name[i:i + cls.NGRAM_LENGTH]
+                   for i in range(len(name) - cls.NGRAM_LENGTH + 1))
+
+    @classmethod
+    def build_index(cls, language_id, version):
+        '''
+        Reads the accepted ingredients of a language and indexes their names
+        '''
+        entries = list(Ingredient.objects.filter(language_id=language_id,
+                                                 status__in=Ingredient.INGREDIENT_STATUS_OK)
+                                         .values_list('id', 'name'))
+
+        # Sort shorter names first, so the matches are found already in the
+        # order used for ranking them
+        entries.sort(key=lambda entry: (len(entry[1]), entry[1].lower()))
+        names = [name.lower() for pk, name in entries]
+
+        ngrams = defaultdict(list)
+        for pos, name in enumerate(names):
+            for ngram in cls.get_ngrams(name):
+                ngrams[ngram].append(pos)
+
+        return {'version': version,
+                'entries': entries,
+                'names': names,
+                'ngrams': dict(ngrams)}
+
+    def get_index(self, language_id):
+        '''
+        Returns the index of a language, building it if necessary
+        '''
+        version = get_ingredient_index_version(language_id)
+        index = self.indexes.get(language_id)
+        if index is None or index['version'] != version:
+            with self.lock:
+                index = self.indexes.get(language_id)
+                if index is None or index['version'] != version:
+                    index = self.build_index(language_id, version)
+                    self.indexes[language_id] = index
+        return index
+
+    @classmethod
+    def find(cls, index, term):
+        '''
+        Returns the positions of the names in the index containing the term
+        '''
+        names = index['names']
+
+        # Shorter terms have no trigrams, but the autocompleter only sends
+        # terms with at least three characters anyway
+        if len(term) < cls.NGRAM_LENGTH:
+            return [pos for pos, name in enumerate(names) if term in name]
+
+        candidates = None
+        for ngram in cls.get_ngrams(term):
+            positions = index['ngrams'].get(ngram)
+            if not positions:
+                return []
+            if candidates is None or len(positions) < len(candidates):
+                candidates = positions
+        return [pos for pos in candidates if term in names[pos]]
+
+    def search(self, term, languages, limit=None):
+        '''
+        Searches the accepted ingredients whose names contain the term
+
+        The results are ranked: exact matches first, then names starting with
+        the term, then names with a word starting with it and finally all other
+        ones. Within these groups shorter names come first.
+
+        :param term: the search term, case insensitive
+        :param languages: list of languages (or their IDs) to search in
+        :param limit: maximal number of results, defaults to MAX_RESULTS
+        :return: a list of (id, name) tuples
+        '''
+        term = term.lower()
+        if not term:
+            return []
+
+        limit = limit or self.MAX_RESULTS
+
+        # Exact matches, matches at the start, at the start of a word, others
+        ranks = ([], [], [], [])
+        word_term = ' {0}'.format(term)
+        for language in languages:
+            index = self.get_index(getattr(language, 'pk', language))
+            names = index['names']
+            for pos in self.find(index, term):
+                name = names[pos]
+                if name == term:
+                    rank = ranks[0]
+                elif name.startswith(term):
+                    rank = ranks[1]
+                elif word_term in name:
+                    rank = ranks[2]
+                else:
+                    rank = ranks[3]
+
+                if len(rank) < limit:
+                    rank.append((len(name), name, index['entries'][pos]))
+
+        results = []
+        for rank in ranks:
+            results.extend(entry for length, name, entry in sorted(rank))
+        return results[:limit]
+
+
+ingredient_index = IngredientIndex()
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 *-*
+
+# This file is part of wger Workout Manager.
+#
+# wger Workout Manager is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# wger Workout Manager is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+
+
+import timeit
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from wger.core.models import Language
+from wger.nutrition.helpers import ingredient_index
+from wger.nutrition.models import Ingredient
+
+
+class Command(BaseCommand):
+    '''
+    Compares the ingredient search in the database with the in-memory index
+    '''
+
+    option_list = BaseCommand.option_list + (
+        make_option('--language',
+                    action='store',
+                    dest='language',
+                    default='en',
+                    help='Short name of the language to search in, default: en'),
+
+        make_option('--repeat',
+                    action='store',
+                    dest='repeat',
+                    type='int',
+                    default=20,
+                    help='How often each search term is searched, default: 20'),
+    )
+
+    args = '[term ...]'
+
+    help = 'Measures the time needed to search the ingredients with the database and with ' \
+           'the in-memory search index used by the autocompleter.'
+
+    default_terms = ('a', 'ch', 'egg', 'milk', 'cheese', 'chicken breast', 'raw', 'xyz')
+
+    def handle(self, *args, **options):
+        '''
+        Process the options
+        '''
+
+        language = Language.objects.get(short_name=options['language'])
+        terms = args or self.default_terms
+        repeat = options['repeat']
+
+        def search_database(term):
+            return list(Ingredient.objects.filter(name__icontains=term,
+                                                  language=language,
+                                                  status__in=Ingredient.INGREDIENT_STATUS_OK)
+                                          .values_list('id', 'name'))
+
+        def search_index(term):
+            return ingredient_index.search(term, [language])
+
+        build_time = timeit.timeit(lambda: ingredient_index.build_index(language.pk, None),
+                                   number=1)
+        search_index(terms[0])
+
+        self.stdout.write('{0} accepted ingredients, building the index took {1:.1f} ms'.format(
+            len(ingredient_index.get_index(language.pk)['entries']),
+            build_time * 1000))
+        self.stdout.write('{0:<20} {1:>8} {2:>12} {3:>12}'.format('Term',
+                                                                  'Results',
+                                                                  'Database',
+                                                                  'Index'))
+
+        for term in terms:
+            database_time = timeit.timeit(lambda: search_database(term), number=repeat)
+            index_time = timeit.timeit(lambda: search_index(term), number=repeat)
+            self.stdout.write('{0:<20} {1:>8} {2:>9.3f} ms {3:>9.3f} ms'.format(
+                term,
+                len(search_database(term)),
+                database_time * 1000 / repeat,
+                index_time * 1000 / repeat))
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 *-*
+
+# This file is part of wger Workout Manager.
+#
+# wger Workout Manager is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# wger Workout Manager is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+
+
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from wger.nutrition.models import (
+    Meal,
+    MealNutritionalValues,
+    NutritionPlan,
+    PlanNutritionalValues,
+    sum_nutritional_values
+)
+
+
+class Command(BaseCommand):
+    '''
+    Rebuilds or verifies the materialized nutritional values
+    '''
+
+    option_list = BaseCommand.option_list + (
+        make_option('--verify',
+                    action='store_true',
+                    dest='verify',
+                    default=False,
+                    help='Only compare the saved values with freshly calculated ones'),
+    )
+
+    help = 'Rebuilds the saved nutritional values of all meals and nutrition plans. With ' \
+           '--verify nothing is changed, the saved values are only checked and an error ' \
+           'is raised if any of them are wrong.'
+
+    def handle(self, **options):
+        '''
+        Process the options
+        '''
+
+        errors = 0
+        for model, queryset in ((MealNutritionalValues, Meal.objects.all()),
+                                (PlanNutritionalValues, NutritionPlan.objects.all())):
+            if int(options['verbosity']) >= 2:
+                self.stdout.write("** Processing {0}".format(model._meta.verbose_name_plural))
+
+            for owner in queryset.iterator():
+                for use_metric in (True, False):
+                    if not options['verify']:
+                        model.rebuild(owner, use_metric)
+                        continue
+
+                    values = model.objects.filter(use_metric=use_metric,
+                                                  **{model.owner_field: owner}).first()
+                    if not values:
+                        continue
+
+                    expected = sum_nutritional_values(model.get_items(owner), use_metric)
+                    for key, value in expected.items():
+                        if getattr(values, key) != value:
+                            errors += 1
+                            self.stdout.write("* {0} {1}, {2}: {3} instead of {4}".format(
+                                model.owner_field,
+                                owner.pk,
+                                key,
+                                getattr(values, key),
+                                value))
+
+        if errors:
+            raise CommandError('Found {0} wrong nutritional values, run this command '
+                               'without --verify to fix them'.format(errors))
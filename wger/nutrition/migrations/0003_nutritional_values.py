@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.13 on 2026-10-17 01:20
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('nutrition', '0002_auto_20180530_0456'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MealNutritionalValues',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('use_metric', models.BooleanField(editable=False)),
+                ('energy', models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=12)),
+                ('protein', models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=12)),
+                ('carbohydrates', models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=12)),
+                ('carbohydrates_sugar', models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=12)),
+                ('fat', models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=12)),
+                ('fat_saturated', models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=12)),
+                ('fibres', models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=12)),
+                ('sodium', models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=12)),
+                ('meal', models.ForeignKey(editable=False, on_delete=django.db.models.deletion.CASCADE, to='nutrition.Meal')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='PlanNutritionalValues',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('use_metric', models.BooleanField(editable=False)),
+                ('energy', models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=12)),
+                ('protein', models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=12)),
+                ('carbohydrates', models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=12)),
+                ('carbohydrates_sugar', models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=12)),
+                ('fat', models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=12)),
+                ('fat_saturated', models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=12)),
+                ('fibres', models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=12)),
+                ('sodium', models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=12)),
+                ('plan', models.ForeignKey(editable=False, on_delete=django.db.models.deletion.CASCADE, to='nutrition.NutritionPlan')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='plannutritionalvalues',
+            unique_together=set([('plan', 'use_metric')]),
+        ),
+        migrations.AlterUniqueTogether(
+            name='mealnutritionalvalues',
+            unique_together=set([('meal', 'use_metric')]),
+        ),
+    ]
@@ -14,10 +14,14 @@
 #
 # You should have received a copy of the GNU Affero General Public License
 # along with Workout Manager.  If not, see <http://www.gnu.org/licenses/>.
+import bisect
+import copy
 import logging
 from decimal import Decimal
 
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Case, DecimalField, ExpressionWrapper, F, Value, When
+from django.db.models.functions import Coalesce
 
 from django.template.loader import render_to_string
 from django.template.defaultfilters import slugify  # django.utils.text.slugify in django 1.5!
@@ -32,13 +36,20 @@ from django.utils.encoding import python_2_unicode_compatible
 from django.utils.translation import ugettext_lazy as _
 from django.utils import translation
 from django.conf import settings
-from django.db.models.signals import post_save, post_delete
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete
 from django.dispatch import receiver
 
-from wger.core.models import Language
+from wger.core.models import Language, UserProfile
 from wger.utils.constants import TWOPLACES
-from wger.utils.cache import cache_mapper
+from wger.utils.cache import (
+    cache_mapper,
+    delete_on_commit,
+    reset_ingredient_index,
+    reset_nutrition_plan_summary,
+    reset_nutrition_plan_version
+)
 from wger.utils.fields import Html5TimeField
+from wger.utils.helpers import bulk_copy
 from wger.utils.models import AbstractLicenseModel
 from wger.utils.units import AbstractWeight
 from wger.weight.models import WeightEntry
@@ -56,6 +67,18 @@ ENERGY_FACTOR = {'protein': {'kg': 4,
 Simple approximation of energy (kcal) provided per gram or ounce
 '''
 
+NUTRITIONAL_VALUES = ('energy',
+                      'protein',
+                      'carbohydrates',
+                      'carbohydrates_sugar',
+                      'fat',
+                      'fat_saturated',
+                      'fibres',
+                      'sodium')
+'''
+The nutritional values that are calculated for items, meals and plans
+'''
+
 
 logger = logging.getLogger(__name__)
 
@@ -72,6 +95,12 @@ class NutritionPlan(models.Model):
         # Order by creation_date, descending (oldest first)
         ordering = ["-creation_date", ]
 
+    SUMMARY_CACHE_SIZE = 150
+    '''
+    Maximal number of plans shown in the overview, only their summaries are
+    cached per user
+    '''
+
     user = models.ForeignKey(User,
                              verbose_name=_('User'),
                              editable=False)
@@ -107,6 +136,30 @@ class NutritionPlan(models.Model):
         '''
         return reverse('nutrition:plan:view', kwargs={'id': self.id})
 
+    @transaction.atomic
+    def copy(self, users):
+        '''
+        Copies the plan with its meals and items to each of the users
+
+        Only the plans themselves are saved one by one, the rest is copied
+        with a bulk insert per model. The materialized nutritional values are
+        the same, so they are copied as well.
+
+        :param users: the users that get a copy
+        :return: list with the copies, in the order of the users
+        '''
+        plan_copies = []
+        for user in users:
+            plan_copy = copy.copy(self)
+            plan_copy.pk = None
+            plan_copy.user = user
+            plan_copy.save()
+            plan_copies.append(plan_copy)
+
+        copy_plan_meals({self.pk: [plan.pk for plan in plan_copies]})
+
+        return plan_copies
+
     def get_nutritional_values(self):
         '''
         Sums the nutritional info of all items in the plan
@@ -133,10 +186,9 @@ class NutritionPlan(models.Model):
                     }
 
             # Energy
-            for meal in self.meal_set.select_related():
-                values = meal.get_nutritional_values(use_metric=use_metric)
-                for key in result['total'].keys():
-                    result['total'][key] += values[key]
+            values = PlanNutritionalValues.get_values(self, use_metric)
+            for key in result['total'].keys():
+                result['total'][key] += values[key]
 
             energy = result['total']['energy']
 
@@ -163,34 +215,118 @@ class NutritionPlan(models.Model):
             
         return result
 
+    def get_meal_nutritional_values(self, use_metric=True):
+        '''
+        Sums the nutritional info of the items of all meals in the plan
+
+        :param use_metric Flag that controls the units used
+        :return: a dictionary with the meal IDs and their nutritional values
+        '''
+        result = {meal_id: dict.fromkeys(NUTRITIONAL_VALUES, 0)
+                  for meal_id in self.meal_set.values_list('id', flat=True)}
+
+        items = MealItem.objects.with_nutritional_values() \
+            .filter(meal__plan=self) \
+            .values('meal_id', *NUTRITIONAL_VALUES)
+        for item in items:
+            values = convert_nutritional_values(item, use_metric)
+            for key in NUTRITIONAL_VALUES:
+                result[item['meal_id']][key] += values[key]
+
+        return result
+
     @staticmethod
     def get_nutritional_plans(user):
+        '''
+        Returns the summaries of the user's most recent nutrition plans
+
+        The summaries are cached per user. Like the list, at most
+        SUMMARY_CACHE_SIZE of them are kept, so that every summary shown is
+        also cached.
+
+        :param user: the user
+        :return: a list of dictionaries with the plan, its energy and the
+                 approximation to the user's calorie goal
+        '''
+        cache_key = cache_mapper.get_nutrition_plan_summary(user)
+        summary_cache = cache.get(cache_key) or {'plan_ids': None, 'summaries': {}}
+        changed = summary_cache['plan_ids'] is None
+        if changed:
+            summary_cache['plan_ids'] = list(NutritionPlan.objects.filter(user=user)
+                                             .values_list('id', flat=True)
+                                             [:NutritionPlan.SUMMARY_CACHE_SIZE])
+
+        summaries = summary_cache['summaries']
+        missing_plans = NutritionPlan.objects.select_related('user__userprofile')\
+            .in_bulk([pk for pk in summary_cache['plan_ids'] if pk not in summaries])
+        if missing_plans:
+            NutritionPlan.get_closest_weight_entries(user, missing_plans.values())
+        result = []
+        for pk in summary_cache['plan_ids']:
+            if pk in summaries:
+                result.append(summaries[pk])
+            elif pk in missing_plans:
+                result.append(missing_plans[pk].get_summary())
+
+        # Drop the summaries of the plans that are not in the list anymore
+        summary_cache['summaries'] = {summary['plan'].pk: summary for summary in result}
+        if changed or missing_plans or len(summaries) != len(result):
+            cache.set(cache_key, summary_cache)
+        return result
 
-        plans_dict = cache.get('nutritional_plans')
-        if not plans_dict:
-            plans_dict = {}
-            plans = NutritionPlan.objects.filter(user=user)[:150]
-            for plan in plans:
-                plans_dict["plan-{}".format(plan.id)] = plan
-                cache.set('nutritional_plans', plans_dict)
-        return plans_dict.values()
+    def get_summary(self):
+        '''
+        Returns a short summary of the plan, used e.g. in the plan overview
+        '''
+        nutritional_values = self.get_nutritional_values()
+        return {'plan': self,
+                'energy': nutritional_values['total']['energy'],
+                'calories_approximation': self.get_calories_approximation(nutritional_values)}
 
     def get_closest_weight_entry(self):
         '''
         Returns the closest weight entry for the nutrition plan.
         Returns None if there are no entries.
         '''
-        target = self.creation_date
-        closest_entry_gte = WeightEntry.objects.filter(user=self.user) \
-            .filter(date__gte=target).order_by('date').first()
-        closest_entry_lte = WeightEntry.objects.filter(user=self.user) \
-            .filter(date__lte=target).order_by('-date').first()
-        if closest_entry_gte is None or closest_entry_lte is None:
-            return closest_entry_gte or closest_entry_lte
-        if abs(closest_entry_gte.date - target) < abs(closest_entry_lte.date - target):
-            return closest_entry_gte
-        else:
-            return closest_entry_lte
+        if not hasattr(self, '_closest_weight_entry'):
+            NutritionPlan.get_closest_weight_entries(self.user, [self])
+        return self._closest_weight_entry
+
+    @staticmethod
+    def get_closest_weight_entries(user, plans):
+        '''
+        Returns the closest weight entries for several nutrition plans
+
+        The weight entries of the user are read once and searched for each
+        plan's creation date. The entries are also remembered on the plans, so
+        get_closest_weight_entry doesn't need to query them again.
+
+        :param user: the user the plans belong to
+        :param plans: list of nutrition plans
+        :return: a dictionary with the plan IDs and their closest weight
+                 entry, None if the user has no weight entries
+        '''
+        entries = list(WeightEntry.objects.filter(user=user).order_by('date'))
+        dates = [entry.date for entry in entries]
+
+        result = {}
+        for plan in plans:
+            target = plan.creation_date
+            pos_gte = bisect.bisect_left(dates, target)
+            pos_lte = bisect.bisect_right(dates, target) - 1
+            closest_entry_gte = entries[pos_gte] if pos_gte < len(entries) else None
+            closest_entry_lte = entries[pos_lte] if pos_lte >= 0 else None
+
+            if closest_entry_gte is None or closest_entry_lte is None:
+                closest_entry = closest_entry_gte or closest_entry_lte
+            elif abs(closest_entry_gte.date - target) < abs(closest_entry_lte.date - target):
+                closest_entry = closest_entry_gte
+            else:
+                closest_entry = closest_entry_lte
+
+            plan._closest_weight_entry = closest_entry
+            result[plan.pk] = closest_entry
+        return result
 
     def get_owner_object(self):
         '''
@@ -198,14 +334,18 @@ class NutritionPlan(models.Model):
         '''
         return self
 
-    def get_calories_approximation(self):
+    def get_calories_approximation(self, nutritional_values=None):
         '''
         Calculates the deviation from the goal calories and the actual
         amount of the current plan
+
+        :param nutritional_values: the plan's nutritional values, if already known
         '''
+        if nutritional_values is None:
+            nutritional_values = self.get_nutritional_values()
 
         goal_calories = self.user.userprofile.calories
-        actual_calories = self.get_nutritional_values()['total']['energy']
+        actual_calories = nutritional_values['total']['energy']
 
         # Within 3%
         if (actual_calories < goal_calories * 1.03) and (actual_calories > goal_calories * 0.97):
@@ -396,7 +536,8 @@ class Ingredient(AbstractLicenseModel, models.Model):
         '''
 
         super(Ingredient, self).save(*args, **kwargs)
-        cache.delete(cache_mapper.get_ingredient_key(self.id))
+        delete_on_commit(cache_mapper.get_ingredient_key(self.id))
+        reset_ingredient_index(self.language_id)
 
     def __str__(self):
         '''
@@ -567,27 +708,33 @@ class Meal(models.Model):
 
         :param use_metric Flag that controls the units used
         '''
-        nutritional_info = {'energy': 0,
-                            'protein': 0,
-                            'carbohydrates': 0,
-                            'carbohydrates_sugar': 0,
-                            'fat': 0,
-                            'fat_saturated': 0,
-                            'fibres': 0,
-                            'sodium': 0}
+        return MealNutritionalValues.get_values(self, use_metric)
 
-        # Get the calculated values from the meal item and add them
-        for item in self.mealitem_set.select_related():
 
-            values = item.get_nutritional_values(use_metric=use_metric)
-            for key in nutritional_info.keys():
-                nutritional_info[key] += values[key]
+class MealItemQuerySet(models.QuerySet):
+    '''
+    Custom queryset for meal items
+    '''
 
-        # Only 2 decimal places, anything else doesn't make sense
-        for i in nutritional_info:
-            nutritional_info[i] = Decimal(nutritional_info[i]).quantize(TWOPLACES)
+    def with_nutritional_values(self):
+        '''
+        Annotates the items with their nutritional values
 
-        return nutritional_info
+        The weight of the item is converted to grams in the database, so all
+        nutritional values of any number of items can be read with one query.
+        '''
+        output_field = DecimalField(max_digits=20, decimal_places=10)
+        item_weight = Case(When(weight_unit__isnull=True, then=F('amount')),
+                           default=F('amount') * F('weight_unit__amount') * F('weight_unit__gram'),
+                           output_field=output_field)
+
+        annotations = {}
+        for key in NUTRITIONAL_VALUES:
+            annotations[key] = ExpressionWrapper(
+                Coalesce(F('ingredient__{0}'.format(key)), 0) * item_weight
+                / Value(Decimal('100.0')),
+                output_field=output_field)
+        return self.annotate(**annotations)
 
 
 @python_2_unicode_compatible
@@ -618,6 +765,8 @@ class MealItem(models.Model):
                                    default='Planned',
                                    verbose_name=_('Meal choice'))
 
+    objects = MealItemQuerySet.as_manager()
+
     def __str__(self):
         '''
         Return a more human-readable representation
@@ -683,22 +832,281 @@ class MealItem(models.Model):
         if self.ingredient.sodium:
             nutritional_info['sodium'] += self.ingredient.sodium * item_weight / 100
 
-        # If necessary, convert weight units
-        if not use_metric:
-            for key, value in nutritional_info.items():
+        return convert_nutritional_values(nutritional_info, use_metric)
+
+
+def convert_nutritional_values(values, use_metric=True):
+    '''
+    Converts the nutritional values of a single meal item to the user's units
 
-                # Energy is not a weight!
-                if key == 'energy':
-                    continue
+    :param values: dictionary with the values in grams
+    :param use_metric Flag that controls the units used
+    :return: a new dictionary with the converted and quantized values
+    '''
+    nutritional_info = {}
+    for key in NUTRITIONAL_VALUES:
+        value = values[key] or 0
 
-                # Everything else, to ounces
-                nutritional_info[key] = AbstractWeight(value, 'g').oz
+        # If necessary, convert weight units. Energy is not a weight!
+        if not use_metric and key != 'energy':
+            value = AbstractWeight(value, 'g').oz
 
         # Only 2 decimal places, anything else doesn't make sense
-        for i in nutritional_info:
-            nutritional_info[i] = Decimal(nutritional_info[i]).quantize(TWOPLACES)
+        nutritional_info[key] = Decimal(value).quantize(TWOPLACES)
 
-        return nutritional_info
+    return nutritional_info
+
+
+def sum_nutritional_values(items, use_metric=True):
+    '''
+    Sums the nutritional values of the given meal items
+
+    :param items: queryset of meal items
+    :param use_metric Flag that controls the units used
+    :return: a dictionary with the nutritional values
+    '''
+    nutritional_info = dict.fromkeys(NUTRITIONAL_VALUES, 0)
+    for item in items.with_nutritional_values().values(*NUTRITIONAL_VALUES):
+        values = convert_nutritional_values(item, use_metric)
+        for key in NUTRITIONAL_VALUES:
+            nutritional_info[key] += values[key]
+
+    # Only 2 decimal places, anything else doesn't make sense
+    for i in nutritional_info:
+        nutritional_info[i] = Decimal(nutritional_info[i]).quantize(TWOPLACES)
+
+    return nutritional_info
+
+
+class AbstractNutritionalValues(models.Model):
+    '''
+    Materialized nutritional values
+
+    The values are the sums of the already converted and quantized values of
+    the individual meal items, so they can be updated by simply applying the
+    difference of a changed item.
+    '''
+
+    class Meta:
+        abstract = True
+
+    use_metric = models.BooleanField(editable=False)
+    energy = models.DecimalField(decimal_places=2, max_digits=12, default=0, editable=False)
+    protein = models.DecimalField(decimal_places=2, max_digits=12, default=0, editable=False)
+    carbohydrates = models.DecimalField(decimal_places=2,
+                                        max_digits=12,
+                                        default=0,
+                                        editable=False)
+    carbohydrates_sugar = models.DecimalField(decimal_places=2,
+                                              max_digits=12,
+                                              default=0,
+                                              editable=False)
+    fat = models.DecimalField(decimal_places=2, max_digits=12, default=0, editable=False)
+    fat_saturated = models.DecimalField(decimal_places=2,
+                                        max_digits=12,
+                                        default=0,
+                                        editable=False)
+    fibres = models.DecimalField(decimal_places=2, max_digits=12, default=0, editable=False)
+    sodium = models.DecimalField(decimal_places=2, max_digits=12, default=0, editable=False)
+
+    # The field pointing to the meal or plan
+    owner_field = None
+
+    # The lookup from the meal items to the meal or plan
+    items_lookup = None
+
+    @classmethod
+    def get_items(cls, owner):
+        '''
+        Returns the meal items the values are calculated from
+        '''
+        return MealItem.objects.filter(**{cls.items_lookup: owner})
+
+    @classmethod
+    def get_values(cls, owner, use_metric=True):
+        '''
+        Returns the nutritional values, they are calculated if necessary
+
+        :param owner: the meal or plan
+        :param use_metric Flag that controls the units used
+        '''
+        values = cls.objects.filter(use_metric=use_metric, **{cls.owner_field: owner}).first()
+        if not values:
+            values = cls.rebuild(owner, use_metric)
+        return {key: Decimal(getattr(values, key)).quantize(TWOPLACES)
+                for key in NUTRITIONAL_VALUES}
+
+    @classmethod
+    def rebuild(cls, owner, use_metric=True):
+        '''
+        Calculates and saves the nutritional values from the meal items
+
+        :param owner: the meal or plan
+        :param use_metric Flag that controls the units used
+        '''
+        values, created = cls.objects.update_or_create(
+            defaults=sum_nutritional_values(cls.get_items(owner), use_metric),
+            use_metric=use_metric,
+            **{cls.owner_field: owner})
+        return values
+
+    @classmethod
+    def apply_delta(cls, owner_id, use_metric, delta):
+        '''
+        Adds the given differences to the materialized values, if present
+
+        :param owner_id: the ID of the meal or plan
+        :param use_metric Flag that controls the units used
+        :param delta: dictionary with the differences of the nutritional values
+        '''
+        changes = {key: F(key) + value for key, value in delta.items() if value}
+        if changes:
+            cls.objects.filter(use_metric=use_metric, **{cls.owner_field + '_id': owner_id}) \
+                .update(**changes)
+
+
+class MealNutritionalValues(AbstractNutritionalValues):
+    '''
+    Materialized nutritional values of a meal
+    '''
+
+    class Meta:
+        unique_together = ('meal', 'use_metric')
+
+    meal = models.ForeignKey(Meal, editable=False)
+
+    owner_field = 'meal'
+    items_lookup = 'meal'
+
+    def get_owner_object(self):
+        '''
+        Returns the object that has owner information
+        '''
+        return self.meal.plan
+
+
+class PlanNutritionalValues(AbstractNutritionalValues):
+    '''
+    Materialized nutritional values of a nutrition plan
+    '''
+
+    class Meta:
+        unique_together = ('plan', 'use_metric')
+
+    plan = models.ForeignKey(NutritionPlan, editable=False)
+
+    owner_field = 'plan'
+    items_lookup = 'meal__plan'
+
+    def get_owner_object(self):
+        '''
+        Returns the object that has owner information
+        '''
+        return self.plan
+
+
+def copy_plan_meals(plan_pks):
+    '''
+    Copies the meals, items and nutritional values of plans that were copied
+    already, with a bulk insert per model
+
+    :param plan_pks: dictionary with the IDs of the copies for the ID of each
+                     plan, see bulk_copy
+    '''
+    meal_pks = bulk_copy(Meal.objects.filter(plan__in=list(plan_pks)), 'plan', plan_pks)
+    bulk_copy(MealItem.objects.filter(meal__in=list(meal_pks)), 'meal', meal_pks)
+    bulk_copy(MealNutritionalValues.objects.filter(meal__in=list(meal_pks)), 'meal', meal_pks)
+    bulk_copy(PlanNutritionalValues.objects.filter(plan__in=list(plan_pks)), 'plan', plan_pks)
+
+
+def get_meal_item_values(pk):
+    '''
+    Returns the meal and plan IDs and the nutritional values of a meal item
+    '''
+    return MealItem.objects.with_nutritional_values() \
+        .filter(pk=pk) \
+        .values('meal_id', 'meal__plan_id', *NUTRITIONAL_VALUES) \
+        .first()
+
+
+def update_nutritional_values(old_values, new_values):
+    '''
+    Applies the difference between two versions of a meal item to the
+    materialized nutritional values of its meal and plan
+
+    :param old_values: the item values before the change, None if new
+    :param new_values: the item values after the change, None if deleted
+    '''
+    for use_metric in (True, False):
+        deltas = {}
+        for item_values, sign in ((old_values, -1), (new_values, 1)):
+            if not item_values:
+                continue
+
+            values = convert_nutritional_values(item_values, use_metric)
+            for owner in ((MealNutritionalValues, item_values['meal_id']),
+                          (PlanNutritionalValues, item_values['meal__plan_id'])):
+                delta = deltas.setdefault(owner, dict.fromkeys(NUTRITIONAL_VALUES, 0))
+                for key in NUTRITIONAL_VALUES:
+                    delta[key] += sign * values[key]
+
+        for (model, owner_id), delta in deltas.items():
+            model.apply_delta(owner_id, use_metric, delta)
+
+
+@receiver(pre_save, sender=MealItem)
+@receiver(pre_delete, sender=MealItem)
+def collect_nutritional_values(sender, instance, **kwargs):
+    '''
+    Remember the nutritional values of the meal item before it changes
+    '''
+    instance._original_nutritional_values = get_meal_item_values(instance.pk) \
+        if instance.pk else None
+
+
+@receiver(post_save, sender=MealItem)
+def update_nutritional_values_on_save(sender, instance, **kwargs):
+    '''
+    Update the materialized nutritional values of the item's meal and plan
+    '''
+    update_nutritional_values(getattr(instance, '_original_nutritional_values', None),
+                              get_meal_item_values(instance.pk))
+
+
+@receiver(post_delete, sender=MealItem)
+def update_nutritional_values_on_delete(sender, instance, **kwargs):
+    '''
+    Update the materialized nutritional values of the item's meal and plan
+    '''
+    update_nutritional_values(getattr(instance, '_original_nutritional_values', None), None)
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_save, sender=IngredientWeightUnit)
+def rebuild_nutritional_values(sender, instance, **kwargs):
+    '''
+    Recalculate the materialized values of all meals using a changed ingredient
+    '''
+    if kwargs.get('created') or kwargs.get('raw'):
+        return
+
+    if sender == Ingredient:
+        meals = Meal.objects.filter(mealitem__ingredient=instance)
+    else:
+        meals = Meal.objects.filter(mealitem__weight_unit=instance)
+
+    plans = set()
+    for meal in meals.select_related('plan').distinct():
+        plans.add(meal.plan)
+        for use_metric in (True, False):
+            MealNutritionalValues.rebuild(meal, use_metric)
+
+    for plan in plans:
+        for use_metric in (True, False):
+            PlanNutritionalValues.rebuild(plan, use_metric)
+        delete_on_commit(cache_mapper.get_nutrition_item(plan.pk))
+        reset_nutrition_plan_summary(plan.user_id, plan.pk)
+        reset_nutrition_plan_version(plan.pk)
 
 
 @receiver(post_save, sender=NutritionPlan)
@@ -714,8 +1122,29 @@ def handle_cache(sender, **kwargs):
     
     model = kwargs.get('instance')
     if isinstance(model, (Meal, MealItem)):
-        cache.delete(cache_mapper.get_nutrition_item(model.get_owner_object().id))
+        plan = model.get_owner_object()
+        delete_on_commit(cache_mapper.get_nutrition_item(plan.id))
+        reset_nutrition_plan_summary(plan.user_id, plan.id)
+        reset_nutrition_plan_version(plan.id)
     else:
         
-        cache.delete(cache_mapper.get_nutrition_item(model.id))
+        delete_on_commit(cache_mapper.get_nutrition_item(model.id))
+        reset_nutrition_plan_summary(model.user_id, model.id, reset_list=True)
+        reset_nutrition_plan_version(model.id)
+
+
+@receiver(post_delete, sender=Ingredient)
+def handle_ingredient_index(sender, instance, **kwargs):
+    '''
+    Remove deleted ingredients from the search index
+    '''
+    reset_ingredient_index(instance.language_id)
+
+
+@receiver(post_save, sender=UserProfile)
+def handle_summary_cache(sender, instance, **kwargs):
+    '''
+    The plan summaries depend on the user's calorie goal and units
+    '''
+    reset_nutrition_plan_summary(instance.user_id)
     
\ No newline at end of file
@@ -12,10 +12,11 @@
 #
 # You should have received a copy of the GNU Affero General Public License
 
+from django.contrib.auth.models import User
 from django.core.urlresolvers import reverse
 
 from wger.core.tests.base_testcase import WorkoutManagerTestCase
-from wger.nutrition.models import NutritionPlan
+from wger.nutrition.models import MealItem, NutritionPlan, PlanNutritionalValues
 
 
 class CopyPlanTestCase(WorkoutManagerTestCase):
@@ -77,3 +78,30 @@ class CopyPlanTestCase(WorkoutManagerTestCase):
 
         self.user_login('admin')
         self.copy_plan(fail=True)
+
+    def test_copy_many_users(self):
+        '''
+        Test copying a nutritional plan to several users at once
+        '''
+        plan = NutritionPlan.objects.get(pk=4)
+        values = PlanNutritionalValues.get_values(plan)
+        users = list(User.objects.filter(username__in=('member1', 'member2')))
+
+        copies = plan.copy(users)
+        self.assertEqual([copy.user for copy in copies], users)
+
+        def get_items(plan):
+            return sorted((i.ingredient_id, i.amount, i.weight_unit_id or 0, str(i.meal.time),
+                           i.order)
+                          for i in MealItem.objects.filter(meal__plan=plan))
+
+        items_original = get_items(plan)
+        for copy in copies:
+            self.assertEqual(copy.description, plan.description)
+            self.assertEqual(sorted(str(meal.time) for meal in plan.meal_set.all()),
+                             sorted(str(meal.time) for meal in copy.meal_set.all()))
+            self.assertEqual(get_items(copy), items_original)
+
+            # The materialized values were copied as well
+            self.assertTrue(PlanNutritionalValues.objects.filter(plan=copy).exists())
+            self.assertEqual(PlanNutritionalValues.get_values(copy), values)
@@ -28,6 +28,7 @@ from wger.core.tests.base_testcase import (
     WorkoutManagerEditTestCase,
     WorkoutManagerAddTestCase
 )
+from wger.nutrition.helpers import ingredient_index
 from wger.nutrition.models import Ingredient
 from wger.nutrition.models import Meal
 from wger.utils.constants import NUTRITION_TAB
@@ -187,8 +188,8 @@ class IngredientSearchTestCase(WorkoutManagerTestCase):
         self.assertEqual(response.status_code, 200)
         result = json.loads(response.content.decode('utf8'))
         self.assertEqual(len(result['suggestions']), 2)
-        self.assertEqual(result['suggestions'][0]['value'], 'Ingredient, test, 2, organic, raw')
-        self.assertEqual(result['suggestions'][1]['value'], 'Test ingredient 1')
+        self.assertEqual(result['suggestions'][0]['value'], 'Test ingredient 1')
+        self.assertEqual(result['suggestions'][1]['value'], 'Ingredient, test, 2, organic, raw')
 
         # Search for an ingredient pending review (0 hits, "Pending ingredient")
         response = self.client.get(reverse('ingredient-search'), {'term': 'Pending'}, **kwargs)
@@ -212,6 +213,54 @@ class IngredientSearchTestCase(WorkoutManagerTestCase):
         self.search_ingredient()
 
 
+class IngredientIndexTestCase(WorkoutManagerTestCase):
+    '''
+    Tests the in-memory ingredient search index
+    '''
+
+    def search(self, term, **kwargs):
+        '''
+        Helper returning the names found in english
+        '''
+        return [name for pk, name in ingredient_index.search(term, [2], **kwargs)]
+
+    def test_same_results_as_database(self):
+        '''
+        Test that the index finds the same ingredients as the database
+        '''
+        for term in ('a', 'TE', 'test', 'ingredient', 'raw', 'xyz', 'organic, r'):
+            expected = Ingredient.objects.filter(name__icontains=term,
+                                                 language_id=2,
+                                                 status__in=Ingredient.INGREDIENT_STATUS_OK)
+            self.assertEqual(sorted(self.search(term, limit=1000)),
+                             sorted(expected.values_list('name', flat=True)))
+
+    def test_ranking(self):
+        '''
+        Test that the results are ranked and limited
+        '''
+        ingredient = Ingredient.objects.get(pk=1)
+        ingredient.name = 'Raw'
+        ingredient.save()
+
+        self.assertEqual(self.search('raw')[0], 'Raw')
+        self.assertEqual(len(self.search('e', limit=2)), 2)
+
+    def test_update(self):
+        '''
+        Test that the index is updated when ingredients change
+        '''
+        self.assertFalse(self.search('supercalifragilistic'))
+
+        ingredient = Ingredient.objects.get(pk=1)
+        ingredient.name = 'Supercalifragilistic'
+        ingredient.save()
+        self.assertEqual(self.search('supercalifragilistic'), ['Supercalifragilistic'])
+
+        ingredient.delete()
+        self.assertFalse(self.search('supercalifragilistic'))
+
+
 class IngredientValuesTestCase(WorkoutManagerTestCase):
     '''
     Tests the nutritional value calculator for an ingredient
@@ -142,3 +142,31 @@ class NutritionalValuesCalculationsTestCase(WorkoutManagerTestCase):
         self.assertEqual(values['per_kg']['carbohydrates'], Decimal(4.96).quantize(TWOPLACES))
         self.assertEqual(values['per_kg']['fat'], Decimal(1.51).quantize(TWOPLACES))
         self.assertEqual(values['per_kg']['protein'], Decimal(4.33).quantize(TWOPLACES))
+
+    def test_calculations_aggregated(self):
+        '''
+        Tests that the values aggregated in the database match the item values
+        '''
+        for use_metric in (True, False):
+            for plan in models.NutritionPlan.objects.all():
+                meal_values = plan.get_meal_nutritional_values(use_metric=use_metric)
+                for meal in plan.meal_set.all():
+                    result_total = dict.fromkeys(models.NUTRITIONAL_VALUES, 0)
+                    for item in meal.mealitem_set.all():
+                        values = item.get_nutritional_values(use_metric=use_metric)
+                        for key in result_total:
+                            result_total[key] += values[key]
+
+                    self.assertEqual(meal.get_nutritional_values(use_metric=use_metric),
+                                     result_total)
+                    self.assertEqual(meal_values[meal.id], result_total)
+
+    def test_calculations_query_count(self):
+        '''
+        Tests that the nutritional values of a plan are read with a fixed number of queries
+        '''
+        plan = models.NutritionPlan.objects.get(pk=4)
+        self.assertTrue(models.MealItem.objects.filter(meal__plan=plan).count() > 1)
+
+        with self.assertNumQueries(2):
+            plan.get_meal_nutritional_values()
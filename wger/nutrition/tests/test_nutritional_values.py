@@ -0,0 +1,130 @@
+# This file is part of wger Workout Manager.
+#
+# wger Workout Manager is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# wger Workout Manager is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with Workout Manager.  If not, see <http://www.gnu.org/licenses/>.
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.utils.six import StringIO
+
+from wger.core.tests.base_testcase import WorkoutManagerTestCase
+from wger.nutrition import models
+
+
+class NutritionalValuesTestCase(WorkoutManagerTestCase):
+    '''
+    Tests the materialized nutritional values of meals and plans
+    '''
+
+    def get_values(self, model, owner, use_metric=True):
+        '''
+        Helper returning the saved values
+        '''
+        values = model.objects.get(use_metric=use_metric, **{model.owner_field: owner})
+        return {key: getattr(values, key) for key in models.NUTRITIONAL_VALUES}
+
+    def assertValuesCorrect(self, meal):
+        '''
+        Helper comparing the saved values with freshly calculated ones
+        '''
+        for use_metric in (True, False):
+            self.assertEqual(self.get_values(models.MealNutritionalValues, meal, use_metric),
+                             models.sum_nutritional_values(meal.mealitem_set.all(), use_metric))
+            self.assertEqual(self.get_values(models.PlanNutritionalValues, meal.plan, use_metric),
+                             models.sum_nutritional_values(
+                                 models.MealItem.objects.filter(meal__plan=meal.plan),
+                                 use_metric))
+
+    def test_create(self):
+        '''
+        Test that the values are created on first access
+        '''
+        plan = models.NutritionPlan.objects.get(pk=4)
+        self.assertFalse(models.PlanNutritionalValues.objects.filter(plan=plan).exists())
+
+        values = plan.get_nutritional_values()
+        self.assertEqual(values['total'], self.get_values(models.PlanNutritionalValues, plan))
+
+        with self.assertNumQueries(1):
+            models.PlanNutritionalValues.get_values(plan)
+
+    def test_update_item(self):
+        '''
+        Test that changing, adding and deleting items updates the values
+        '''
+        meal = models.Meal.objects.get(pk=7)
+        for use_metric in (True, False):
+            meal.get_nutritional_values(use_metric)
+            models.PlanNutritionalValues.get_values(meal.plan, use_metric)
+
+        item = meal.mealitem_set.first()
+        item.amount = 321
+        item.save()
+        self.assertValuesCorrect(meal)
+
+        item.weight_unit = models.IngredientWeightUnit.objects.get(pk=1)
+        item.ingredient = item.weight_unit.ingredient
+        item.save()
+        self.assertValuesCorrect(meal)
+
+        new_item = models.MealItem(meal=meal, ingredient_id=2, amount=80, order=10)
+        new_item.save()
+        self.assertValuesCorrect(meal)
+
+        new_item.delete()
+        self.assertValuesCorrect(meal)
+
+    def test_update_ingredient(self):
+        '''
+        Test that changing an ingredient updates the values of the meals using it
+        '''
+        meal = models.Meal.objects.get(pk=7)
+        meal.get_nutritional_values()
+
+        ingredient = meal.mealitem_set.first().ingredient
+        ingredient.protein += 10
+        ingredient.save()
+        self.assertValuesCorrect(meal)
+
+    def test_delete_meal(self):
+        '''
+        Test that deleting a meal updates the values of the plan
+        '''
+        meal = models.Meal.objects.get(pk=7)
+        plan = meal.plan
+        plan.get_nutritional_values()
+
+        meal.delete()
+        self.assertFalse(models.MealNutritionalValues.objects.filter(meal_id=7).exists())
+        self.assertEqual(self.get_values(models.PlanNutritionalValues, plan),
+                         models.sum_nutritional_values(
+                             models.MealItem.objects.filter(meal__plan=plan)))
+
+    def test_command(self):
+        '''
+        Test the command rebuilding and verifying the values
+        '''
+        plan = models.NutritionPlan.objects.get(pk=4)
+        plan.get_nutritional_values()
+        models.PlanNutritionalValues.objects.filter(plan=plan).update(energy=1)
+
+        self.assertRaises(CommandError,
+                          call_command,
+                          'rebuild-nutritional-values',
+                          verify=True,
+                          stdout=StringIO())
+
+        call_command('rebuild-nutritional-values', stdout=StringIO())
+        call_command('rebuild-nutritional-values', verify=True, stdout=StringIO())
+        self.assertEqual(models.MealNutritionalValues.objects.count(),
+                         models.Meal.objects.count() * 2)
@@ -17,7 +17,7 @@ from django.core.urlresolvers import reverse
 
 from wger.core.models import Language
 from wger.core.tests.base_testcase import WorkoutManagerTestCase
-from wger.nutrition.models import NutritionPlan
+from wger.nutrition.models import MealItem, NutritionPlan
 from wger.utils.helpers import make_token
 
 
@@ -116,3 +116,22 @@ class NutritionalPlanPdfExportTestCase(WorkoutManagerTestCase):
         self.user_login('admin')
         self.export_pdf(fail=True)
         self.export_pdf_token()
+
+    def test_export_pdf_cache(self):
+        '''
+        Tests that changes to the plan change the key of its cached PDFs
+        '''
+
+        self.user_login('test')
+        url = reverse('nutrition:plan:export-pdf', kwargs={'id': 4})
+        etag = self.client.get(url)['ETag']
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        item = MealItem.objects.filter(meal__plan_id=4).first()
+        item.amount += 1
+        item.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
@@ -13,13 +13,19 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with Workout Manager.  If not, see <http://www.gnu.org/licenses/>.
 
+import datetime
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
 from django.core.urlresolvers import reverse
 
 from wger.core.tests import api_base_test
 from wger.core.tests.base_testcase import WorkoutManagerDeleteTestCase
 from wger.core.tests.base_testcase import WorkoutManagerEditTestCase
 from wger.core.tests.base_testcase import WorkoutManagerTestCase
-from wger.nutrition.models import NutritionPlan
+from wger.nutrition.models import Meal, NutritionPlan
+from wger.utils.cache import cache_mapper
+from wger.weight.models import WeightEntry
 
 
 class PlanRepresentationTestCase(WorkoutManagerTestCase):
@@ -159,6 +165,150 @@ class PlanDailyCaloriesTestCase(WorkoutManagerTestCase):
         self.assertContains(response, 'goal amount of calories')
 
 
+class PlanSummaryCacheTestCase(WorkoutManagerTestCase):
+    '''
+    Tests the cached summaries of the nutrition plans
+    '''
+
+    def get_cached_ids(self, user):
+        '''
+        Helper returning the IDs of the cached summaries
+        '''
+        summary_cache = cache.get(cache_mapper.get_nutrition_plan_summary(user))
+        return list(summary_cache['summaries'].keys())
+
+    def test_per_user(self):
+        '''
+        Test that every user gets only their own plans
+        '''
+        user1 = User.objects.get(pk=1)
+        user2 = User.objects.get(pk=2)
+
+        self.assertEqual(sorted(s['plan'].pk for s in NutritionPlan.get_nutritional_plans(user1)),
+                         [2, 3, 5])
+        self.assertEqual(sorted(s['plan'].pk for s in NutritionPlan.get_nutritional_plans(user2)),
+                         [1, 4])
+
+    def test_overview(self):
+        '''
+        Test that the overview uses the cached summaries
+        '''
+        self.user_login('test')
+        response = self.client.get(reverse('nutrition:plan:overview'))
+        self.assertEqual([s['plan'].pk for s in response.context['plans']], [4, 1])
+        self.assertEqual(sorted(self.get_cached_ids(User.objects.get(pk=2))), [1, 4])
+
+        with self.assertNumQueries(0):
+            NutritionPlan.get_nutritional_plans(2)
+
+    def test_invalidation(self):
+        '''
+        Test that changes to plans and meals reset the affected summaries
+        '''
+        user = User.objects.get(pk=1)
+        NutritionPlan.get_nutritional_plans(user)
+        self.assertEqual(sorted(self.get_cached_ids(user)), [2, 3, 5])
+
+        meal = Meal.objects.filter(plan_id=2).first()
+        meal.save()
+        self.assertEqual(sorted(self.get_cached_ids(user)), [3, 5])
+
+        plan = NutritionPlan(user=user, language_id=1)
+        plan.save()
+        summaries = NutritionPlan.get_nutritional_plans(user)
+        self.assertIn(plan.pk, [s['plan'].pk for s in summaries])
+
+        plan.delete()
+        summaries = NutritionPlan.get_nutritional_plans(user)
+        self.assertNotIn(plan.pk, [s['plan'].pk for s in summaries])
+
+        user.userprofile.calories = 1500
+        user.userprofile.save()
+        self.assertFalse(cache.get(cache_mapper.get_nutrition_plan_summary(user)))
+
+    def test_size(self):
+        '''
+        Test that only a limited number of plans are listed and cached
+        '''
+        user = User.objects.get(pk=1)
+        size = NutritionPlan.SUMMARY_CACHE_SIZE
+        NutritionPlan.SUMMARY_CACHE_SIZE = 2
+        try:
+            summaries = NutritionPlan.get_nutritional_plans(user)
+            self.assertEqual(len(summaries), 2)
+            self.assertEqual(sorted(self.get_cached_ids(user)),
+                             sorted(s['plan'].pk for s in summaries))
+
+            with self.assertNumQueries(0):
+                NutritionPlan.get_nutritional_plans(user)
+        finally:
+            NutritionPlan.SUMMARY_CACHE_SIZE = size
+
+
+class PlanClosestWeightEntryTestCase(WorkoutManagerTestCase):
+    '''
+    Tests finding the closest weight entry for nutrition plans
+    '''
+
+    def get_expected(self, plan):
+        '''
+        Helper returning the closest entry by comparing with all entries
+        '''
+        entries = WeightEntry.objects.filter(user=plan.user).order_by('date')
+        if not entries.exists():
+            return None
+
+        # On ties, the earlier entry is used
+        return min(entries, key=lambda entry: (abs(entry.date - plan.creation_date),
+                                               entry.date > plan.creation_date))
+
+    def test_closest_weight_entries(self):
+        '''
+        Test that the batched lookup finds the same entries
+        '''
+        user = User.objects.get(pk=1)
+        plans = list(NutritionPlan.objects.filter(user=user))
+        for plan, date in zip(plans, (datetime.date(2012, 10, 1),
+                                      datetime.date(2000, 1, 1),
+                                      datetime.date(2030, 1, 1))):
+            plan.creation_date = date
+
+        with self.assertNumQueries(1):
+            result = NutritionPlan.get_closest_weight_entries(user, plans)
+
+        for plan in plans:
+            self.assertEqual(result[plan.pk], self.get_expected(plan))
+            with self.assertNumQueries(0):
+                self.assertEqual(plan.get_closest_weight_entry(), result[plan.pk])
+
+    def test_closest_weight_entry_tie(self):
+        '''
+        Test that the earlier entry is used if two are equally close
+        '''
+        user = User.objects.get(pk=1)
+        WeightEntry.objects.filter(user=user).delete()
+        WeightEntry.objects.create(user=user, date=datetime.date(2015, 1, 1), weight=80)
+        WeightEntry.objects.create(user=user, date=datetime.date(2015, 1, 5), weight=81)
+
+        plan = NutritionPlan.objects.filter(user=user).first()
+        plan.creation_date = datetime.date(2015, 1, 3)
+        self.assertEqual(plan.get_closest_weight_entry().weight, 80)
+
+        plan = NutritionPlan.objects.filter(user=user).first()
+        plan.creation_date = datetime.date(2015, 1, 5)
+        self.assertEqual(plan.get_closest_weight_entry().weight, 81)
+
+    def test_no_entries(self):
+        '''
+        Test plans of users without weight entries
+        '''
+        user = User.objects.get(pk=1)
+        WeightEntry.objects.filter(user=user).delete()
+        plans = NutritionPlan.objects.filter(user=user)
+        self.assertEqual(set(NutritionPlan.get_closest_weight_entries(user, plans).values()),
+                         {None})
+
+
 class PlanApiTestCase(api_base_test.ApiBaseResourceTestCase):
     '''
     Tests the nutritional plan overview resource
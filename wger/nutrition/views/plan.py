@@ -20,13 +20,14 @@ import datetime
 
 from django.shortcuts import render, get_object_or_404
 from django.http import (
-    HttpResponse,
     HttpResponseForbidden,
     HttpResponseRedirect
 )
 from django.template.context_processors import csrf
 from django.core.urlresolvers import reverse, reverse_lazy
 from django.contrib.auth.decorators import login_required
+from django.utils import translation
+from django.utils.six import BytesIO
 from django.utils.translation import ugettext_lazy, ugettext as _
 from django.views.generic import DeleteView, UpdateView
 
@@ -45,9 +46,10 @@ from wger.nutrition.models import (
     MEALITEM_WEIGHT_UNIT
 )
 from wger import get_version
+from wger.utils.cache import get_nutrition_plan_version, get_pdf_cache_key
 from wger.utils.generic_views import WgerFormMixin, WgerDeleteMixin
 from wger.utils.helpers import check_token, make_token
-from wger.utils.pdf import styleSheet
+from wger.utils.pdf import get_pdf_response, styleSheet
 from wger.utils.language import load_language
 
 
@@ -175,40 +177,18 @@ def copy(request, pk):
 
     plan = get_object_or_404(NutritionPlan, pk=pk, user=request.user)
 
-    # Copy plan
-    meals = plan.meal_set.all()
-
-    plan_copy = plan
-    plan_copy.pk = None
-    plan_copy.save()
-
-    # Copy the meals
-    for meal in meals:
-        meal_items = meal.mealitem_set.all()
-
-        meal_copy = meal
-        meal_copy.pk = None
-        meal_copy.plan = plan_copy
-        meal_copy.save()
-
-        # Copy the individual meal entries
-        for item in meal_items:
-            item_copy = item
-            item_copy.pk = None
-            item_copy.meal = meal_copy
-            item.save()
+    plan_copy = plan.copy([request.user])[0]
 
     # Redirect
-    return HttpResponseRedirect(reverse('nutrition:plan:view', kwargs={'id': plan.id}))
+    return HttpResponseRedirect(reverse('nutrition:plan:view', kwargs={'id': plan_copy.id}))
 
 
 def export_pdf(request, id, uidb64=None, token=None):
     '''
     Generates a PDF with the contents of a nutrition plan
 
-    See also
-    * http://www.blog.pythonlibrary.org/2010/09/21/reportlab
-    * http://www.reportlab.com/apis/reportlab/dev/platypus.html
+    The rendered PDFs are cached, their key depends on the version of the
+    plan's contents, the language and the units.
     '''
 
     # Load the plan
@@ -222,13 +202,38 @@ def export_pdf(request, id, uidb64=None, token=None):
             return HttpResponseForbidden()
         plan = get_object_or_404(NutritionPlan, pk=id, user=request.user)
 
+    url = request.build_absolute_uri(reverse('nutrition:plan:view', kwargs={'id': plan.id}))
+    cache_key = get_pdf_cache_key('nutrition-plan',
+                                  plan.pk,
+                                  get_nutrition_plan_version(plan.pk),
+                                  translation.get_language(),
+                                  plan.user.userprofile.use_metric,
+                                  request.user.username,
+                                  url,
+                                  datetime.date.today(),
+                                  get_version())
+    return get_pdf_response(request,
+                            cache_key,
+                            'nutritional-plan.pdf',
+                            lambda: render_plan_pdf(request, plan))
+
+
+def render_plan_pdf(request, plan):
+    '''
+    Renders a PDF with the contents of a nutrition plan
+
+    See also
+    * http://www.blog.pythonlibrary.org/2010/09/21/reportlab
+    * http://www.reportlab.com/apis/reportlab/dev/platypus.html
+
+    :return: the content of the PDF
+    '''
     plan_data = plan.get_nutritional_values()
 
-    # Create the HttpResponse object with the appropriate PDF headers.
-    response = HttpResponse(content_type='application/pdf')
+    buffer = BytesIO()
 
-    # Create the PDF object, using the response object as its "file."
-    doc = SimpleDocTemplate(response,
+    # Create the PDF object, using the buffer as its "file."
+    doc = SimpleDocTemplate(buffer,
                             pagesize=A4,
                             title=_('Nutrition plan'),
                             author='wger Workout Manager',
@@ -385,7 +390,4 @@ def export_pdf(request, id, uidb64=None, token=None):
                   styleSheet["Normal"])
     elements.append(p)
     doc.build(elements)
-
-    response['Content-Disposition'] = 'attachment; filename=nutritional-plan.pdf'
-    response['Content-Length'] = len(response.content)
-    return response
+    return buffer.getvalue()
@@ -57,3 +57,11 @@ WGER_SETTINGS['EMAIL_FROM'] = 'wger Workout Manager <wger@example.com>'
 
 # Your twitter handle, if you have one for this instance.
 #WGER_SETTINGS['TWITTER'] = ''
+
+# Number of worker processes that generate the thumbnails of exercise images,
+# set to 0 to generate them synchronously
+#WGER_SETTINGS['THUMBNAIL_PROCESSES'] = 2
+
+# Number of worker processes that render the workouts when exporting them for
+# all members of a gym, set to 0 to render them synchronously
+#WGER_SETTINGS['PDF_EXPORT_PROCESSES'] = 2
@@ -392,5 +392,10 @@ WGER_SETTINGS = {
     'EMAIL_FROM': 'wger Workout Manager <wger@example.com>',
     'TWITTER': False,
     'FITBIT_CLIENT_ID': True,
-    'FITBIT_CLIENT_SECRET': True
+    'FITBIT_CLIENT_SECRET': True,
+    'THUMBNAIL_PROCESSES': 2,
+    'PDF_CACHE_SIZE': 50 * 1024 * 1024,
+    'PDF_EXPORT_PROCESSES': 2,
+    'INVALIDATE_CACHE_ON_COMMIT': True,
+    'GUEST_USER_POOL_SIZE': 20
 }
@@ -12,15 +12,136 @@
 #
 # You should have received a copy of the GNU Affero General Public License
 
+import time
 import logging
 import hashlib
 
+from django.conf import settings
 from django.core.cache import cache
+from django.utils import six
 from django.utils.encoding import force_bytes
 
+from wger.utils.helpers import get_commit_hook
+
 
 logger = logging.getLogger(__name__)
 
+PDF_CACHE_LOCK_ATTEMPTS = 50
+'''
+Number of times to try to lock the index of the cached PDFs, every 20 ms
+'''
+
+PDF_CACHE_LOCK_TIMEOUT = 10
+'''
+Timeout of the lock of the index, in case a process dies while holding it
+'''
+
+
+class CacheInvalidation(object):
+    '''
+    Collects the cache entries to invalidate during a transaction and does so
+    at once when it is committed
+
+    Saving e.g. a workout day with its sets resets the same entries many times,
+    here every key is only deleted (or version incremented) once. Since this
+    only happens after the commit, a rolled back transaction leaves the cache
+    untouched and other processes can't cache the old data again before the
+    new one is visible to them.
+    '''
+
+    def __init__(self):
+        self.keys = set()
+        self.versions = set()
+
+        # Summaries of single nutrition plans, by user: (plan IDs, reset list)
+        self.plan_summaries = {}
+
+    def __call__(self):
+        if self.keys:
+            cache.delete_many(list(self.keys))
+        for key in self.versions:
+            try:
+                cache.incr(key)
+            except ValueError:
+                # No version yet, so nothing depends on it
+                pass
+        for user_pk, (plan_pks, reset_list) in self.plan_summaries.items():
+            cache_key = cache_mapper.get_nutrition_plan_summary(user_pk)
+            summary_cache = cache.get(cache_key)
+            if summary_cache is None:
+                continue
+
+            for plan_pk in plan_pks:
+                summary_cache['summaries'].pop(plan_pk, None)
+            if reset_list:
+                summary_cache['plan_ids'] = None
+            cache.set(cache_key, summary_cache)
+
+    def add_plan_summary(self, user_pk, plan_pk, reset_list=False):
+        '''
+        Adds the summary of a single nutrition plan to invalidate
+        '''
+        plan_pks, list_reset = self.plan_summaries.get(user_pk, (set(), False))
+        plan_pks.add(plan_pk)
+        self.plan_summaries[user_pk] = (plan_pks, list_reset or reset_list)
+
+
+def get_cache_invalidation():
+    '''
+    Returns the invalidation collected for the current transaction, None if
+    the entries need to be invalidated right away
+
+    This is the case outside of a transaction or if the INVALIDATE_CACHE_ON_COMMIT
+    setting is off, e.g. in the test cases that are never committed.
+    '''
+    if not settings.WGER_SETTINGS['INVALIDATE_CACHE_ON_COMMIT']:
+        return None
+    return get_commit_hook(CacheInvalidation)
+
+
+def delete_on_commit(*keys):
+    '''
+    Deletes the given cache keys when the current transaction is committed,
+    or right away if there is none, see CacheInvalidation
+    '''
+    invalidation = get_cache_invalidation()
+    if invalidation is None:
+        invalidation = CacheInvalidation()
+        invalidation.keys.update(keys)
+        invalidation()
+    else:
+        invalidation.keys.update(keys)
+
+
+def increment_on_commit(*keys):
+    '''
+    Increments the given versions when the current transaction is committed,
+    or right away if there is none, see CacheInvalidation
+    '''
+    invalidation = get_cache_invalidation()
+    if invalidation is None:
+        invalidation = CacheInvalidation()
+        invalidation.versions.update(keys)
+        invalidation()
+    else:
+        invalidation.versions.update(keys)
+
+
+def get_version(key):
+    '''
+    Returns the version counter stored under a cache key
+
+    Things that depend on the version are invalidated at once by incrementing
+    it, see increment_on_commit. New versions start with the current timestamp,
+    so that a version that was evicted from the cache does not start again
+    with the numbers of existing entries.
+    '''
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, int(time.time() * 1000), None)
+        version = cache.get(key)
+    return version
+
 
 def get_template_cache_name(fragment_name='', *args):
     '''
@@ -36,23 +157,258 @@ def delete_template_fragment_cache(fragment_name='', *args):
     '''
     Deletes a cache key created on the template with django's cache tag
     '''
-    cache.delete(get_template_cache_name(fragment_name, *args))
+    delete_on_commit(get_template_cache_name(fragment_name, *args))
+
+
+def get_template_namespace_version(fragment_name):
+    '''
+    Returns the current version of the namespace of a template fragment
+
+    The version is used as the last vary-on argument of django's cache tag, so
+    that the fragment can be invalidated for all its other arguments (e.g. all
+    languages) at once by incrementing it, see reset_template_namespace.
+    '''
+    return get_version(cache_mapper.get_template_namespace_key(fragment_name))
+
+
+def reset_template_namespace(*fragment_names):
+    '''
+    Invalidates all cached versions of the given template fragments
+    '''
+    increment_on_commit(*[cache_mapper.get_template_namespace_key(fragment_name)
+                          for fragment_name in fragment_names])
+
+
+def get_versioned_template_cache_name(fragment_name='', *args):
+    '''
+    Logic to calculate the cache key name of a template fragment that uses the
+    version of its namespace as the last vary-on argument
+    '''
+    args = args + (get_template_namespace_version(fragment_name), )
+    return get_template_cache_name(fragment_name, *args)
+
+
+class TemplateNamespaceVersions(object):
+    '''
+    Lazy lookup of the versions of the template fragment namespaces
+
+    Since dashes are not allowed in template variables, they are written as
+    underscores, e.g.:
+    {% cache cache_timeout muscle-overview language.id cache_versions.muscle_overview %}
+    '''
+
+    def __getitem__(self, fragment_name):
+        return get_template_namespace_version(fragment_name.replace('_', '-'))
+
+
+def get_ingredient_index_version(language_id):
+    '''
+    Returns the current version of the ingredient search index of a language
+
+    The indexes are kept in the memory of each process, the version in the
+    shared cache tells them when to rebuild it, see reset_ingredient_index.
+    '''
+    return get_version(cache_mapper.get_ingredient_index_key(language_id))
+
+
+def reset_ingredient_index(language_id):
+    '''
+    Invalidates the ingredient search indexes of a language in all processes
+    '''
+    increment_on_commit(cache_mapper.get_ingredient_index_key(language_id))
 
 
 def reset_workout_canonical_form(workout_id):
-    cache.delete(cache_mapper.get_workout_canonical(workout_id))
+    '''
+    Resets the cached canonical form index of a workout
+
+    The days are cached separately, see reset_day_canonical_form
+    '''
+    delete_on_commit(cache_mapper.get_workout_canonical(workout_id))
 
 
-def reset_workout_log(user_pk, year, month, day=None):
+def reset_day_canonical_form(day_id):
     '''
-    Resets the cached workout logs
+    Resets the cached canonical form of a single workout day
     '''
+    delete_on_commit(cache_mapper.get_day_canonical(day_id))
 
-    log_hash = hash((user_pk, year, month))
-    cache.delete(cache_mapper.get_workout_log_list(log_hash))
 
-    log_hash = hash((user_pk, year, month, day))
-    cache.delete(cache_mapper.get_workout_log_list(log_hash))
+def reset_exercise_day_index(exercise_ids):
+    '''
+    Resets the cached index of the workout days that use the given exercises
+    '''
+    delete_on_commit(*[cache_mapper.get_exercise_days_key(pk) for pk in exercise_ids])
+
+
+def reset_workout_log(user_pk, year, month):
+    '''
+    Resets the cached workout logs of a month
+    '''
+    delete_on_commit(cache_mapper.get_workout_log_list(user_pk, year, month))
+
+
+def reset_nutrition_plan_summary(user_pk, plan_pk=None, reset_list=False):
+    '''
+    Resets the cached summary of a nutrition plan
+
+    :param user_pk: the ID of the plan's owner
+    :param plan_pk: the ID of the plan, if None all summaries are reset
+    :param reset_list: also reset the list of the user's plans, needed
+                       when plans are added or deleted
+    '''
+    cache_key = cache_mapper.get_nutrition_plan_summary(user_pk)
+    if plan_pk is None:
+        delete_on_commit(cache_key)
+        return
+
+    invalidation = get_cache_invalidation()
+    if invalidation is None:
+        invalidation = CacheInvalidation()
+        invalidation.add_plan_summary(user_pk, plan_pk, reset_list)
+        invalidation()
+    else:
+        invalidation.add_plan_summary(user_pk, plan_pk, reset_list)
+
+
+def get_nutrition_plan_version(plan_pk):
+    '''
+    Returns the current version of the contents of a nutrition plan
+
+    The version is part of e.g. the keys of the plan's rendered PDFs, changes
+    to the plan, its meals or their ingredients increment it, see
+    reset_nutrition_plan_version.
+    '''
+    return get_version(cache_mapper.get_nutrition_plan_version(plan_pk))
+
+
+def reset_nutrition_plan_version(plan_pk):
+    '''
+    Increments the version of the contents of a nutrition plan
+    '''
+    increment_on_commit(cache_mapper.get_nutrition_plan_version(plan_pk))
+
+
+def get_user_profile_version(user_pk):
+    '''
+    Returns the current version of a user's profile
+
+    The version is part of the keys of things rendered with the settings of
+    the user, so they don't need to be loaded just to build the key, see
+    reset_user_profile_version.
+    '''
+    return get_version(cache_mapper.get_user_profile_version(user_pk))
+
+
+def reset_user_profile_version(user_pk):
+    '''
+    Increments the version of a user's profile
+    '''
+    increment_on_commit(cache_mapper.get_user_profile_version(user_pk))
+
+
+def reset_schedule_steps(schedule_pk):
+    '''
+    Resets the cached steps of a schedule
+    '''
+    delete_on_commit(cache_mapper.get_schedule_steps(schedule_pk))
+
+
+def get_digest_key(prefix, *args):
+    '''
+    Returns a cache key that is a digest of all the given arguments
+
+    This is used for things that depend on many values, such as the version
+    of the rendered object, the flags and the language. Changes to any of them
+    simply result in a new key.
+
+    :param prefix: the format string of the key, e.g. CacheKeyMapper.PDF_CACHE_KEY
+    '''
+    key = u':'.join([six.text_type(arg) for arg in args])
+    return prefix.format(hashlib.sha1(force_bytes(key)).hexdigest())
+
+
+def get_ical_cache_key(*args):
+    '''
+    Returns the key of a serialized iCal feed, see get_digest_key
+    '''
+    return get_digest_key(cache_mapper.ICAL_CACHE_KEY, *args)
+
+
+def get_pdf_cache_key(*args):
+    '''
+    Returns the key of a rendered PDF, see get_digest_key
+
+    The old PDFs are evicted by set_cached_pdf.
+    '''
+    return get_digest_key(cache_mapper.PDF_CACHE_KEY, *args)
+
+
+def get_cached_pdf(key):
+    '''
+    Returns a rendered PDF from the cache
+
+    Only the time of the use is saved next to the entry, the shared index is
+    not changed, see set_cached_pdf.
+
+    :return: a dictionary with the content of the PDF and the timestamp of
+             when it was rendered, or None
+    '''
+    entry = cache.get(key)
+    if entry is not None:
+        cache.set(cache_mapper.get_pdf_used_key(key), time.time())
+    return entry
+
+
+def set_cached_pdf(key, content):
+    '''
+    Saves a rendered PDF to the cache
+
+    The sizes of the cached PDFs are kept in an index, when they are larger
+    than the PDF_CACHE_SIZE setting together, the ones that were not used for
+    the longest time are removed. Since all processes share the index, it is
+    only changed while holding a lock. Like all other entries, the PDFs expire
+    with the timeout of the cache, so that if the lock can't be acquired in
+    time they are not kept forever.
+
+    :return: the cache entry, see get_cached_pdf
+    '''
+    now = time.time()
+    entry = {'content': content,
+             'last_modified': int(now)}
+    cache.set(key, entry)
+    cache.set(cache_mapper.get_pdf_used_key(key), now)
+
+    for attempt in range(PDF_CACHE_LOCK_ATTEMPTS):
+        if cache.add(cache_mapper.PDF_CACHE_LOCK, True, PDF_CACHE_LOCK_TIMEOUT):
+            break
+        time.sleep(0.02)
+    else:
+        logger.warning('Could not lock the PDF cache index to add {0}'.format(key))
+        return entry
+
+    try:
+        index = cache.get(cache_mapper.PDF_CACHE_INDEX) or {}
+        index[key] = len(content)
+
+        total_size = sum(index.values())
+        evicted = []
+        if total_size > settings.WGER_SETTINGS['PDF_CACHE_SIZE']:
+            used = cache.get_many([cache_mapper.get_pdf_used_key(pdf_key) for pdf_key in index])
+            for pdf_key in sorted(index,
+                                  key=lambda k: used.get(cache_mapper.get_pdf_used_key(k), 0)):
+                if total_size <= settings.WGER_SETTINGS['PDF_CACHE_SIZE']:
+                    break
+                if pdf_key != key:
+                    evicted.append(pdf_key)
+                    total_size -= index.pop(pdf_key)
+
+        cache.delete_many(evicted + [cache_mapper.get_pdf_used_key(pdf_key)
+                                     for pdf_key in evicted])
+        cache.set(cache_mapper.PDF_CACHE_INDEX, index, None)
+    finally:
+        cache.delete(cache_mapper.PDF_CACHE_LOCK)
+    return entry
 
 
 class CacheKeyMapper(object):
@@ -62,12 +418,29 @@ class CacheKeyMapper(object):
 
     # Keys used by the cache
     LANGUAGE_CACHE_KEY = 'language-{0}'
+    TEMPLATE_NAMESPACE_KEY = 'template-namespace-version-{0}'
     LANGUAGE_CONFIG_CACHE_KEY = 'language-config-{0}-{1}'
     EXERCISE_CACHE_KEY_MUSCLE_BG = 'exercise-muscle-bg-{0}'
+    EXERCISE_CACHE_KEY_DAYS = 'exercise-days-{0}'
     INGREDIENT_CACHE_KEY = 'ingredient-{0}'
+    INGREDIENT_INDEX_KEY = 'ingredient-index-version-{0}'
+    EXERCISE_SEARCH_INDEX = 'exercise-search-index-{0}'
+    EXERCISE_THUMBNAILS_PENDING = 'exercise-thumbnails-pending-{0}'
+    EXERCISE_IMAGE_ETAG = 'exercise-image-etag-{0}'
     WORKOUT_CANONICAL_REPRESENTATION = 'workout-canonical-representation-{0}'
-    WORKOUT_LOG_LIST = 'workout-log-hash-{0}'
+    DAY_CANONICAL_REPRESENTATION = 'day-canonical-representation-{0}'
+    WORKOUT_LOG_LIST = 'workout-log-list-{0}-{1}-{2}'
     NUTRITION_CACHE_KEY = 'nutrition-{0}'
+    NUTRITION_PLAN_SUMMARY = 'nutrition-plan-summary-{0}'
+    NUTRITION_PLAN_VERSION = 'nutrition-plan-version-{0}'
+    PDF_CACHE_KEY = 'pdf-{0}'
+    PDF_CACHE_INDEX = 'pdf-index'
+    PDF_CACHE_LOCK = 'pdf-index-lock'
+    PDF_CACHE_USED = 'pdf-used-{0}'
+    GYM_WORKOUT_EXPORT = 'gym-workout-export-{0}'
+    USER_PROFILE_VERSION = 'user-profile-version-{0}'
+    SCHEDULE_STEPS = 'schedule-steps-{0}'
+    ICAL_CACHE_KEY = 'ical-{0}'
 
     def get_pk(self, param):
         '''
@@ -80,12 +453,24 @@ class CacheKeyMapper(object):
 
         return pk
 
+    def get_template_namespace_key(self, fragment_name):
+        '''
+        Return the key for the version of a template fragment namespace
+        '''
+        return self.TEMPLATE_NAMESPACE_KEY.format(fragment_name)
+
     def get_exercise_muscle_bg_key(self, param):
         '''
         Return the exercise muscle background cache key
         '''
         return self.EXERCISE_CACHE_KEY_MUSCLE_BG.format(self.get_pk(param))
 
+    def get_exercise_days_key(self, param):
+        '''
+        Return the key for the index of workout days using an exercise
+        '''
+        return self.EXERCISE_CACHE_KEY_DAYS.format(self.get_pk(param))
+
     def get_language_key(self, param):
         '''
         Return the language cache key
@@ -104,21 +489,87 @@ class CacheKeyMapper(object):
         '''
         return self.INGREDIENT_CACHE_KEY.format(self.get_pk(param))
 
+    def get_exercise_search_index_key(self, param):
+        '''
+        Return the key for the exercise search index of a language
+        '''
+        return self.EXERCISE_SEARCH_INDEX.format(self.get_pk(param))
+
+    def get_exercise_thumbnails_pending_key(self, param):
+        '''
+        Return the key for the flag of an image whose thumbnails are being generated
+        '''
+        return self.EXERCISE_THUMBNAILS_PENDING.format(self.get_pk(param))
+
+    def get_exercise_image_etag_key(self, param):
+        '''
+        Return the key for the ETag of a downloaded exercise image, by its UUID
+        '''
+        return self.EXERCISE_IMAGE_ETAG.format(param)
+
+    def get_ingredient_index_key(self, param):
+        '''
+        Return the key for the version of a language's ingredient search index
+        '''
+        return self.INGREDIENT_INDEX_KEY.format(self.get_pk(param))
+
     def get_workout_canonical(self, param):
         '''
         Return the workout canonical representation
         '''
         return self.WORKOUT_CANONICAL_REPRESENTATION.format(self.get_pk(param))
 
-    def get_workout_log_list(self, hash_value):
+    def get_day_canonical(self, param):
         '''
-        Return the workout canonical representation
+        Return the day canonical representation
         '''
-        return self.WORKOUT_LOG_LIST.format(hash_value)
+        return self.DAY_CANONICAL_REPRESENTATION.format(self.get_pk(param))
+
+    def get_workout_log_list(self, user, year, month):
+        '''
+        Return the key for the grouped workout logs of a user's month
+        '''
+        return self.WORKOUT_LOG_LIST.format(self.get_pk(user), year, month)
 
     def get_nutrition_item(self, param):
         '''Returns nutrional cahce key'''
         
         return self.NUTRITION_CACHE_KEY.format(self.get_pk(param))
 
+    def get_nutrition_plan_summary(self, param):
+        '''
+        Return the key for the summaries of a user's nutrition plans
+        '''
+        return self.NUTRITION_PLAN_SUMMARY.format(self.get_pk(param))
+
+    def get_nutrition_plan_version(self, param):
+        '''
+        Return the key for the version of the contents of a nutrition plan
+        '''
+        return self.NUTRITION_PLAN_VERSION.format(self.get_pk(param))
+
+    def get_pdf_used_key(self, param):
+        '''
+        Return the key for the time a cached PDF was last used, by its key
+        '''
+        return self.PDF_CACHE_USED.format(param)
+
+    def get_gym_workout_export_key(self, param):
+        '''
+        Return the key for the state of an export of a gym's workouts, by its job ID
+        '''
+        return self.GYM_WORKOUT_EXPORT.format(param)
+
+    def get_user_profile_version(self, param):
+        '''
+        Return the key for the version of a user's profile
+        '''
+        return self.USER_PROFILE_VERSION.format(self.get_pk(param))
+
+    def get_schedule_steps(self, param):
+        '''
+        Return the key for the steps of a schedule
+        '''
+        return self.SCHEDULE_STEPS.format(self.get_pk(param))
+
 cache_mapper = CacheKeyMapper()
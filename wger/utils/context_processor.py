@@ -18,6 +18,7 @@ from django.templatetags.static import static
 
 from wger import get_version
 from wger.utils import constants
+from wger.utils.cache import TemplateNamespaceVersions
 from wger.utils.language import load_language
 
 
@@ -64,6 +65,9 @@ def processor(request):
         # Default cache time for template fragment caching
         'cache_timeout': settings.CACHES['default']['TIMEOUT'],
 
+        # Versions of the namespaces for template fragment caching
+        'cache_versions': TemplateNamespaceVersions(),
+
         # Used for logged in trainers
         'trainer_identity': request.session.get('trainer.identity'),
     }
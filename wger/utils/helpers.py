@@ -14,19 +14,22 @@
 #
 # You should have received a copy of the GNU Affero General Public License
 
-import os
+import copy
 import random
 import string
 import logging
 import decimal
 import json
 import datetime
+import threading
+import time
 
 from functools import wraps
 
 from django.http import Http404
 from django.contrib.auth.models import User
 from django.contrib.auth.tokens import default_token_generator
+from django.db import connections, transaction
 from django.shortcuts import get_object_or_404
 from django.utils.encoding import force_bytes
 from django.utils.http import urlsafe_base64_decode, urlsafe_base64_encode
@@ -155,11 +158,11 @@ def password_generator(length=15):
     :return: the generated password
     '''
     chars = string.ascii_letters + string.digits
-    random.seed = (os.urandom(1024))
+    system_random = random.SystemRandom()
     for char in ('I', '1', 'l', 'O', '0', 'o'):
         chars = chars.replace(char, '')
 
-    return ''.join(random.choice(chars) for i in range(length))
+    return ''.join(system_random.choice(chars) for i in range(length))
 
 
 def check_access(request_user, username=None):
@@ -230,3 +233,157 @@ def smart_capitalize(input):
         else:
             out.append(word)
     return ' '.join(out)
+
+
+class RateLimiter(object):
+    '''
+    Spaces out requests, e.g. to a remote server, evenly over time
+
+    The limiter can be shared by several threads.
+
+    :param rate: maximum number of requests per second, 0 for no limit
+    '''
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0
+        self.next_request = 0
+        self.lock = threading.Lock()
+
+    def wait(self):
+        '''
+        Blocks until the next request may be sent
+        '''
+        if not self.interval:
+            return
+
+        with self.lock:
+            now = time.time()
+            delay = self.next_request - now
+            self.next_request = max(now, self.next_request) + self.interval
+        if delay > 0:
+            time.sleep(delay)
+
+
+def close_connections():
+    '''
+    Closes the database connections, new ones are opened when needed
+
+    Used before forking the worker processes and as their initializer, so
+    that they don't share a connection with their parent process.
+    '''
+    for connection in connections.all():
+        if not connection.in_atomic_block:
+            connection.close()
+
+
+def get_commit_hook(hook_class):
+    '''
+    Returns the hook of the given class that is run when the current
+    transaction is committed, a new one is registered if there is none yet
+
+    This allows to collect work, e.g. cache invalidations, and do it only
+    once per transaction. Each savepoint has its own hook, so that the work
+    is discarded if the savepoint is rolled back.
+
+    :param hook_class: a callable class, instantiated without arguments
+    :return: the hook, or None if there is no transaction
+    '''
+    connection = transaction.get_connection()
+    if not connection.in_atomic_block:
+        return None
+
+    savepoint_ids = set(connection.savepoint_ids)
+    for hook_savepoint_ids, hook in connection.run_on_commit:
+        if isinstance(hook, hook_class) and hook_savepoint_ids == savepoint_ids:
+            return hook
+
+    hook = hook_class()
+    transaction.on_commit(hook)
+    return hook
+
+
+def bulk_copy(objects, parent_field, parent_pks, related_pks=None, **values):
+    '''
+    Copies objects with one bulk insert, e.g. all sets of some workout days
+
+    Every object is copied once for each of the new parents of its current
+    one, so that a whole object graph can be copied level by level, also to
+    several owners at once.
+
+    The IDs of the copies are read back afterwards, ordered by ID since they
+    are assigned in the order in which the rows are inserted. For this, the
+    new parents must have been created for the copy, so that the copies are
+    their only children.
+
+    :param objects: the objects to copy, all of the same model
+    :param parent_field: the name of the foreign key to the parent
+    :param parent_pks: dictionary with the IDs of the new parents for the ID
+                       of each original one
+    :param related_pks: dictionary with other foreign keys that point to
+                        objects copied in the same way, e.g. the workout
+                        of a log, the n-th copy of an object refers to the
+                        n-th copy of the related one
+    :param values: other fields that are set on the copies
+    :return: dictionary with the IDs of the copies for the ID of each object,
+             in the order of the new parents
+    '''
+    # Copy in the order of the originals, so the copies are sorted the same way
+    objects = sorted(objects, key=lambda obj: obj.pk)
+    if not objects:
+        return {}
+
+    model = objects[0].__class__
+    attname = model._meta.get_field(parent_field).attname
+    related_pks = {model._meta.get_field(field_name).attname: pk_map
+                   for field_name, pk_map in (related_pks or {}).items()}
+
+    copies = []
+    original_pks = []
+    for obj in objects:
+        for i, parent_pk in enumerate(parent_pks[getattr(obj, attname)]):
+            obj_copy = copy.copy(obj)
+            obj_copy.pk = None
+            setattr(obj_copy, attname, parent_pk)
+            for related_attname, pk_map in related_pks.items():
+                related_pk = getattr(obj, related_attname)
+                if related_pk is not None:
+                    setattr(obj_copy, related_attname, pk_map[related_pk][i])
+            for key, value in values.items():
+                setattr(obj_copy, key, value)
+            copies.append(obj_copy)
+            original_pks.append(obj.pk)
+    model.objects.bulk_create(copies)
+
+    new_parent_pks = set(pk for pks in parent_pks.values() for pk in pks)
+    copy_pks = model.objects.filter(**{attname + '__in': new_parent_pks}) \
+        .order_by('pk') \
+        .values_list('pk', flat=True)
+
+    pk_map = {}
+    for pk, copy_pk in zip(original_pks, copy_pks):
+        pk_map.setdefault(pk, []).append(copy_pk)
+    return pk_map
+
+
+def bulk_copy_m2m(model, field_name, pk_map):
+    '''
+    Copies the many-to-many relations of objects copied with bulk_copy, with
+    one bulk insert
+
+    :param model: the model of the copied objects
+    :param field_name: the name of the many-to-many field
+    :param pk_map: dictionary with the IDs of the copies for the ID of each
+                   object, as returned by bulk_copy
+    '''
+    field = model._meta.get_field(field_name)
+    through = field.remote_field.through
+    attname = through._meta.get_field(field.m2m_field_name()).attname
+
+    copies = []
+    for row in through.objects.filter(**{attname + '__in': list(pk_map)}):
+        for copy_pk in pk_map[getattr(row, attname)]:
+            row_copy = copy.copy(row)
+            row_copy.pk = None
+            setattr(row_copy, attname, copy_pk)
+            copies.append(row_copy)
+    through.objects.bulk_create(copies)
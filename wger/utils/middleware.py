@@ -23,7 +23,7 @@ from django.contrib import auth
 from django.utils.functional import SimpleLazyObject
 from django.contrib.auth import login as django_login
 
-from wger.core.demo import create_temporary_user
+from wger.core.demo import claim_temporary_user, create_temporary_user
 
 
 logger = logging.getLogger(__name__)
@@ -66,8 +66,12 @@ def get_user(request):
                 request.method == 'GET' and \
                 create_user and not user.is_authenticated():
 
-            logger.debug('creating a new guest user now')
-            user = create_temporary_user()
+            user = claim_temporary_user()
+            if user is not None:
+                request.session['has_demo_data'] = True
+            else:
+                logger.debug('creating a new guest user now')
+                user = create_temporary_user()
             django_login(request, user)
 
         request._cached_user = user
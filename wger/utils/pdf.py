@@ -16,7 +16,9 @@ import datetime
 from os.path import join as path_join
 
 from django.conf import settings
+from django.http import HttpResponse, HttpResponseNotModified
 from django.utils import translation
+from django.utils.http import http_date, parse_etags, parse_http_date_safe
 from django.core.exceptions import ObjectDoesNotExist
 
 from reportlab.lib.styles import ParagraphStyle, StyleSheet1
@@ -26,6 +28,7 @@ from reportlab.platypus import Paragraph
 
 from wger import get_version
 from wger.core.models import Language
+from wger.utils.cache import get_cached_pdf, set_cached_pdf
 
 
 # ************************
@@ -98,6 +101,40 @@ def render_footer(url, date=None):
     return p
 
 
+def get_pdf_response(request, cache_key, filename, render):
+    '''
+    Returns a response with a PDF, which is only rendered if it is not cached
+
+    The ETag of the response is the cache key and the Last-Modified date the
+    time the PDF was rendered, so clients that already have it get a 304.
+
+    :param cache_key: the key of the PDF, see get_pdf_cache_key
+    :param filename: the filename of the download
+    :param render: callable that renders the PDF and returns its content
+    '''
+    etag = '"{0}"'.format(cache_key)
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match and (cache_key in parse_etags(if_none_match) or if_none_match == '*'):
+        response = HttpResponseNotModified()
+        response['ETag'] = etag
+        return response
+
+    entry = get_cached_pdf(cache_key)
+    if entry is None:
+        entry = set_cached_pdf(cache_key, render())
+
+    if_modified_since = parse_http_date_safe(request.META.get('HTTP_IF_MODIFIED_SINCE'))
+    if not if_none_match and if_modified_since and if_modified_since >= entry['last_modified']:
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(entry['content'], content_type='application/pdf')
+        response['Content-Disposition'] = 'attachment; filename={0}'.format(filename)
+        response['Content-Length'] = len(entry['content'])
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(entry['last_modified'])
+    return response
+
+
 # register new truetype fonts for reportlab
 pdfmetrics.registerFont(TTFont(
     'OpenSans', path_join(settings.SITE_ROOT, 'core/static/fonts/OpenSans-Light.ttf')))
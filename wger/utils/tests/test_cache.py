@@ -0,0 +1,112 @@
+# -*- coding: utf-8 *-*
+
+# This file is part of wger Workout Manager.
+#
+# wger Workout Manager is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# wger Workout Manager is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from wger.core.tests.base_testcase import (
+    WorkoutManagerTestCase,
+    get_commit_hooks,
+    run_commit_hooks
+)
+from wger.utils.cache import (
+    CacheInvalidation,
+    delete_on_commit,
+    increment_on_commit,
+    reset_nutrition_plan_summary
+)
+
+
+class CacheInvalidationTestCase(WorkoutManagerTestCase):
+    '''
+    Tests collecting the cache invalidations of a transaction
+    '''
+
+    def setUp(self):
+        super(CacheInvalidationTestCase, self).setUp()
+        settings.WGER_SETTINGS['INVALIDATE_CACHE_ON_COMMIT'] = True
+
+    def get_invalidations(self):
+        return get_commit_hooks(CacheInvalidation)
+
+    def test_invalidate_on_commit(self):
+        '''
+        Test that the entries are only invalidated on commit, once
+        '''
+        cache.set('key-1', 'foo')
+        cache.set('key-2', 'bar')
+        cache.set('version', 1)
+
+        delete_on_commit('key-1')
+        delete_on_commit('key-1', 'key-2')
+        increment_on_commit('version')
+        increment_on_commit('version')
+        self.assertEqual(len(self.get_invalidations()), 1)
+        self.assertEqual(cache.get('key-1'), 'foo')
+        self.assertEqual(cache.get('version'), 1)
+
+        run_commit_hooks(CacheInvalidation)
+        self.assertFalse(cache.get('key-1'))
+        self.assertFalse(cache.get('key-2'))
+        self.assertEqual(cache.get('version'), 2)
+
+    def test_invalidate_rollback(self):
+        '''
+        Test that a rolled back savepoint leaves the cache untouched
+        '''
+        cache.set('key-1', 'foo')
+        cache.set('key-2', 'bar')
+
+        delete_on_commit('key-1')
+        try:
+            with transaction.atomic():
+                delete_on_commit('key-2')
+                raise ValueError
+        except ValueError:
+            pass
+
+        run_commit_hooks(CacheInvalidation)
+        self.assertFalse(cache.get('key-1'))
+        self.assertEqual(cache.get('key-2'), 'bar')
+
+    def test_invalidate_plan_summary(self):
+        '''
+        Test that the summaries of single nutrition plans are reset on commit
+        '''
+        cache.set('nutrition-plan-summary-1', {'plan_ids': [1, 2, 3],
+                                               'summaries': {1: 'foo', 2: 'bar', 3: 'baz'}})
+
+        reset_nutrition_plan_summary(1, 1)
+        reset_nutrition_plan_summary(1, 2, reset_list=True)
+        self.assertEqual(len(self.get_invalidations()), 1)
+        self.assertEqual(len(cache.get('nutrition-plan-summary-1')['summaries']), 3)
+
+        run_commit_hooks(CacheInvalidation)
+        summary_cache = cache.get('nutrition-plan-summary-1')
+        self.assertEqual(summary_cache['summaries'], {3: 'baz'})
+        self.assertIsNone(summary_cache['plan_ids'])
+
+    def test_invalidate_setting(self):
+        '''
+        Test that the entries are invalidated right away if the setting is off
+        '''
+        settings.WGER_SETTINGS['INVALIDATE_CACHE_ON_COMMIT'] = False
+        cache.set('key-1', 'foo')
+
+        delete_on_commit('key-1')
+        self.assertFalse(cache.get('key-1'))
+        self.assertEqual(self.get_invalidations(), [])
@@ -22,9 +22,12 @@ import csv
 import json
 from collections import OrderedDict
 
+from django.conf import settings
 from django.core.cache import cache
+from django.db import transaction
 
-from wger.utils.helpers import DecimalJsonEncoder
+from wger.gym.helpers import update_user_last_activity
+from wger.utils.helpers import DecimalJsonEncoder, get_commit_hook
 from wger.utils.cache import cache_mapper
 from wger.weight.models import WeightEntry
 from wger.manager.models import WorkoutSession
@@ -89,6 +92,9 @@ def group_log_entries(user, year, month, day=None):
     Processes and regroups a list of log entries so they can be more easily
     used in the different calendar pages
 
+    The entries are cached per month, the views for single days simply use
+    the corresponding part of the month.
+
     :param user: the user to filter the logs for
     :param year: year
     :param month: month
@@ -96,57 +102,156 @@ def group_log_entries(user, year, month, day=None):
 
     :return: a dictionary with grouped logs by date and exercise
     '''
-    if day:
-        log_hash = hash((user.pk, year, month, day))
-    else:
-        log_hash = hash((user.pk, year, month))
+    cache_key = cache_mapper.get_workout_log_list(user, year, month)
+    out = cache.get(cache_key)
+
+    if out is None:
+        logs = WorkoutLog.objects.filter(user=user, date__year=year, date__month=month)
+        sessions = WorkoutSession.objects.filter(user=user, date__year=year, date__month=month)
+        out = _build_log_entries(logs, sessions)
+        cache.set(cache_key, out)
 
-    # There can be workout sessions without any associated log entries, so it is
-    # not enough so simply iterate through the logs
     if day:
         filter_date = datetime.date(year, month, day)
-        logs = WorkoutLog.objects.filter(user=user, date=filter_date)
-        sessions = WorkoutSession.objects.filter(user=user, date=filter_date)
+        return OrderedDict((date, entry) for date, entry in out.items() if date == filter_date)
+    return out
+
+
+class LogEntriesUpdate(object):
+    '''
+    Collects the days of the cached, grouped log entries that change during a
+    transaction and updates them at once when it is committed
+
+    Like this the entries are not cached with the data of a transaction that
+    is rolled back and all days of a month are only queried once.
+    '''
+
+    def __init__(self):
+        self.dates = {}
+
+    def add(self, user_pk, *dates):
+        '''
+        Add the changed dates of a user
+        '''
+        self.dates.setdefault(user_pk, set()).update(dates)
+
+    def __call__(self):
+        for user_pk, dates in self.dates.items():
+            months = {}
+            for date in dates:
+                months.setdefault((date.year, date.month), set()).add(date)
 
+            for (year, month), month_dates in months.items():
+                cache_key = cache_mapper.get_workout_log_list(user_pk, year, month)
+                out = cache.get(cache_key)
+                if out is None:
+                    continue
+
+                logs = WorkoutLog.objects.filter(user_id=user_pk, date__in=month_dates)
+                sessions = WorkoutSession.objects.filter(user_id=user_pk, date__in=month_dates)
+                for date in month_dates:
+                    out.pop(date, None)
+                out.update(_build_log_entries(logs, sessions))
+                cache.set(cache_key, OrderedDict(sorted(out.items())))
+
+
+def update_log_entries(user_pk, *dates):
+    '''
+    Updates the given days in the cached, grouped log entries of their months
+    when the current transaction is committed, or right away if there is none,
+    see LogEntriesUpdate
+
+    If a month is not cached, nothing is done, it will be completely
+    generated on the next access.
+
+    :param user_pk: the ID of the user the logs belong to
+    :param dates: the dates that changed
+    '''
+    update = None
+    if settings.WGER_SETTINGS['INVALIDATE_CACHE_ON_COMMIT']:
+        update = get_commit_hook(LogEntriesUpdate)
+    if update is None:
+        update = LogEntriesUpdate()
+        update.add(user_pk, *dates)
+        update()
     else:
-        logs = WorkoutLog.objects.filter(user=user,
-                                         date__year=year,
-                                         date__month=month)
-
-        sessions = WorkoutSession.objects.filter(user=user,
-                                                 date__year=year,
-                                                 date__month=month)
-
-    logs = logs.order_by('date', 'id')
-    out = cache.get(cache_mapper.get_workout_log_list(log_hash))
-    # out = OrderedDict()
-
-    if not out:
-        out = OrderedDict()
-
-        # Logs
-        for entry in logs:
-            if not out.get(entry.date):
-                out[entry.date] = {'date': entry.date,
-                                   'workout': entry.workout,
-                                   'session': entry.get_workout_session(),
-                                   'logs': OrderedDict()}
-
-            if not out[entry.date]['logs'].get(entry.exercise):
-                out[entry.date]['logs'][entry.exercise] = []
-
-            out[entry.date]['logs'][entry.exercise].append(entry)
-
-        # Sessions
-        for entry in sessions:
-            if not out.get(entry.date):
-                out[entry.date] = {'date': entry.date,
-                                   'workout': entry.workout,
-                                   'session': entry,
-                                   'logs': {}}
-
-        cache.set(cache_mapper.get_workout_log_list(log_hash), out)
-    return out
+        update.add(user_pk, *dates)
+
+
+def save_workout_logs(user, logs, session=None):
+    '''
+    Saves several workout logs of a user at once
+
+    The logs are inserted with a single query and the caches, i.e. the
+    grouped log entries and the user's last activity, are only updated once
+    for all of them.
+
+    :param user: the user the logs belong to
+    :param logs: a list of unsaved WorkoutLog objects, the user is set here
+    :param session: optional, a dictionary with the fields of the workout
+                    session, including date and workout. If the user already
+                    has a session on that date, its other fields are updated.
+    :return: the saved workout session or None
+    '''
+    with transaction.atomic():
+        for log in logs:
+            log.user = user
+        WorkoutLog.objects.bulk_create(logs)
+
+        dates = {log.date for log in logs}
+        if session:
+            session = dict(session)
+            date = session.pop('date')
+            workout = session.pop('workout')
+            instance = WorkoutSession.objects.filter(user=user, date=date).first()
+            if not instance:
+                instance = WorkoutSession(user=user, date=date, workout=workout)
+            for field, value in session.items():
+                setattr(instance, field, value)
+
+            # Saving the session updates its date in the caches
+            instance.save()
+            dates.discard(date)
+            session = instance
+
+        if dates:
+            update_log_entries(user.pk, *dates)
+            update_user_last_activity(user.pk, max(dates))
+    return session
+
+
+def _build_log_entries(logs, sessions):
+    '''
+    Groups the given logs and sessions by date and exercise
+
+    There can be workout sessions without any associated log entries, so it is
+    not enough so simply iterate through the logs
+    '''
+    out = {}
+    session_list = {session.date: session for session in sessions.select_related('workout')}
+
+    # Logs
+    for entry in logs.select_related('workout', 'exercise').order_by('date', 'id'):
+        if not out.get(entry.date):
+            out[entry.date] = {'date': entry.date,
+                               'workout': entry.workout,
+                               'session': session_list.get(entry.date),
+                               'logs': OrderedDict()}
+
+        if not out[entry.date]['logs'].get(entry.exercise):
+            out[entry.date]['logs'][entry.exercise] = []
+
+        out[entry.date]['logs'][entry.exercise].append(entry)
+
+    # Sessions
+    for date, session in session_list.items():
+        if not out.get(date):
+            out[date] = {'date': date,
+                         'workout': session.workout,
+                         'session': session,
+                         'logs': {}}
+
+    return OrderedDict(sorted(out.items()))
 
 
 def process_log_entries(logs):